@@ -0,0 +1,161 @@
+"""
+Alert aggregation for PDMS
+Malicious packets are grouped into incidents keyed by (src, dst, protocol,
+threat level). The first packet of an incident raises one alert; every
+later packet only updates that alert's incident record (packet and byte
+counts, first/last seen, packets in the last minute), so a flood of thousands of
+packets per second is fully counted but produces one alert and one round of
+response actions.
+
+An incident closes after INCIDENT_IDLE_SECONDS without packets, or once it
+has run for INCIDENT_MAX_SECONDS so a long attack is raised again. Each key
+has a token bucket that limits how often it may open new incidents; while
+it is empty, packets keep extending the key's last incident instead.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from rolling_stats import RollingCount
+
+INCIDENT_IDLE_SECONDS = 30
+INCIDENT_MAX_SECONDS = 300
+# New incidents per key: bursts of up to 3, then one per minute
+INCIDENT_BURST = 3
+INCIDENT_REFILL_PER_SECOND = 1 / 60
+MAX_TRACKED_KEYS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class Incident:
+    def __init__(self, alert, now):
+        self.alert = alert
+        self.started = now
+        # Start of the current stretch, for INCIDENT_MAX_SECONDS
+        self.renewed = now
+        self.last_seen = now
+        self.rate = RollingCount()
+        self.record = {
+            'key': None,
+            'status': 'open',
+            'packet_count': 0,
+            'bytes': 0,
+            'first_seen': datetime.fromtimestamp(now).isoformat(),
+            'last_seen': None,
+            'duration_seconds': 0.0,
+            'packets_last_minute': 0,
+            'suppressed_incidents': 0,
+        }
+        alert['incident'] = self.record
+
+    def add(self, threat_data, now):
+        self.last_seen = now
+        self.rate.add(now)
+        record = self.record
+        record['packet_count'] += 1
+        try:
+            record['bytes'] += int(threat_data.get('length') or 0)
+        except (TypeError, ValueError):
+            pass
+        record['last_seen'] = datetime.fromtimestamp(now).isoformat()
+        record['duration_seconds'] = round(now - self.started, 3)
+        record['packets_last_minute'] = self.rate.total(now)
+
+    def close(self):
+        self.record['status'] = 'closed'
+
+
+class AlertAggregator:
+    def __init__(self, idle=INCIDENT_IDLE_SECONDS, max_duration=INCIDENT_MAX_SECONDS, burst=INCIDENT_BURST,
+                 refill=INCIDENT_REFILL_PER_SECOND, max_keys=MAX_TRACKED_KEYS):
+        self.idle = idle
+        self.max_duration = max_duration
+        self.burst = burst
+        self.refill = refill
+        self.max_keys = max_keys
+        # key -> [token bucket, latest incident]; least recently seen first
+        self.keys = OrderedDict()
+        # Open incidents, least recently active first
+        self.open = OrderedDict()
+        self.packets = 0
+        self.incidents = 0
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def observe(self, threat_data, level, make_alert, now=None):
+        """Count one malicious packet; returns the new alert if it opened an incident, else None
+
+        ``make_alert(threat_data, level)`` builds the alert for a new incident.
+        """
+        now = time.time() if now is None else now
+        key = (threat_data.get('src', ''), threat_data.get('dst', ''), threat_data.get('protocol', ''), level)
+        with self._lock:
+            self.packets += 1
+            self._close_idle(now)
+            state = self.keys.get(key)
+            if state is None:
+                state = self.keys[key] = [TokenBucket(self.refill, self.burst, now), None]
+                while len(self.keys) > self.max_keys:
+                    _, (_, old) = self.keys.popitem(last=False)
+                    if old is not None and self.open.pop(id(old), None) is not None:
+                        old.close()
+            else:
+                self.keys.move_to_end(key)
+            bucket, incident = state
+            new_alert = None
+            if incident is not None and now - incident.renewed > self.max_duration:
+                incident.close()
+                self.open.pop(id(incident), None)
+            if incident is None or incident.record['status'] == 'closed':
+                if bucket.take(now) or incident is None:
+                    new_alert = make_alert(threat_data, level)
+                    incident = state[1] = Incident(new_alert, now)
+                    incident.record['key'] = {'src': key[0], 'dst': key[1], 'protocol': key[2], 'level': level}
+                    self.incidents += 1
+                else:
+                    # Out of tokens: the key's last incident carries on
+                    incident.renewed = now
+                    incident.record['status'] = 'open'
+                    incident.record['suppressed_incidents'] += 1
+                    self.suppressed += 1
+            incident.add(threat_data, now)
+            self.open[id(incident)] = incident
+            self.open.move_to_end(id(incident))
+            return new_alert
+
+    def _close_idle(self, now):
+        while self.open:
+            incident = next(iter(self.open.values()))
+            if now - incident.last_seen <= self.idle:
+                break
+            incident.close()
+            self.open.popitem(last=False)
+
+    def stats(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._close_idle(now)
+            return {
+                'packets': self.packets,
+                'incidents': self.incidents,
+                'open_incidents': len(self.open),
+                'suppressed_incidents': self.suppressed,
+                'tracked_keys': len(self.keys),
+            }
@@ -0,0 +1,172 @@
+"""
+Asynchronous threat response dispatcher for PDMS
+Detection code hands each alert to dispatch(), which only bumps a counter
+and schedules a put on a bounded asyncio queue running in a background
+thread; when the queue is full the alert's response is dropped and counted
+instead of blocking capture. The loop turns every alert into its response
+actions (block, firewall rule, notification, incident response, log, sound)
+and runs each as its own task with a timeout and retries, so a slow or
+failing action delays nothing else.
+
+Actions are coroutines ``handler(alert) -> dict`` looked up by name, so a
+backend is any object with coroutine methods named after the actions;
+LocalBackend simulates them the way the alert system always has. Blocking
+work (the alert beeps) runs in the loop's thread pool.
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ALERT_QUEUE_SIZE = 1000
+ACTION_TIMEOUT = 5.0
+ACTION_RETRIES = 2
+RETRY_BACKOFF = 0.5
+MAX_CONCURRENT_ACTIONS = 32
+
+# Response actions for each threat level, in the order they are started
+RESPONSE_PLAN = {
+    'low': ('threat_log', 'alert_sound'),
+    'medium': ('threat_log', 'alert_sound'),
+    'high': ('block_ip', 'firewall_rule', 'threat_log', 'alert_sound'),
+    'critical': ('block_ip', 'firewall_rule', 'emergency_notification', 'incident_response', 'threat_log',
+                 'alert_sound'),
+}
+
+
+class LocalBackend:
+    """Simulated response actions (nothing leaves this machine)"""
+
+    def __init__(self, play_sound=None):
+        # play_sound(level) blocks while it beeps: run in the thread pool
+        self.play_sound = play_sound
+        self._playing = False
+
+    async def block_ip(self, alert):
+        src_ip = alert['threat_data'].get('src', '')
+        logger.info(f"🛡️ Blocked IP: {src_ip}")
+        return {'target': src_ip, 'status': 'executed'}
+
+    async def firewall_rule(self, alert):
+        return {'rule': f"block {alert['threat_data'].get('src', '')}", 'status': 'created'}
+
+    async def emergency_notification(self, alert):
+        return {'message': f"CRITICAL THREAT DETECTED from {alert['threat_data'].get('src', '')}", 'status': 'sent'}
+
+    async def incident_response(self, alert):
+        return {'status': 'initiated'}
+
+    async def threat_log(self, alert):
+        return {'status': 'logged'}
+
+    async def alert_sound(self, alert):
+        # One sound at a time: alerts arriving while it plays are not queued up behind it
+        if self.play_sound is None or self._playing:
+            return {'status': 'skipped'}
+        self._playing = True
+        # Shielded: a timeout or cancel stops the wait, not the playback, and
+        # only the playback thread clears the flag once the sound has finished
+        await asyncio.shield(asyncio.get_running_loop().run_in_executor(None, self._play, alert['level']))
+        return {'status': 'played'}
+
+    def _play(self, level):
+        try:
+            self.play_sound(level)
+        finally:
+            self._playing = False
+
+
+class AlertDispatcher:
+    def __init__(self, backend=None, queue_size=ALERT_QUEUE_SIZE, timeout=ACTION_TIMEOUT, retries=ACTION_RETRIES,
+                 plan=RESPONSE_PLAN):
+        self.backend = backend or LocalBackend()
+        self.handlers = {}
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retries = retries
+        self.plan = plan
+        self.counters = {'queued': 0, 'dropped': 0, 'executed': 0, 'failed': 0, 'timeouts': 0, 'retries': 0}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.loop = None
+        self.thread = threading.Thread(target=self._run_loop, name='alert-dispatcher', daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+    def register(self, action, handler):
+        """Use coroutine ``handler(alert) -> dict`` for an action instead of the backend's method"""
+        self.handlers[action] = handler
+
+    def dispatch(self, alert):
+        """Queue an alert's response actions; False (and counted) if the queue is full. Never blocks."""
+        with self._lock:
+            if self._pending >= self.queue_size:
+                self.counters['dropped'] += 1
+                return False
+            self._pending += 1
+            self.counters['queued'] += 1
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, alert)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'pending': self._pending}
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # Bounded by dispatch(); unbounded here so put_nowait never raises
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(MAX_CONCURRENT_ACTIONS)
+        self._tasks = set()
+        self._ready.set()
+        self.loop.run_until_complete(self._consume())
+
+    async def _consume(self):
+        while True:
+            alert = await self._queue.get()
+            with self._lock:
+                self._pending -= 1
+            for action in self.plan.get(alert.get('level'), ('threat_log',)):
+                task = asyncio.ensure_future(self._run_action(action, alert))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run_action(self, action, alert):
+        handler = self.handlers.get(action) or getattr(self.backend, action, None)
+        record = {'action': action}
+        for attempt in range(1, self.retries + 2):
+            async with self._slots:
+                try:
+                    if handler is None:
+                        raise NotImplementedError(f'no handler for {action}')
+                    record.update(await asyncio.wait_for(handler(alert), self.timeout) or {})
+                    record.setdefault('status', 'executed')
+                    record.pop('error', None)
+                except asyncio.TimeoutError:
+                    self._count('timeouts')
+                    record['error'] = f'timed out after {self.timeout}s'
+                except Exception as e:
+                    record['error'] = str(e)
+            if 'error' not in record:
+                self._count('executed')
+                break
+            if attempt > self.retries or handler is None:
+                record['status'] = 'failed'
+                self._count('failed')
+                logger.error(f"Threat response {action} failed for {alert.get('id')}: {record['error']}")
+                break
+            self._count('retries')
+            # Backing off does not hold a slot
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+        record['attempts'] = attempt
+        record['timestamp'] = datetime.now().isoformat()
+        alert.setdefault('actions_taken', []).append(record)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
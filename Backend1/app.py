@@ -1,42 +1,66 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 import pandas as pd
-import joblib
 import numpy as np
 from collections import Counter
 import threading
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import glob
 import logging
 from werkzeug.utils import secure_filename
-from live_packet_capture import live_predictions, lock, capture_loop
+import live_packet_capture
+from live_packet_capture import live_predictions, threat_analytics
+from forensic_index import CursorError, ForensicLogReader
+from prediction_history import PredictionHistory
+from explanation_service import ExplanationService, DEFAULT_EXPLAIN, EXPLAIN_MODES, top_k
+from training_jobs import TrainingScheduler
+from model_registry import ModelRegistry
+from batch_scoring import ScoringJob, register as register_job, get_job
+from ingestion import ingest, IngestError
+from streaming_metrics import ConfusionMatrix, SlidingWindowConfusion, DecayedConfusion
 from threat_alert_system import process_threat, get_alerts, get_alert_stats
-import csv
+from threat_analytics import DEFAULT_WINDOW_SECONDS, TOP_CAPACITY, TOP_N
 import time
 from datetime import datetime
 
-MODEL_PATH = 'rf_model.joblib'
-EXPLAINER_PATH = 'shap_explainer.joblib'
-FEATURES_PATH = 'features.txt'
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Number of scoring worker processes for the multi-process capture pipeline.
+# 0 keeps the single-threaded capture_loop.
+PIPELINE_WORKERS = int(os.environ.get('PDMS_PIPELINE_WORKERS', '0'))
+# Set by server.py when it starts the pipeline
+PIPELINE = None
+# /forensic-log source when no log writer runs in this process
+FORENSIC_READER = ForensicLogReader(live_packet_capture.FORENSIC_LOG)
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-MODEL = None
-EXPLAINER = None
-FEATURE_LIST = []
-if os.path.exists(MODEL_PATH) and os.path.exists(EXPLAINER_PATH) and os.path.exists(FEATURES_PATH):
-    MODEL = joblib.load(MODEL_PATH)
-    EXPLAINER = joblib.load(EXPLAINER_PATH)
-    with open(FEATURES_PATH) as f:
-        FEATURE_LIST = [line.strip() for line in f.readlines()]
+# Immutable model versions; the first run imports rf_model.joblib/features.txt
+REGISTRY = ModelRegistry()
+REGISTRY.bootstrap()
+# Model, feature list, encoder and (lazy) explainer of the served version,
+# replaced as one object. Handlers read MODEL_BUNDLE once and use that
+# reference throughout.
+MODEL_BUNDLE = REGISTRY.load() if REGISTRY.current() else None
 
 # Store prediction history and metrics
-PREDICTION_HISTORY = []  # Each entry: {'prediction': ..., 'explanation': ..., 'label': ...}
+# Bounded: newest HISTORY_CAPACITY rows in memory, older ones optionally spilled to disk
+PREDICTION_HISTORY = PredictionHistory(len(MODEL_BUNDLE.feature_list) if MODEL_BUNDLE else 0, spill_dir=os.environ.get('PDMS_HISTORY_SPILL_DIR'))
+# SHAP explanations are computed off the request path and fetched by prediction id
+EXPLANATIONS = ExplanationService(on_result=PREDICTION_HISTORY.set_explanation)
 METRICS = {'accuracy': None, 'precision': None, 'recall': None, 'f1_score': None}
+# Labelled /predict results, accumulated instead of re-scoring the whole history
+METRICS_WINDOW = 1000
+METRICS_HALF_LIFE = 1000
+METRIC_TRACKERS = {
+    'cumulative': ConfusionMatrix(),
+    'sliding': SlidingWindowConfusion(METRICS_WINDOW),
+    'decayed': DecayedConfusion(METRICS_HALF_LIFE),
+}
+# Concurrent /predict requests: one batch at a time through the trackers and into METRICS
+METRICS_LOCK = threading.Lock()
 
 # PDMS System State
 SYSTEM_STATE = {
@@ -64,70 +88,34 @@ ALARM_SOUND = 'alarm.wav'  # Place a short alarm sound in backend dir
 
 # Increase upload size
 MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100 MB
+# Larger requests are refused before werkzeug spools them (room left for the form encoding)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE + 1024 * 1024
 
 ALLOWED_EXTENSIONS = {'csv'}
+MAX_ACTIVE_THREATS = 1000
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def retrain_model_from_csv(data_path):
-    """Retrain the model from a CSV file and update global state."""
-    global MODEL, EXPLAINER, FEATURE_LIST, METRICS
-    try:
-        df = pd.read_csv(data_path, nrows=10000)
-        logger.info(f'Retrain: CSV shape: {df.shape}')
-        logger.info(f'Retrain: CSV head:\n{df.head()}')
-        # Find label column (case-insensitive)
-        label_col = None
-        for col in df.columns:
-            if col.strip().lower() == 'label':
-                label_col = col
-                break
-        if label_col is None:
-            logger.warning('Retrain: No "Label" column found, using last column as label.')
-            label_col = df.columns[-1]
-        y = df[label_col]
-        X = df.drop(columns=[label_col])
-        logger.info(f'Retrain: Using features: {list(X.columns)}')
-        logger.info(f'Retrain: Using label: {label_col}')
-        X_encoded = pd.get_dummies(X)
-        with open(FEATURES_PATH, 'w') as f:
-            f.write('\n'.join(X_encoded.columns))
-        from sklearn.ensemble import RandomForestClassifier
-        from sklearn.model_selection import train_test_split
-        from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-        import shap
-        X_train, X_test, y_train, y_test = train_test_split(X_encoded, y, test_size=0.2, random_state=42)
-        clf = RandomForestClassifier(n_estimators=20, random_state=42)
-        clf.fit(X_train, y_train)
-        y_pred = clf.predict(X_test)
-        acc = accuracy_score(y_test, y_pred)
-        prec = precision_score(y_test, y_pred, average='macro', zero_division=0)
-        rec = recall_score(y_test, y_pred, average='macro', zero_division=0)
-        f1 = f1_score(y_test, y_pred, average='macro', zero_division=0)
-        joblib.dump(clf, MODEL_PATH)
-        explainer = shap.TreeExplainer(clf)
-        joblib.dump(explainer, EXPLAINER_PATH)
-        MODEL = clf
-        EXPLAINER = explainer
-        FEATURE_LIST = list(X_encoded.columns)
-        logger.info(f'Retrain: New FEATURE_LIST: {FEATURE_LIST}')
-        METRICS['accuracy'] = acc
-        METRICS['precision'] = prec
-        METRICS['recall'] = rec
-        METRICS['f1_score'] = f1
-        # Update system state
-        SYSTEM_STATE['model_performance'] = {
-            'accuracy': acc,
-            'precision': prec,
-            'recall': rec,
-            'f1_score': f1,
-            'last_updated': datetime.now().isoformat()
-        }
-    except Exception as e:
-        logger.error(f'Retrain error: {e}')
-        import traceback
-        traceback.print_exc()
+def serve_bundle(bundle):
+    """Swap in a model version"""
+    global MODEL_BUNDLE
+    # The only write of MODEL_BUNDLE: requests see the old bundle or the new one
+    MODEL_BUNDLE = bundle
+    METRICS.update({k: bundle.metrics.get(k) for k in ('accuracy', 'precision', 'recall', 'f1_score')})
+    # Update system state
+    SYSTEM_STATE['model_performance'] = {**bundle.metrics, 'version': bundle.version,
+                                         'last_updated': bundle.loaded_at}
+
+def publish_model(model, feature_list, metrics, data_path):
+    """Store a model trained by a TrainingScheduler job as a new version and serve it"""
+    version = REGISTRY.publish(model, feature_list, metrics, source=data_path)
+    serve_bundle(REGISTRY.load(version))
+    logger.info(f'Retrain: serving {version} with {len(feature_list)} features')
+    return version
+
+# One retraining process at a time; concurrent requests coalesce into one queued job
+TRAINING = TrainingScheduler(publish_model)
 
 @app.route('/')
 def home():
@@ -139,9 +127,9 @@ def system_status():
     uptime_seconds = time.time() - SYSTEM_STATE['uptime']
     uptime_hours = uptime_seconds / 3600
     
-    # Calculate threat statistics
-    total_predictions = len(PREDICTION_HISTORY)
-    malicious_count = sum(1 for p in PREDICTION_HISTORY if p.get('prediction') == 'Malicious')
+    # Threat statistics from the history's running counters
+    total_predictions = PREDICTION_HISTORY.total
+    malicious_count = PREDICTION_HISTORY.count('Malicious')
     
     return jsonify({
         'status': SYSTEM_STATE['status'],
@@ -165,28 +153,19 @@ def upload_file():
         return jsonify({'error': 'No selected file'}), 400
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file.seek(0, os.SEEK_END)
-        file_length = file.tell()
-        file.seek(0)
-        if file_length > MAX_UPLOAD_SIZE:
-            return jsonify({'error': 'File too large. Max 100MB allowed.'}), 400
         filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        # Process in chunks if large
-        chunk_size = 10000
-        rows = 0
-        try:
-            for chunk in pd.read_csv(filepath, chunksize=chunk_size, encoding='utf-8'):
-                rows += len(chunk)
-        except UnicodeDecodeError:
-            for chunk in pd.read_csv(filepath, chunksize=chunk_size, encoding='utf-16'):
-                rows += len(chunk)
-        threading.Thread(target=retrain_model_from_csv, args=(filepath,)).start()
+        bundle = MODEL_BUNDLE
+        known_columns = set(bundle.encoder.layout.index) | set(bundle.encoder.vocab) if bundle else None
         try:
-            df = pd.read_csv(filepath, nrows=10, encoding='utf-8')
-        except UnicodeDecodeError:
-            df = pd.read_csv(filepath, nrows=10, encoding='utf-16')
-        return jsonify({'message': 'File uploaded and retraining started', 'columns': list(df.columns), 'rows': rows}), 200
+            # One pass: copy to disk while counting rows, detecting encoding and
+            # delimiter and checking the header
+            info = ingest(file.stream, filepath, max_bytes=MAX_UPLOAD_SIZE, known_columns=known_columns)
+        except IngestError as e:
+            return jsonify({'error': str(e)}), 400
+        job = TRAINING.submit(filepath)
+        return jsonify({'message': 'File uploaded and retraining started', 'columns': info['columns'],
+                        'rows': info['rows'], 'encoding': info['encoding'], 'delimiter': info['delimiter'],
+                        'warnings': info['warnings'], 'training_job': job.id}), 200
     else:
         return jsonify({'error': 'Only CSV files are supported for now.'}), 400
 
@@ -194,30 +173,32 @@ def upload_file():
 def predict():
     data = request.json.get('data', [])
     labels = request.json.get('labels', None)
+    # explain=malicious (default), all or none: which rows get a SHAP explanation
+    explain = request.args.get('explain', request.json.get('explain', DEFAULT_EXPLAIN))
     if not data:
         return jsonify({'error': 'No data provided'}), 400
-    X = pd.DataFrame(data)
-    X_enc = pd.get_dummies(X)
-    
-    # Fix DataFrame fragmentation by creating missing columns efficiently
-    missing_cols = set(FEATURE_LIST) - set(X_enc.columns)
-    if missing_cols:
-        # Create a DataFrame with missing columns filled with zeros
-        missing_df = pd.DataFrame(0, index=X_enc.index, columns=list(missing_cols))
-        # Concatenate efficiently
-        X_enc = pd.concat([X_enc, missing_df], axis=1)
-    
-    # Ensure correct column order
-    X_enc = X_enc.reindex(columns=FEATURE_LIST, fill_value=0)
-    
-    preds = MODEL.predict(X_enc)
-    shap_values = EXPLAINER.shap_values(X_enc)
-    explanations = [shap_values[np.argmax(np.bincount(preds))][i].tolist() for i in range(len(preds))]
+    if explain not in EXPLAIN_MODES:
+        return jsonify({'error': f'explain must be one of {list(EXPLAIN_MODES)}'}), 400
+    bundle = MODEL_BUNDLE
+    # One pass into a float32 matrix in feature-list order (same result as
+    # get_dummies + reindex against the fixed vocabulary)
+    X_enc = bundle.encoder.frame(bundle.encoder.transform(data))
+
+    preds = bundle.model.predict(X_enc)
+    first_id = PREDICTION_HISTORY.extend(preds, None, labels, bundle.version, bundle.feature_list)
+    ids = list(range(first_id, first_id + len(preds)))
+    # Explained asynchronously, each row for its own predicted class
+    queued, skipped = EXPLANATIONS.submit(ids, X_enc, preds, bundle, explain)
+    queued, skipped = set(queued), set(skipped)
     results = []
-    for i, (pred, explanation) in enumerate(zip(preds, explanations)):
+    for i, pred in enumerate(preds):
         label = labels[i] if labels and i < len(labels) else None
-        results.append({'prediction': str(pred), 'explanation': explanation, 'label': label})
-        PREDICTION_HISTORY.append({'prediction': str(pred), 'explanation': explanation, 'label': label})
+        results.append({
+            'id': ids[i],
+            'prediction': str(pred),
+            'explanation': 'pending' if ids[i] in queued else 'skipped' if ids[i] in skipped else None,
+            'label': label,
+        })
         # Update system state
         SYSTEM_STATE['total_packets_analyzed'] += 1
         if str(pred) == 'Malicious':
@@ -231,25 +212,55 @@ def predict():
             send_email('PDMS Alert: Malicious Threat Detected', f'A malicious threat was detected at row {i}.')
             play_alarm()
             auto_actions('Unknown', 'Unknown', i)
-    # Update metrics using sklearn if we have true labels
-    y_true = [r['label'] for r in PREDICTION_HISTORY if r['label'] is not None]
-    y_pred = [r['prediction'] for r in PREDICTION_HISTORY if r['label'] is not None]
-    if y_true and y_pred:
-        METRICS['accuracy'] = accuracy_score(y_true, y_pred)
-        METRICS['precision'] = precision_score(y_true, y_pred, average='macro', zero_division=0)
-        METRICS['recall'] = recall_score(y_true, y_pred, average='macro', zero_division=0)
-        METRICS['f1_score'] = f1_score(y_true, y_pred, average='macro', zero_division=0)
+    # Update metrics from this batch's labelled rows only
+    labelled = [(r['label'], r['prediction']) for r in results if r['label'] is not None]
+    if labelled:
+        y_true, y_pred = zip(*labelled)
+        with METRICS_LOCK:
+            for tracker in METRIC_TRACKERS.values():
+                tracker.update(y_true, y_pred)
+            METRICS.update(METRIC_TRACKERS['cumulative'].metrics())
     return jsonify({'results': results})
 
 @app.route('/metrics', methods=['GET'])
 def metrics():
-    return jsonify(METRICS)
+    # ?window=sliding|decayed|cumulative; default is the current model's metrics
+    window = request.args.get('window')
+    if window is None:
+        return jsonify(METRICS)
+    tracker = METRIC_TRACKERS.get(window)
+    if tracker is None:
+        return jsonify({'error': f'Unknown window: {window}', 'windows': list(METRIC_TRACKERS)}), 400
+    return jsonify({'window': window, 'samples': tracker.count, **tracker.metrics()})
+
+@app.route('/explanations/<int:prediction_id>', methods=['GET'])
+def explanation(prediction_id):
+    """SHAP explanation of one /predict row; ?top_k=N keeps the N strongest features"""
+    status = EXPLANATIONS.status(prediction_id)
+    if status == 'pending':
+        return jsonify({'id': prediction_id, 'status': 'pending'}), 202
+    vector, feature_names = EXPLANATIONS.get(prediction_id) or (None, None)
+    if vector is None:
+        # Evicted from the cache: the prediction history may still hold it,
+        # labelled with the features of the model version that made the prediction
+        row = PREDICTION_HISTORY.get(prediction_id)
+        vector = row['explanation'] if row else None
+        feature_names = row['feature_names'] if row else []
+    if vector is None:
+        if status == 'failed':
+            return jsonify({'id': prediction_id, 'status': 'failed'}), 500
+        if status == 'skipped':
+            return jsonify({'id': prediction_id, 'status': 'skipped',
+                            'error': 'Explanation queue was full when this prediction was made'}), 503
+        return jsonify({'error': 'No explanation for this prediction (use explain=all to explain every row)'}), 404
+    k = request.args.get('top_k', type=int)
+    values = top_k(vector, feature_names, k) if k else [float(v) for v in vector]
+    return jsonify({'id': prediction_id, 'status': 'ready', 'explanation': values})
 
 @app.route('/history', methods=['GET'])
 def history():
     # Return the last 50 live predictions
-    with lock:
-        return jsonify({'history': list(live_predictions)[-50:]})
+    return jsonify({'history': live_predictions.tail(50)})
 
 @app.route('/retrain', methods=['POST'])
 def retrain():
@@ -262,106 +273,103 @@ def retrain():
         if not files:
             return jsonify({'error': 'No uploaded CSV found for retraining.'}), 400
         data_path = max(files, key=os.path.getctime)
-    threading.Thread(target=retrain_model_from_csv, args=(data_path,)).start()
-    return jsonify({'message': f'Retraining started on {data_path}. Model will reload automatically when done.'}), 200
+    job = TRAINING.submit(data_path)
+    return jsonify({'message': f'Retraining started on {data_path}. Model will reload automatically when done.',
+                    'job': job.to_dict()}), 200
+
+@app.route('/models', methods=['GET'])
+def models():
+    """Registered model versions (newest first) and the one being served"""
+    versions = []
+    for version in reversed(REGISTRY.versions()):
+        manifest = REGISTRY.manifest(version)
+        manifest.pop('features', None)
+        versions.append(manifest)
+    return jsonify({'current': REGISTRY.current(), 'versions': versions})
+
+@app.route('/models/rollback', methods=['POST'])
+def rollback_model():
+    """Serve an earlier version: {"version": "v0002"}, or the previous one"""
+    data = request.get_json(silent=True) or {}
+    try:
+        version = REGISTRY.rollback(data.get('version'))
+    except KeyError as e:
+        return jsonify({'error': str(e.args[0])}), 400
+    serve_bundle(REGISTRY.load(version))
+    return jsonify({'current': version})
+
+@app.route('/training-jobs', methods=['GET'])
+def training_jobs():
+    return jsonify({'jobs': TRAINING.list()})
+
+@app.route('/training-jobs/<job_id>', methods=['GET'])
+def training_job_status(job_id):
+    job = TRAINING.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/training-jobs/<job_id>/cancel', methods=['POST'])
+def cancel_training_job(job_id):
+    if not TRAINING.cancel(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 409
+    return jsonify(TRAINING.get(job_id).to_dict())
+
+def latest_upload():
+    files = glob.glob(os.path.join(UPLOAD_FOLDER, '*.csv'))
+    return max(files, key=os.path.getctime) if files else None
 
 @app.route('/predict_uploaded', methods=['POST'])
 def predict_uploaded():
-    print('predict_uploaded called')
+    """Score the latest upload chunk by chunk, streaming one NDJSON line per row"""
+    latest_file = latest_upload()
+    if latest_file is None:
+        return jsonify({'error': 'No uploaded CSV found'}), 400
     try:
-        # Find the most recent CSV in uploads
-        files = glob.glob(os.path.join(UPLOAD_FOLDER, '*.csv'))
-        if not files:
-            print('No uploaded CSV found')
-            return jsonify({'error': 'No uploaded CSV found'}), 400
-        latest_file = max(files, key=os.path.getctime)
-        df = pd.read_csv(latest_file)
-        print("CSV columns:", df.columns)
-        print("Model expects features:", FEATURE_LIST)
-        available_features = [col for col in FEATURE_LIST if col in df.columns]
-        print("Available features for prediction:", available_features)
-        if not available_features:
-            print('No valid features found in uploaded file.')
-            return jsonify({'error': 'No valid features found in uploaded file.'}), 400
-        # Use only feature columns
-        X = df[available_features]
-        # Limit to 1000 rows for demo/performance
-        X = X.head(1000)
-        print("X shape:", X.shape)
-        print("X columns:", X.columns)
-        print("First 5 rows of X:", X.head())
-        print("Before pd.get_dummies")
-        X_enc = pd.get_dummies(X)
-        print("After pd.get_dummies, columns:", X_enc.columns)
-
-        # Ensure all columns are numeric and fill NaN with 0
-        X_enc = X_enc.apply(pd.to_numeric, errors='coerce')
-        X_enc = X_enc.fillna(0)
-        print("After to_numeric and fillna, dtypes:", X_enc.dtypes)
-
-        # Fix DataFrame fragmentation by creating missing columns efficiently
-        missing_cols = set(FEATURE_LIST) - set(X_enc.columns)
-        if missing_cols:
-            missing_df = pd.DataFrame(0, index=X_enc.index, columns=list(missing_cols))
-            X_enc = pd.concat([X_enc, missing_df], axis=1)
-
-        # Ensure correct column order
-        X_enc = X_enc.reindex(columns=FEATURE_LIST, fill_value=0)
-        print("After reindex, dtypes:", X_enc.dtypes)
-
-        # Force all data to float64
-        X_enc = X_enc.astype(np.float64)
-        print("Final X_enc shape:", X_enc.shape, "dtypes:", X_enc.dtypes)
-
-        # Now try prediction
-        preds = MODEL.predict(X_enc)
-        print("After MODEL.predict")
-        # Temporarily skip SHAP explanations to isolate error
-        # shap_values = EXPLAINER.shap_values(X_enc)
-        # print("After EXPLAINER.shap_values")
-        # explanations = [shap_values[np.argmax(np.bincount(preds))][i].tolist() for i in range(len(preds))]
-        results = []
-        for i, pred in enumerate(preds):
-            print(f'Prediction {i}: type={type(pred)}, value={pred}')
-            result = {'prediction': str(pred)}
-            if str(pred) == 'Malicious':
-                # Trigger backend actions automatically
-                play_alarm()
-                auto_actions('Unknown', 'Unknown', i)
-                result['threat'] = True
-            results.append(result)
-        print('predict_uploaded finished')
-        return jsonify({'results': results, 'columns': list(X.columns)})
-    except Exception as e:
-        import traceback
-        print('Exception in /predict_uploaded:', e)
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        bundle = MODEL_BUNDLE
+        job = ScoringJob(latest_file, bundle.model, bundle.encoder).prepare()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    register_job(job)
+
+    def on_threats(rows):
+        # One alarm and one threat entry per chunk, not per malicious row
+        play_alarm()
+        auto_actions_rows('Unknown', 'Unknown', rows)
+
+    return Response(job.ndjson(on_threats), mimetype='application/x-ndjson', headers={'X-Job-Id': job.id})
 
 @app.route('/predict_uploaded_simple', methods=['POST'])
 def predict_uploaded_simple():
+    """Score the latest upload in the background into a results CSV"""
+    latest_file = latest_upload()
+    if latest_file is None:
+        return jsonify({'error': 'No uploaded CSV found'}), 400
     try:
-        files = glob.glob(os.path.join(UPLOAD_FOLDER, '*.csv'))
-        if not files:
-            return jsonify({'error': 'No uploaded CSV found'}), 400
-        latest_file = max(files, key=os.path.getctime)
-        df = pd.read_csv(latest_file)
-        # Only keep columns in FEATURE_LIST
-        X = df[[col for col in FEATURE_LIST if col in df.columns]].copy()
-        # Convert to numeric, fill NaN
-        X = X.apply(pd.to_numeric, errors='coerce').fillna(0)
-        # Reindex to match model
-        X = X.reindex(columns=FEATURE_LIST, fill_value=0)
-        # Force float64
-        X = X.astype('float64')
-        preds = MODEL.predict(X)
-        results = [{'prediction': str(pred)} for pred in preds]
-        return jsonify({'results': results, 'columns': list(X.columns)})
-    except Exception as e:
-        import traceback
-        print('Exception in /predict_uploaded_simple:', e)
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        bundle = MODEL_BUNDLE
+        job = ScoringJob(latest_file, bundle.model, bundle.encoder).prepare()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    register_job(job).start()
+    return jsonify({'job': job.id, 'status_url': f'/scoring-jobs/{job.id}',
+                    'results_url': f'/scoring-jobs/{job.id}/results'}), 202
+
+@app.route('/scoring-jobs/<job_id>', methods=['GET'])
+def scoring_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.progress())
+
+@app.route('/scoring-jobs/<job_id>/results', methods=['GET'])
+def scoring_job_results(job_id):
+    job = get_job(job_id)
+    if job is None or job.output is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status != 'done':
+        return jsonify(job.progress()), 409
+    return send_from_directory(os.path.dirname(os.path.abspath(job.output)), os.path.basename(job.output),
+                               mimetype='text/csv', as_attachment=True)
 
 @app.route('/block', methods=['POST'])
 def block():
@@ -396,53 +404,49 @@ def trace():
 
 @app.route('/live-predictions', methods=['GET'])
 def live_predictions_api():
-    with lock:
-        # Return the last 100 predictions
-        data = list(live_predictions)[-100:]
+    # Return the last 100 predictions
+    data = live_predictions.tail(100)
     return jsonify({'live_predictions': data})
 
 @app.route('/forensic-log', methods=['GET'])
 def forensic_log():
-    log_path = 'forensic_log.csv'
-    if not os.path.exists(log_path):
-        return jsonify({'log': []})
-    rows = []
-    with open(log_path, 'r', newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append(row)
-    # Return the last 100 entries
-    return jsonify({'log': rows[-100:]})
+    """Page through the forensic log, newest first, using its sidecar index.
+
+    Query parameters: limit (default 100), cursor (next_cursor of the previous
+    page), since/until ('YYYY-MM-DD HH:MM:SS'), ip, src, dst, protocol, prediction.
+    """
+    args = request.args
+    try:
+        limit = max(1, min(int(args.get('limit', 100)), 1000))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    filters = {key: args.get(key) or None for key in ('ip', 'src', 'dst', 'protocol', 'prediction')}
+    for key in ('since', 'until'):
+        value = args.get(key)
+        filters[key] = value.replace('T', ' ')[:19] if value else None
+    # Capture (and with it the log writer) may not run in this process, e.g.
+    # without tshark, under a WSGI server or next to a capturing process
+    source = live_packet_capture.FORENSIC_WRITER or FORENSIC_READER
+    try:
+        rows, next_cursor = source.query(limit=limit, cursor=args.get('cursor'), **filters)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'log': rows, 'next_cursor': next_cursor})
 
 @app.route('/threat-analysis', methods=['GET'])
 def threat_analysis():
-    # Initialize threat stats with default values
-    threat_stats = {
-        'total_analyzed': 0,
-        'malicious_count': 0,
-        'benign_count': 0,
-        'threat_rate': 0,
-        'top_threat_sources': [],
-        'threat_timeline': []
-    }
-    
-    # Get recent predictions
-    with lock:
-        recent_predictions = list(live_predictions)[-1000:]
-    
-    if recent_predictions:
-        threat_stats.update({
-            'total_analyzed': len(recent_predictions),
-            'malicious_count': sum(1 for p in recent_predictions if p.get('prediction') == 'Malicious'),
-            'benign_count': sum(1 for p in recent_predictions if p.get('prediction') == 'Benign')
-        })
-        
-        if threat_stats['total_analyzed'] > 0:
-            threat_stats['threat_rate'] = round(
-                (threat_stats['malicious_count'] / threat_stats['total_analyzed']) * 100, 2
-            )
-    
-    return jsonify(threat_stats)
+    """Packet counts, timeline and top malicious sources/destinations/protocols over ?window= seconds (default 300)."""
+    window = request.args.get('window', DEFAULT_WINDOW_SECONDS, type=int)
+    top = request.args.get('top', TOP_N, type=int)
+    return jsonify(threat_analytics.report(window, max(1, min(top, TOP_CAPACITY))))
+
+@app.route('/pipeline-stats', methods=['GET'])
+def pipeline_stats():
+    """Get per-stage queue depth and drop counters of the capture pipeline and forensic log."""
+    stats = {'mode': 'thread', 'workers': 0} if PIPELINE is None else PIPELINE.stats()
+    writer = live_packet_capture.FORENSIC_WRITER
+    stats['forensic_log'] = writer.stats() if writer is not None else None
+    return jsonify(stats)
 
 @app.route('/alerts', methods=['GET'])
 def get_threat_alerts():
@@ -483,7 +487,7 @@ def model_comparison():
             'type': 'Random Forest',
             'n_estimators': 20,
             'performance': METRICS,
-            'features_used': len(FEATURE_LIST),
+            'features_used': len(MODEL_BUNDLE.feature_list) if MODEL_BUNDLE else 0,
             'last_trained': datetime.now().isoformat()
         },
         'available_models': ['Random Forest', 'Decision Tree', 'SVM', 'Neural Network'],
@@ -519,10 +523,21 @@ def play_alarm():
 def auto_actions(src_ip, protocol, row):
     # Block
     SYSTEM_STATE['active_threats'].append({'timestamp': datetime.now().isoformat(), 'prediction': 'Malicious', 'index': row, 'src_ip': src_ip})
+    # Bounded: a scored upload can hold millions of malicious rows
+    del SYSTEM_STATE['active_threats'][:-MAX_ACTIVE_THREATS]
     # Simulate block/report/trace
     logger.info(f'Auto-blocked {src_ip} protocol {protocol} row {row}')
     # You can expand this to call real block/report/trace endpoints if needed
 
+def auto_actions_rows(src_ip, protocol, rows):
+    """auto_actions for a chunk of malicious rows: one aggregated threat entry and log line"""
+    first, last = int(rows[0]), int(rows[-1])
+    SYSTEM_STATE['active_threats'].append({'timestamp': datetime.now().isoformat(), 'prediction': 'Malicious',
+                                           'index': first, 'last_index': last, 'count': len(rows),
+                                           'src_ip': src_ip})
+    del SYSTEM_STATE['active_threats'][:-MAX_ACTIVE_THREATS]
+    logger.info(f'Auto-blocked {src_ip} protocol {protocol} rows {first}-{last} ({len(rows)} malicious)')
+
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
@@ -531,7 +546,7 @@ def after_request(response):
     return response
 
 if __name__ == '__main__':
-    # Start live packet capture in a background thread
-    t = threading.Thread(target=capture_loop, daemon=True)
-    t.start()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # server.py is the entry point; run this way the capture pipeline is not available
+    import sys
+    import server
+    server.main(sys.modules[__name__])
\ No newline at end of file
@@ -1,8 +1,19 @@
 """
 Auto IDS Trainer: Downloads, preprocesses, merges, and uploads multiple public intrusion datasets for real-time IDS retraining.
 
+Each dataset is fetched and preprocessed in its own worker process: read in
+chunks, relabeled to Benign/Malicious with vectorized operations and written
+as typed Parquet parts under auto_datasets/parquet/dataset=<name>/. The merge
+then scans those parts lazily with pyarrow.dataset, projecting only the
+columns all datasets share, and streams them into merged.parquet and
+merged.csv. Source files already in the local mirror folder are used instead
+of downloading them, and downloads are saved there, so later runs work
+without a network. A dataset whose source file hashes the same as last time
+keeps its Parquet parts. Every stage is timed.
+
 Requirements:
 - pandas
+- pyarrow
 - requests
 - scikit-learn
 - tqdm
@@ -10,95 +21,241 @@ Requirements:
 
 Run: python auto_train_all.py
 """
+import json
 import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 import requests
-from io import BytesIO, StringIO
-from zipfile import ZipFile
-from tqdm import tqdm
-from flask_cors import CORS
+
+from preprocess_cache import file_digest
 
 BACKEND_URL = 'http://localhost:5000'  # Change if backend runs elsewhere
 UPLOAD_ENDPOINT = f'{BACKEND_URL}/upload'
 METRICS_ENDPOINT = f'{BACKEND_URL}/metrics'
 
 DATA_DIR = 'auto_datasets'
+PARQUET_DIR = os.path.join(DATA_DIR, 'parquet')
+# Source files are looked up here before downloading, and saved here after
+MIRROR_DIR = os.environ.get('PDMS_DATASET_MIRROR', os.path.join(DATA_DIR, 'mirror'))
+PREPROCESS_CHUNK_ROWS = 200000
+# Hash of the source file the Parquet parts were built from
+SOURCE_MARKER = '_source.json'
+DOWNLOAD_TIMEOUT = 60
+# Backend upload limit (app.MAX_UPLOAD_SIZE), less some room for the form encoding
+UPLOAD_LIMIT_BYTES = 95 * 1024 * 1024
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# --- NSL-KDD ---
-def download_nsl_kdd():
-    url = 'https://raw.githubusercontent.com/defcom17/NSL_KDD/master/KDDTrain+.txt'
-    print('Downloading NSL-KDD...')
-    df = pd.read_csv(url, header=None)
-    # Hardcoded NSL-KDD columns (41 features + Label)
-    nsl_kdd_columns = [
-        'duration', 'protocol_type', 'service', 'flag', 'src_bytes', 'dst_bytes', 'land', 'wrong_fragment', 'urgent',
-        'hot', 'num_failed_logins', 'logged_in', 'num_compromised', 'root_shell', 'su_attempted', 'num_root',
-        'num_file_creations', 'num_shells', 'num_access_files', 'num_outbound_cmds', 'is_host_login', 'is_guest_login',
-        'count', 'srv_count', 'serror_rate', 'srv_serror_rate', 'rerror_rate', 'srv_rerror_rate', 'same_srv_rate',
-        'diff_srv_rate', 'srv_diff_host_rate', 'dst_host_count', 'dst_host_srv_count', 'dst_host_same_srv_rate',
-        'dst_host_diff_srv_rate', 'dst_host_same_src_port_rate', 'dst_host_srv_diff_host_rate', 'dst_host_serror_rate',
-        'dst_host_srv_serror_rate', 'dst_host_rerror_rate', 'dst_host_srv_rerror_rate', 'Label'
-    ]
-    # Drop extra columns if present
-    if df.shape[1] > len(nsl_kdd_columns):
-        print(f'NSL-KDD: Dropping {df.shape[1] - len(nsl_kdd_columns)} extra columns.')
-        df = df.iloc[:, :len(nsl_kdd_columns)]
-    elif df.shape[1] < len(nsl_kdd_columns):
-        for _ in range(len(nsl_kdd_columns) - df.shape[1]):
-            df[df.shape[1]] = None
-    df.columns = nsl_kdd_columns
-    print(f'NSL-KDD shape after column fix: {df.shape}')
-    # Map labels
-    df['Label'] = df['Label'].apply(lambda x: 'Benign' if x == 'normal' else 'Malicious')
-    df.to_csv(os.path.join(DATA_DIR, 'nsl_kdd.csv'), index=False)
-    print('NSL-KDD processed.')
-    return df
-
-# --- CICIDS2017 (small sample for demo) ---
-def download_cicids2017():
-    # Use a small, public sample
-    url = 'https://raw.githubusercontent.com/smilli/IDS-DataSets/master/CICIDS2017/Friday-WorkingHours-Morning.pcap_ISCX.csv'
-    print('Downloading CICIDS2017 sample...')
-    df = pd.read_csv(url, low_memory=False)
-    # Map labels
-    df['Label'] = df['Label'].apply(lambda x: 'Benign' if 'BENIGN' in str(x).upper() else 'Malicious')
-    df = df.dropna(axis=1, how='all')
-    df.to_csv(os.path.join(DATA_DIR, 'cicids2017.csv'), index=False)
-    print('CICIDS2017 sample processed.')
-    return df
-
-# --- UNSW-NB15 ---
-def download_unsw_nb15():
-    # Use a preprocessed version for demo
-    url = 'https://raw.githubusercontent.com/huynhhoc/UNSW-NB15/master/UNSW_NB15_training-set.csv'
-    print('Downloading UNSW-NB15...')
-    df = pd.read_csv(url)
-    # Map labels (0: Benign, 1: Malicious)
-    if 'label' in df.columns:
-        df['Label'] = df['label'].apply(lambda x: 'Malicious' if x == 1 else 'Benign')
-    elif 'Label' in df.columns:
-        df['Label'] = df['Label'].apply(lambda x: 'Malicious' if x == 1 else 'Benign')
+# Hardcoded NSL-KDD columns (41 features + Label)
+NSL_KDD_COLUMNS = [
+    'duration', 'protocol_type', 'service', 'flag', 'src_bytes', 'dst_bytes', 'land', 'wrong_fragment', 'urgent',
+    'hot', 'num_failed_logins', 'logged_in', 'num_compromised', 'root_shell', 'su_attempted', 'num_root',
+    'num_file_creations', 'num_shells', 'num_access_files', 'num_outbound_cmds', 'is_host_login', 'is_guest_login',
+    'count', 'srv_count', 'serror_rate', 'srv_serror_rate', 'rerror_rate', 'srv_rerror_rate', 'same_srv_rate',
+    'diff_srv_rate', 'srv_diff_host_rate', 'dst_host_count', 'dst_host_srv_count', 'dst_host_same_srv_rate',
+    'dst_host_diff_srv_rate', 'dst_host_same_src_port_rate', 'dst_host_srv_diff_host_rate', 'dst_host_serror_rate',
+    'dst_host_srv_serror_rate', 'dst_host_rerror_rate', 'dst_host_srv_rerror_rate', 'Label'
+]
+
+
+# --- Label mapping (vectorized, one chunk at a time) ---
+def relabel_nsl_kdd(chunk):
+    chunk['Label'] = np.where(chunk['Label'] == 'normal', 'Benign', 'Malicious')
+    return chunk
+
+
+def relabel_cicids2017(chunk):
+    benign = chunk['Label'].astype(str).str.upper().str.contains('BENIGN', regex=False)
+    chunk['Label'] = np.where(benign, 'Benign', 'Malicious')
+    return chunk
+
+
+def relabel_unsw_nb15(chunk):
+    # 0: Benign, 1: Malicious
+    if 'label' in chunk.columns:
+        source = chunk.pop('label')
+    elif 'Label' in chunk.columns:
+        source = chunk['Label']
     else:
         raise Exception('No label column found in UNSW-NB15')
-    df.to_csv(os.path.join(DATA_DIR, 'unsw_nb15.csv'), index=False)
-    print('UNSW-NB15 processed.')
-    return df
+    chunk['Label'] = np.where(pd.to_numeric(source, errors='coerce') == 1, 'Malicious', 'Benign')
+    return chunk
+
+
+SOURCES = {
+    'nsl_kdd': {
+        'url': 'https://raw.githubusercontent.com/defcom17/NSL_KDD/master/KDDTrain+.txt',
+        # No header row; the extra difficulty column after Label is dropped
+        'read': {'header': None, 'names': NSL_KDD_COLUMNS, 'usecols': range(len(NSL_KDD_COLUMNS))},
+        'relabel': relabel_nsl_kdd,
+    },
+    # Small public sample for demo
+    'cicids2017': {
+        'url': 'https://raw.githubusercontent.com/smilli/IDS-DataSets/master/CICIDS2017/Friday-WorkingHours-Morning.pcap_ISCX.csv',
+        'read': {},
+        'relabel': relabel_cicids2017,
+    },
+    # Preprocessed version for demo
+    'unsw_nb15': {
+        'url': 'https://raw.githubusercontent.com/huynhhoc/UNSW-NB15/master/UNSW_NB15_training-set.csv',
+        'read': {},
+        'relabel': relabel_unsw_nb15,
+    },
+}
+
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+# --- Acquire ---
+def fetch(name):
+    """Local path of a dataset's source file: the mirror copy, else downloaded into the mirror"""
+    url = SOURCES[name]['url']
+    path = os.path.join(MIRROR_DIR, os.path.basename(url))
+    if os.path.exists(path):
+        print(f'{name}: using local mirror {path}')
+        return path
+    print(f'Downloading {name}...')
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    tmp = f'{path}.part'
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+        resp.raise_for_status()
+        with open(tmp, 'wb') as f:
+            for block in resp.iter_content(chunk_size=1 << 20):
+                f.write(block)
+    os.replace(tmp, path)
+    return path
+
+
+# --- Preprocess ---
+def arrow_schema(chunk):
+    """Column types for a whole dataset, fixed from its first chunk: float64 or string"""
+    import pyarrow as pa
+    return pa.schema([(column, pa.float64() if column != 'Label' and pd.api.types.is_numeric_dtype(dtype)
+                       else pa.string()) for column, dtype in chunk.dtypes.items()])
+
+
+def conform(chunk, schema):
+    """Coerce a chunk to the dataset schema (text in a numeric column becomes null)"""
+    import pyarrow as pa
+    columns = {}
+    for field in schema:
+        values = chunk[field.name]
+        if pa.types.is_floating(field.type):
+            columns[field.name] = pd.to_numeric(values, errors='coerce').astype('float64')
+        else:
+            columns[field.name] = values.astype('string')
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+
+
+def preprocess(name):
+    """Fetch one dataset and write it as Parquet parts; runs in a worker process"""
+    import pyarrow.parquet as pq
+    timings = {}
+    source = SOURCES[name]
+    with timed(timings, 'fetch'):
+        path = fetch(name)
+    out_dir = os.path.join(PARQUET_DIR, f'dataset={name}')
+    marker = os.path.join(out_dir, SOURCE_MARKER)
+    with timed(timings, 'hash'):
+        digest = file_digest(path)
+    if os.path.exists(marker):
+        with open(marker) as f:
+            cached = json.load(f)
+        if cached.get('sha256') == digest:
+            print(f'{name}: source unchanged, reusing {out_dir}')
+            return name, out_dir, cached['rows'], timings
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    rows, schema = 0, None
+    with timed(timings, 'preprocess'):
+        for part, chunk in enumerate(pd.read_csv(path, chunksize=PREPROCESS_CHUNK_ROWS, low_memory=False,
+                                                 **source['read'])):
+            # CICIDS2017 headers carry leading spaces (' Label')
+            chunk.columns = [str(c).strip() for c in chunk.columns]
+            chunk = source['relabel'](chunk)
+            if schema is None:
+                schema = arrow_schema(chunk)
+            pq.write_table(conform(chunk, schema), os.path.join(out_dir, f'part-{part:05d}.parquet'))
+            rows += len(chunk)
+    # Written last: the parts are complete for this exact source file
+    with open(marker, 'w') as f:
+        json.dump({'sha256': digest, 'rows': rows}, f)
+    print(f'{name} processed: {rows} rows, {len(schema) if schema else 0} columns.')
+    return name, out_dir, rows, timings
+
 
 # --- Merge Datasets ---
-def merge_datasets(dfs):
+def parquet_parts(out_dir):
+    return [os.path.join(out_dir, f) for f in sorted(os.listdir(out_dir)) if f.endswith('.parquet')]
+
+
+def common_schema(dataset_dirs):
+    """Columns every dataset has (first dataset's order), with one type per column"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schemas = []
+    for out_dir in dataset_dirs:
+        schemas.append(pq.read_schema(parquet_parts(out_dir)[0]))
+    common = [name for name in schemas[0].names if all(name in s.names for s in schemas[1:])]
+    fields = []
+    for name in common:
+        types = {s.field(name).type for s in schemas}
+        fields.append((name, types.pop() if len(types) == 1 else pa.string()))
+    return pa.schema(fields)
+
+
+def merge_datasets(dataset_dirs, timings):
+    """Stream the common columns of all datasets into merged.parquet and merged.csv"""
+    import pyarrow.csv as pacsv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
     print('Merging datasets...')
-    # Find common columns
-    common_cols = set(dfs[0].columns)
-    for df in dfs[1:]:
-        common_cols &= set(df.columns)
-    common_cols = list(common_cols)
-    # Keep only common columns
-    dfs = [df[common_cols] for df in dfs]
-    merged = pd.concat(dfs, ignore_index=True)
-    merged.to_csv(os.path.join(DATA_DIR, 'merged.csv'), index=False)
-    print(f'Merged dataset shape: {merged.shape}')
-    return merged
+    with timed(timings, 'merge'):
+        schema = common_schema(dataset_dirs)
+        files = [part for d in dataset_dirs for part in parquet_parts(d)]
+        # Lazy: each file is read batch by batch, only the projected columns
+        dataset = ds.dataset(files, schema=schema, format='parquet')
+        parquet_path = os.path.join(DATA_DIR, 'merged.parquet')
+        csv_path = os.path.join(DATA_DIR, 'merged.csv')
+        rows = 0
+        with pq.ParquetWriter(parquet_path, schema) as pq_writer, pacsv.CSVWriter(csv_path, schema) as csv_writer:
+            for batch in dataset.to_batches(columns=schema.names):
+                pq_writer.write_batch(batch)
+                csv_writer.write_batch(batch)
+                rows += batch.num_rows
+    print(f'Merged dataset shape: ({rows}, {len(schema)})')
+    return parquet_path, csv_path, rows
+
+
+def upload_copy(parquet_path, csv_path, rows, timings, limit=UPLOAD_LIMIT_BYTES, seed=42):
+    """merged.csv, or a uniform row sample of it when it is over the backend's upload limit"""
+    size = os.path.getsize(csv_path)
+    if size <= limit:
+        return csv_path
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+    fraction = 0.9 * limit / size
+    print(f'Merged CSV is {size / (1024 * 1024):.0f} MB; uploading a {fraction:.1%} sample '
+          f'(~{int(rows * fraction)} rows) to fit the upload limit.')
+    rng = np.random.default_rng(seed)
+    sample_path = os.path.join(DATA_DIR, 'merged_upload.csv')
+    with timed(timings, 'sample'):
+        parquet = pq.ParquetFile(parquet_path)
+        with pacsv.CSVWriter(sample_path, parquet.schema_arrow) as writer:
+            for batch in parquet.iter_batches():
+                writer.write_batch(batch.filter(rng.random(batch.num_rows) < fraction))
+    return sample_path
+
 
 # --- Upload and Retrain ---
 def upload_and_retrain(csv_path):
@@ -118,46 +275,51 @@ def print_metrics():
     resp = requests.get(METRICS_ENDPOINT)
     print('Model metrics:', resp.json())
 
+
+def print_timings(dataset_timings, timings):
+    print('Stage timings (seconds):')
+    for name in [n for n in SOURCES if n in dataset_timings]:
+        stages = dataset_timings[name]
+        print(f'  {name:<12} ' + '  '.join(f'{stage} {seconds:7.2f}' for stage, seconds in stages.items()))
+    for stage, seconds in timings.items():
+        print(f'  {stage:<12} {seconds:7.2f}')
+
+
 # --- Main script ---
 if __name__ == '__main__':
-    datasets = []
-    # NSL-KDD
-    try:
-        nsl = download_nsl_kdd()
-        datasets.append(nsl)
-    except Exception as e:
-        print(f'Warning: NSL-KDD download failed: {e}')
-    # CICIDS2017
-    try:
-        cic = download_cicids2017()
-        datasets.append(cic)
-    except Exception as e:
-        print(f'Warning: CICIDS2017 download failed: {e}')
-    # UNSW-NB15
-    try:
-        unsw = download_unsw_nb15()
-        datasets.append(unsw)
-    except Exception as e:
-        print(f'Warning: UNSW-NB15 download failed: {e}')
-    if not datasets:
+    timings, dataset_timings = {}, {}
+    dataset_dirs = []
+    with timed(timings, 'datasets'):
+        with ProcessPoolExecutor(max_workers=len(SOURCES)) as pool:
+            futures = {pool.submit(preprocess, name): name for name in SOURCES}
+            for future in as_completed(futures):
+                try:
+                    name, out_dir, rows, stages = future.result()
+                except Exception as e:
+                    print(f'Warning: {futures[future]} failed: {e}')
+                    continue
+                dataset_timings[name] = stages
+                if rows:
+                    dataset_dirs.append(out_dir)
+    if not dataset_dirs:
         print('No datasets available for training. Exiting.')
         exit(1)
-    merged = merge_datasets(datasets)
-    # Sample to 5,000 rows to fit under 10MB
-    sample_size = 5000
-    if len(merged) > sample_size:
-        print(f'Sampling merged dataset to {sample_size} rows to fit under 10MB upload limit.')
-        merged = merged.sample(n=sample_size, random_state=42)
-    merged_path = os.path.join(DATA_DIR, 'merged.csv')
-    merged.to_csv(merged_path, index=False)
+    dataset_dirs.sort(key=lambda d: list(SOURCES).index(d.rsplit('=', 1)[-1]))
+    parquet_path, merged_path, rows = merge_datasets(dataset_dirs, timings)
     # Print file size
     file_size_mb = os.path.getsize(merged_path) / (1024 * 1024)
     print(f'Merged CSV file size: {file_size_mb:.2f} MB')
-    upload_and_retrain(merged_path)
-    print('Waiting for retraining to complete (please check backend logs)...')
-    import time; time.sleep(10)
-    print_metrics()
+    upload_path = upload_copy(parquet_path, merged_path, rows, timings)
+    try:
+        with timed(timings, 'upload'):
+            upload_and_retrain(upload_path)
+        print('Waiting for retraining to complete (please check backend logs)...')
+        time.sleep(10)
+        print_metrics()
+    except requests.RequestException as e:
+        print(f'Warning: backend not reachable ({e}); train locally with python train_model.py')
+    print_timings(dataset_timings, timings)
 
 # To enable backend file logging, add this to backend/app.py:
 # import logging
-# logging.basicConfig(filename='backend.log', level=logging.INFO) 
\ No newline at end of file
+# logging.basicConfig(filename='backend.log', level=logging.INFO)
@@ -0,0 +1,211 @@
+"""
+Streaming batch scoring of uploaded CSV files
+A ScoringJob reads the upload in fixed-size chunks (only the columns the model
+uses, with explicit dtypes), encodes each chunk with the FeatureEncoder,
+scores it and hands the predictions on: streamed back as NDJSON lines, or
+written to a results CSV by a background thread. Memory stays constant
+whatever the file size, and every job reports its progress and throughput
+while it runs.
+"""
+
+import csv
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ingestion import read_meta
+
+logger = logging.getLogger(__name__)
+
+SCORE_CHUNK_ROWS = 20000
+RESULTS_DIR = 'results'
+# Rows sampled up front to decide which feature columns parse as numbers
+DTYPE_SAMPLE_ROWS = 1000
+MAX_JOBS = 100
+
+JOBS = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def sniff_encoding(path):
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    return 'utf-8'
+
+
+def csv_format(path):
+    """(encoding, delimiter) of a CSV: from its ingestion metadata, else BOM sniffing and a comma"""
+    meta = read_meta(path)
+    if meta is not None:
+        return meta['encoding'], meta['delimiter']
+    return sniff_encoding(path), ','
+
+
+class ScoringJob:
+    def __init__(self, path, model, encoder, chunk_rows=SCORE_CHUNK_ROWS):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.model = model
+        self.encoder = encoder
+        self.chunk_rows = chunk_rows
+        self.status = 'queued'
+        self.error = None
+        self.rows = 0
+        self.bytes_total = os.path.getsize(path)
+        self.bytes_read = 0
+        self.counts = {}
+        self.started = None
+        self.finished = None
+        self.output = None
+        self.encoding = None
+        self.delimiter = None
+        self.usecols = None
+        self.dtypes = None
+
+    def prepare(self):
+        """Pick encoding, columns and dtypes; ValueError if nothing in the file is usable"""
+        self.encoding, self.delimiter = csv_format(self.path)
+        sample = pd.read_csv(self.path, nrows=DTYPE_SAMPLE_ROWS, dtype=str, encoding=self.encoding,
+                             sep=self.delimiter)
+        self.usecols, self.dtypes = [], {}
+        for column in sample.columns:
+            if column in self.encoder.layout.index:
+                values = sample[column].dropna()
+                numeric = pd.to_numeric(values, errors='coerce').notna().all()
+                # Text in a numeric feature is coerced to 0 by the encoder
+                self.dtypes[column] = np.float32 if numeric else str
+            elif column in self.encoder.vocab:
+                self.dtypes[column] = str
+            else:
+                continue
+            self.usecols.append(column)
+        if not self.usecols:
+            raise ValueError('No valid features found in uploaded file.')
+        return self
+
+    def _reader(self, f, skip):
+        f.seek(0)
+        return pd.read_csv(f, usecols=self.usecols, dtype=self.dtypes, encoding=self.encoding, sep=self.delimiter,
+                           chunksize=self.chunk_rows, skiprows=range(1, skip + 1) if skip else None)
+
+    def chunks(self):
+        """Score the file chunk by chunk, yielding (first_row, predictions)"""
+        if self.usecols is None:
+            self.prepare()
+        self.status = 'running'
+        self.started = time.time()
+        try:
+            with open(self.path, 'rb') as f:
+                reader = self._reader(f, 0)
+                while True:
+                    try:
+                        chunk = next(reader)
+                    except StopIteration:
+                        break
+                    except ValueError:
+                        if all(dtype is str for dtype in self.dtypes.values()):
+                            raise
+                        # A numeric-looking column turned out to hold text
+                        # past the sample: re-read the rest as text
+                        self.dtypes = {column: str for column in self.dtypes}
+                        reader = self._reader(f, self.rows)
+                        continue
+                    preds = self.model.predict(self.encoder.frame(self.encoder.transform(chunk)))
+                    first = self.rows
+                    self.rows += len(preds)
+                    self.bytes_read = f.tell()
+                    labels, counts = np.unique(preds.astype(str), return_counts=True)
+                    for label, n in zip(labels, counts):
+                        self.counts[str(label)] = self.counts.get(str(label), 0) + int(n)
+                    yield first, preds
+            self.bytes_read = self.bytes_total
+            self.status = 'done'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            logger.error(f'Scoring job {self.id} failed: {e}')
+            raise
+        finally:
+            self.finished = time.time()
+
+    def ndjson(self, on_threats=None):
+        """One JSON line per row, then a summary line; for a streaming response"""
+        yield json.dumps({'job': self.id, 'columns': self.usecols}) + '\n'
+        try:
+            for first, preds in self.chunks():
+                preds = preds.astype(str)
+                malicious = np.flatnonzero(preds == 'Malicious')
+                if on_threats is not None and len(malicious):
+                    on_threats(first + malicious)
+                threat = np.zeros(len(preds), dtype=bool)
+                threat[malicious] = True
+                yield ''.join(
+                    json.dumps({'row': first + i, 'prediction': p, 'threat': True} if t
+                               else {'row': first + i, 'prediction': p}) + '\n'
+                    for i, (p, t) in enumerate(zip(preds.tolist(), threat.tolist()))
+                )
+        except Exception:
+            yield json.dumps({'error': self.error}) + '\n'
+            return
+        yield json.dumps({'done': True, **self.progress()}) + '\n'
+
+    def run_to_file(self, results_dir=RESULTS_DIR):
+        """Write row,prediction to a results CSV (run in a background thread)"""
+        os.makedirs(results_dir, exist_ok=True)
+        self.output = os.path.join(results_dir, f'{self.id}.csv')
+        try:
+            with open(self.output, 'w', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow(['row', 'prediction'])
+                for first, preds in self.chunks():
+                    writer.writerows(zip(range(first, first + len(preds)), preds.astype(str).tolist()))
+        except Exception:
+            pass  # recorded in status/error by chunks()
+
+    def start(self):
+        threading.Thread(target=self.run_to_file, name=f'scoring-{self.id}', daemon=True).start()
+        return self
+
+    def progress(self):
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            'id': self.id,
+            'status': self.status,
+            'file': os.path.basename(self.path),
+            'rows': self.rows,
+            'bytes_read': self.bytes_read,
+            'bytes_total': self.bytes_total,
+            'percent': round(100.0 * self.bytes_read / max(self.bytes_total, 1), 1),
+            'elapsed_seconds': round(elapsed, 2),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            'counts': self.counts,
+            'error': self.error,
+            'results': self.output is not None and self.status == 'done',
+        }
+
+
+def register(job):
+    with _jobs_lock:
+        JOBS[job.id] = job
+        # Forget the oldest jobs that are no longer running
+        for old_id in [i for i, j in JOBS.items() if j.status not in ('queued', 'running')]:
+            if len(JOBS) <= MAX_JOBS:
+                break
+            del JOBS[old_id]
+    return job
+
+
+def get_job(job_id):
+    return JOBS.get(job_id)
@@ -0,0 +1,257 @@
+"""
+Multi-process capture/inference pipeline for PDMS
+A dissection process runs pyshark and writes compact packet records into a
+shared-memory ring buffer; N scoring worker processes score batches of slots
+with the model version's compiled forest, memory-mapped read-only from the
+registry so the workers share its pages; a merge thread in the API process
+feeds the results into the same live_predictions / forensic log / alert path
+used by the threaded capture_loop.
+
+Slots circulate through three queues carrying only integers:
+    free -> (dissector) -> ready -> (workers) -> results -> (merger) -> free
+"""
+
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+REGISTRY_DIR = 'model_registry'
+
+RING_SLOTS = 16384
+WORKER_BATCH = 256
+
+# Fixed-width packet metadata stored next to each feature row
+META_DTYPE = np.dtype([
+    ('src', 'S46'),
+    ('dst', 'S46'),
+    ('protocol', 'S8'),
+    ('length', np.int32),
+    ('timestamp', np.float64),
+])
+
+# Indices into the shared counter array
+CAPTURED, DROPPED_RING_FULL, SKIPPED, MERGED = range(4)
+COUNTER_NAMES = ['captured', 'dropped_ring_full', 'skipped', 'merged']
+
+
+def _attach(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _dissect(spec, free_q, ready_q, counters, stop, registry_dir, model_version):
+    """Dissection process: pyshark -> shared ring"""
+    # Imported here so scoring workers never pay for pyshark/capture setup.
+    # packet_features has no import-time side effects: the API process's
+    # model, forensic log and alert system are not recreated here.
+    from model_registry import ModelRegistry
+    from packet_features import PacketFeatures, open_live_capture
+
+    registry = ModelRegistry(registry_dir)
+    feature_list = registry.manifest(model_version or registry.current())['features']
+    if len(feature_list) != spec['width']:
+        print(f"[PIPELINE] Model has {len(feature_list)} features, ring rows have {spec['width']}; dissector exiting")
+        return
+    extract_features = PacketFeatures(feature_list).extract
+    capture = open_live_capture()
+    if capture is None:
+        print("[PIPELINE] Live capture not initialized, dissector exiting")
+        return
+    feat_shm, features = _attach(spec['features'], (spec['slots'], spec['width']), np.float32)
+    meta_shm, meta = _attach(spec['meta'], (spec['slots'],), META_DTYPE)
+    try:
+        for packet in capture.sniff_continuously():
+            if stop.is_set():
+                break
+            counters[CAPTURED] += 1
+            try:
+                slot = free_q.get_nowait()
+            except queue.Empty:
+                # Scoring is behind and every slot is in flight
+                counters[DROPPED_RING_FULL] += 1
+                continue
+            info = extract_features(packet, features[slot])
+            if info is None:
+                counters[SKIPPED] += 1
+                free_q.put(slot)
+                continue
+            src, dst, proto, length = info
+            meta[slot] = (src, dst, str(proto), length, time.time())
+            ready_q.put(slot)
+    finally:
+        del features, meta
+        feat_shm.close()
+        meta_shm.close()
+
+
+def _score(worker_id, spec, ready_q, results_q, scored, stop, registry_dir, model_version):
+    """Scoring worker process: shared ring slots -> predictions"""
+    import pandas as pd
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry(registry_dir)
+    forest = registry.load_forest(model_version)
+    model = names = None
+    if forest is None:
+        # Not a random forest: each worker unpickles its own copy of the model
+        model, names, _ = registry.load_model(model_version)
+    feat_shm, features = _attach(spec['features'], (spec['slots'], spec['width']), np.float32)
+    try:
+        while not stop.is_set():
+            try:
+                slots = [ready_q.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(slots) < spec['batch']:
+                try:
+                    slots.append(ready_q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if forest is not None:
+                    preds = [str(p) for p in forest.predict(features[slots])]
+                else:
+                    X = pd.DataFrame(features[slots], columns=names, copy=False)
+                    preds = [str(p) for p in model.predict(X)]
+            except Exception as e:
+                print(f"[PIPELINE] Worker {worker_id} prediction error: {e}")
+                preds = ["Error"] * len(slots)
+            results_q.put((slots, preds))
+            scored[worker_id] += len(slots)
+    finally:
+        del features
+        feat_shm.close()
+
+
+class CapturePipeline:
+    """Owns the shared ring, the dissector and worker processes and the merger"""
+
+    def __init__(self, handler, width, workers=2, slots=RING_SLOTS, batch=WORKER_BATCH,
+                 registry_dir=REGISTRY_DIR, model_version=None):
+        self.handler = handler
+        self.width = width
+        self.n_workers = workers
+        self.slots = slots
+        self.batch = batch
+        self.registry_dir = registry_dir
+        # Must match the layout the dissector writes (width); None = current
+        self.model_version = model_version
+        # Spawn on every platform: fork would copy the API process's threads.
+        # Spawned processes re-import the main module, so start the pipeline
+        # from an import-light entry point (server.py), not from app.py.
+        self.ctx = mp.get_context('spawn')
+        self.free_q = self.ctx.Queue()
+        self.ready_q = self.ctx.Queue()
+        self.results_q = self.ctx.Queue()
+        self.counters = self.ctx.Array('q', len(COUNTER_NAMES), lock=False)
+        self.scored = self.ctx.Array('q', workers, lock=False)
+        self.stop_event = self.ctx.Event()
+        self.processes = []
+        self.merger = None
+        self.started_at = None
+        self._feat_shm = shared_memory.SharedMemory(create=True, size=max(1, slots * width * 4))
+        self._meta_shm = shared_memory.SharedMemory(create=True, size=slots * META_DTYPE.itemsize)
+        self.meta = np.ndarray((slots,), dtype=META_DTYPE, buffer=self._meta_shm.buf)
+
+    def spec(self):
+        return {
+            'features': self._feat_shm.name,
+            'meta': self._meta_shm.name,
+            'slots': self.slots,
+            'width': self.width,
+            'batch': self.batch,
+        }
+
+    def start(self):
+        for slot in range(self.slots):
+            self.free_q.put(slot)
+        spec = self.spec()
+        dissector = self.ctx.Process(target=_dissect, name='pdms-dissector', daemon=True,
+                                     args=(spec, self.free_q, self.ready_q, self.counters, self.stop_event,
+                                           self.registry_dir, self.model_version))
+        self.processes.append(dissector)
+        for i in range(self.n_workers):
+            self.processes.append(self.ctx.Process(
+                target=_score, name=f'pdms-scorer-{i}', daemon=True,
+                args=(i, spec, self.ready_q, self.results_q, self.scored, self.stop_event,
+                      self.registry_dir, self.model_version)))
+        for p in self.processes:
+            p.start()
+        self.merger = threading.Thread(target=self._merge, daemon=True)
+        self.merger.start()
+        self.started_at = time.time()
+        print(f"[PIPELINE] Started dissector and {self.n_workers} scoring workers ({self.slots} ring slots)")
+        return self
+
+    def _merge(self):
+        while not self.stop_event.is_set():
+            try:
+                slots, preds = self.results_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            for slot, prediction in zip(slots, preds):
+                rec = self.meta[slot]
+                info = (rec['src'].decode(), rec['dst'].decode(), rec['protocol'].decode(), int(rec['length']))
+                timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(rec['timestamp']))
+                # Copied out of the ring; the slot can be reused now
+                self.free_q.put(slot)
+                try:
+                    self.handler(info, timestamp, prediction)
+                except Exception as e:
+                    print(f"[PIPELINE] Error handling prediction: {e}")
+                self.counters[MERGED] += 1
+
+    def stop(self):
+        """Stop the processes and merger and free the shared ring; safe to call twice"""
+        if self._feat_shm is None:
+            return
+        self.stop_event.set()
+        for p in self.processes:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+        if self.merger is not None:
+            self.merger.join(timeout=2)
+        # Slot numbers still buffered for a pipe nobody reads would block exit
+        for q in (self.free_q, self.ready_q, self.results_q):
+            q.cancel_join_thread()
+            q.close()
+        del self.meta
+        self._feat_shm.close()
+        self._feat_shm.unlink()
+        self._meta_shm.close()
+        self._meta_shm.unlink()
+        self._feat_shm = self._meta_shm = None
+
+    def stats(self):
+        """Per-stage queue depths and drop counters"""
+        def depth(q):
+            try:
+                return q.qsize()
+            except NotImplementedError:  # macOS
+                return None
+
+        counters = {name: self.counters[i] for i, name in enumerate(COUNTER_NAMES)}
+        scored = list(self.scored)
+        counters['scored'] = sum(scored)
+        uptime = time.time() - self.started_at if self.started_at else 0
+        return {
+            'mode': 'pipeline',
+            'workers': self.n_workers,
+            'ring_slots': self.slots,
+            'uptime_seconds': round(uptime, 1),
+            'queue_depth': {
+                # Dissected, waiting for a scoring worker
+                'awaiting_scoring': depth(self.ready_q),
+                # Scored, waiting for the merge thread
+                'awaiting_merge': depth(self.results_q),
+                'free_slots': depth(self.free_q),
+            },
+            'counters': counters,
+            'scored_per_worker': scored,
+            'processes_alive': {p.name: p.is_alive() for p in self.processes},
+        }
@@ -0,0 +1,259 @@
+"""
+Out-of-core model training for PDMS
+Trains on CSVs (or Parquet copies of them) far larger than memory in two
+passes over fixed-size chunks:
+
+1. scan: reads every column as text, decides which columns are numeric and
+   which are categorical, collects each categorical column's vocabulary and
+   counts the rows of every class. The one-hot feature list is fixed from the
+   whole file, not from whichever rows happened to come first.
+2. sample: re-reads only the usable columns with explicit dtypes, encodes
+   each chunk with a FeatureEncoder over that feature list and keeps a
+   stratified reservoir sample of about ``max_rows`` rows (every row when
+   the file is smaller than that), each class sampled in proportion to its
+   share of the file.
+
+The forest is then built with ``n_jobs=-1``; sklearn fits trees on threads
+that share the float32 sample, so peak memory is the sample plus one chunk
+whatever the size of the file. The encoded sample and schema are kept in the
+preprocess cache, so training again on the same file skips both passes.
+"""
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import csv_format
+from feature_layout import FeatureEncoder
+from preprocess_cache import PreprocessCache
+
+logger = logging.getLogger(__name__)
+
+TRAIN_CHUNK_ROWS = 100000
+# Rows kept for fitting; the rest of the file is sampled down to this
+TRAIN_MAX_ROWS = int(os.environ.get('PDMS_TRAIN_MAX_ROWS', 1000000))
+# Text columns with more distinct values than this (addresses, timestamps,
+# flow ids) are dropped instead of being one-hot encoded
+MAX_CATEGORIES = 100
+# Smallest sample kept for a rare class, so downsampling never erases it
+MIN_CLASS_ROWS = 1000
+N_ESTIMATORS = 20
+RANDOM_STATE = 42
+
+
+def find_label_column(columns):
+    """The 'label' column (any case/padding), else the last column"""
+    for col in columns:
+        if col.strip().lower() == 'label':
+            return col
+    logger.warning('Training: No "Label" column found, using last column as label.')
+    return columns[-1]
+
+
+class TrainingSchema:
+    """Column roles, categorical vocabularies and class counts from the scan pass"""
+
+    def __init__(self, label, numeric, categorical, dropped, class_counts, rows, encoding, delimiter=','):
+        self.label = label
+        self.numeric = numeric
+        # column -> sorted vocabulary, in file column order
+        self.categorical = categorical
+        self.dropped = dropped
+        self.class_counts = class_counts
+        self.rows = rows
+        self.encoding = encoding
+        self.delimiter = delimiter
+
+    @property
+    def feature_list(self):
+        """Same names and order as pd.get_dummies: numeric columns, then one column per category"""
+        names = list(self.numeric)
+        for column, values in self.categorical.items():
+            names.extend(f'{column}_{value}' for value in values)
+        return names
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @property
+    def dtypes(self):
+        dtypes = {column: np.float32 for column in self.numeric}
+        dtypes.update({column: str for column in self.categorical})
+        dtypes[self.label] = str
+        return dtypes
+
+
+def read_chunks(path, chunk_rows, columns=None, dtype=None, encoding=None, sep=','):
+    """DataFrames of up to chunk_rows rows from a CSV, or from a Parquet file (which is already typed)"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, usecols=columns, dtype=dtype, encoding=encoding, sep=sep, chunksize=chunk_rows)
+
+
+def scan(path, chunk_rows=TRAIN_CHUNK_ROWS):
+    """First pass: column roles, vocabularies and class counts for a CSV or Parquet file"""
+    encoding, delimiter = csv_format(path)
+    columns, label = None, None
+    has_text, distinct, overflow = {}, {}, set()
+    class_counts = {}
+    rows = 0
+    for chunk in read_chunks(path, chunk_rows, dtype=str, encoding=encoding, sep=delimiter):
+        if columns is None:
+            columns = list(chunk.columns)
+            label = find_label_column(columns)
+            has_text = {column: False for column in columns if column != label}
+        y = chunk[label].dropna().astype(str)
+        for value, n in y.value_counts().items():
+            class_counts[value] = class_counts.get(value, 0) + int(n)
+        for column in has_text:
+            values = chunk[column].dropna()
+            if not has_text[column]:
+                has_text[column] = bool(pd.to_numeric(values, errors='coerce').isna().any())
+            if column not in overflow:
+                seen = distinct.setdefault(column, set())
+                seen.update(values.unique())
+                if len(seen) > MAX_CATEGORIES:
+                    overflow.add(column)
+                    del distinct[column]
+        rows += len(chunk)
+    if columns is None:
+        raise ValueError('Training data is empty.')
+    numeric, categorical, dropped = [], {}, []
+    for column, text in has_text.items():
+        if not text:
+            numeric.append(column)
+        elif column in overflow:
+            dropped.append(column)
+        else:
+            categorical[column] = sorted(distinct[column])
+    if dropped:
+        logger.warning(f'Training: dropping high-cardinality text columns: {dropped}')
+    if len(class_counts) < 2:
+        raise ValueError(f'Training data needs at least two classes, found {list(class_counts)}')
+    return TrainingSchema(label, numeric, categorical, dropped, class_counts, rows, encoding, delimiter)
+
+
+def class_allocation(class_counts, max_rows):
+    """Rows to keep per class: all of them if they fit, else a proportional share"""
+    total = sum(class_counts.values())
+    if total <= max_rows:
+        return dict(class_counts)
+    return {label: min(n, max(int(max_rows * n / total), MIN_CLASS_ROWS))
+            for label, n in class_counts.items()}
+
+
+class StratifiedReservoir:
+    """One uniform reservoir sample (algorithm R) per class in a single float32 buffer"""
+
+    def __init__(self, capacities, width, seed=RANDOM_STATE):
+        self.labels = list(capacities)
+        self.capacity = np.array([capacities[label] for label in self.labels], dtype=np.int64)
+        self.offset = np.concatenate(([0], np.cumsum(self.capacity)[:-1]))
+        self.seen = np.zeros(len(self.labels), dtype=np.int64)
+        self.X = np.zeros((int(self.capacity.sum()), width), dtype=np.float32)
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, X, y):
+        for code, label in enumerate(self.labels):
+            rows = X[y == label]
+            if not len(rows):
+                continue
+            k, seen, base = self.capacity[code], self.seen[code], self.offset[code]
+            # Stream positions of these rows within their class
+            position = np.arange(seen, seen + len(rows))
+            fill = position < k
+            self.X[base + position[fill]] = rows[fill]
+            # Row at position i replaces a random slot with probability k / (i + 1)
+            slot = self.rng.integers(0, position[~fill] + 1) if (~fill).any() else np.empty(0, dtype=np.int64)
+            keep = np.flatnonzero(slot < k)
+            if len(keep):
+                # Later rows win when two land on the same slot, as in the sequential algorithm
+                slots, last = np.unique(slot[keep][::-1], return_index=True)
+                src = np.flatnonzero(~fill)[keep[len(keep) - 1 - last]]
+                self.X[base + slots] = rows[src]
+            self.seen[code] += len(rows)
+
+    def sample(self):
+        """(X, y) of the rows kept so far"""
+        kept = np.minimum(self.seen, self.capacity)
+        index = np.concatenate([np.arange(o, o + n) for o, n in zip(self.offset, kept)])
+        y = np.repeat(np.array(self.labels, dtype=object), kept)
+        X = self.X if len(index) == len(self.X) else self.X[index]
+        return X, y
+
+
+def sample(path, schema, max_rows=TRAIN_MAX_ROWS, chunk_rows=TRAIN_CHUNK_ROWS, seed=RANDOM_STATE):
+    """Second pass: encoded, stratified sample of at most ~max_rows rows"""
+    encoder = FeatureEncoder.from_names(schema.feature_list)
+    reservoir = StratifiedReservoir(class_allocation(schema.class_counts, max_rows),
+                                    encoder.layout.width, seed=seed)
+    limit = np.finfo(np.float32).max
+    dtypes = schema.dtypes
+    for chunk in read_chunks(path, chunk_rows, columns=list(dtypes), dtype=dtypes, encoding=schema.encoding,
+                             sep=schema.delimiter):
+        chunk = chunk[chunk[schema.label].notna()]
+        X = encoder.transform(chunk.drop(columns=[schema.label]))
+        # 'Infinity' rates (CICIDS2017) parse as inf, which the forest rejects
+        np.clip(X, -limit, limit, out=X)
+        reservoir.add(X, chunk[schema.label].astype(str).to_numpy())
+    return reservoir.sample()
+
+
+def prepare(path, max_rows=TRAIN_MAX_ROWS, chunk_rows=TRAIN_CHUNK_ROWS, cache=None):
+    """(X, y, schema) for a CSV: both passes, or a preprocess cache hit for the same file and settings"""
+    config = {'max_rows': max_rows, 'chunk_rows': chunk_rows, 'max_categories': MAX_CATEGORIES,
+              'min_class_rows': MIN_CLASS_ROWS, 'seed': RANDOM_STATE}
+    key = cache.key(path, config) if cache is not None else None
+    hit = cache.get(key) if key else None
+    if hit is not None:
+        X, y, meta = hit
+        logger.info(f'Training: preprocessed data for {path} loaded from cache')
+        return X, y, TrainingSchema.from_dict(meta)
+    schema = scan(path, chunk_rows)
+    logger.info(f'Training: {schema.rows} rows, {len(schema.feature_list)} features, label {schema.label!r}, '
+                f'classes {schema.class_counts}')
+    X, y = sample(path, schema, max_rows, chunk_rows)
+    if key:
+        cache.put(key, X, y, schema.to_dict())
+    return X, y, schema
+
+
+def train(path, max_rows=TRAIN_MAX_ROWS, chunk_rows=TRAIN_CHUNK_ROWS, n_estimators=N_ESTIMATORS, n_jobs=-1,
+          test_size=0.2, use_cache=True):
+    """Prepare the data and fit a RandomForestClassifier; returns (model, feature_list, metrics)"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+    from sklearn.model_selection import train_test_split
+
+    X, y, schema = prepare(path, max_rows, chunk_rows, PreprocessCache() if use_cache else None)
+    feature_list = schema.feature_list
+    logger.info(f'Training: fitting on a sample of {len(X)} rows')
+    # Stratifying needs at least two rows of every class
+    stratify = y if np.unique(y, return_counts=True)[1].min() >= 2 else None
+    if stratify is None:
+        logger.warning('Training: a class has a single row in the sample; splitting without stratification')
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=RANDOM_STATE,
+                                                        stratify=stratify)
+    del X
+    clf = RandomForestClassifier(n_estimators=n_estimators, n_jobs=n_jobs, random_state=RANDOM_STATE)
+    # Wrapped without copying so the model records its feature names, as when fitted on get_dummies output
+    clf.fit(pd.DataFrame(X_train, columns=feature_list, copy=False), y_train)
+    y_pred = clf.predict(pd.DataFrame(X_test, columns=feature_list, copy=False))
+    metrics = {
+        'accuracy': accuracy_score(y_test, y_pred),
+        'precision': precision_score(y_test, y_pred, average='macro', zero_division=0),
+        'recall': recall_score(y_test, y_pred, average='macro', zero_division=0),
+        'f1_score': f1_score(y_test, y_pred, average='macro', zero_division=0),
+        'rows_total': schema.rows,
+        'rows_sampled': len(y_train) + len(y_test),
+    }
+    return clf, feature_list, metrics
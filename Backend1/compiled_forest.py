@@ -0,0 +1,183 @@
+"""
+Compiled random forest for low-latency scoring
+Flattens every tree of a fitted RandomForestClassifier into shared NumPy
+arrays (split feature, threshold, children, missing-value direction, leaf
+class probabilities) and walks all trees for all rows together with a few
+vectorized gathers per tree level. Skips sklearn's per-call input validation
+and joblib dispatch over the estimators, which dominate the cost of scoring a
+single packet.
+
+Predictions match RandomForestClassifier.predict: rows are compared as
+float32 against float64 thresholds, leaf probabilities are summed in
+estimator order and divided by the number of trees before the argmax.
+(With n_jobs > 1 sklearn itself sums the trees in whatever order its threads
+finish, which can flip exact ties.)
+
+    python compiled_forest.py export [model.joblib] [forest.npz]
+    python compiled_forest.py bench [model.joblib] [features.txt]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'missing_left', 'value', 'roots', 'classes')
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, classes, depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.n_trees = len(roots)
+        # Steps needed for the deepest tree; leaves point at themselves
+        self.depth = int(depth)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted single-output RandomForestClassifier"""
+        trees = [est.tree_ for est in model.estimators_]
+        sizes = [t.node_count for t in trees]
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.intp)
+        feature, threshold, left, right, missing_left, value = [], [], [], [], [], []
+        for t, offset in zip(trees, offsets):
+            ids = np.arange(t.node_count, dtype=np.intp) + offset
+            is_leaf = t.children_left == -1
+            feature.append(np.where(is_leaf, 0, t.feature).astype(np.intp))
+            threshold.append(np.where(is_leaf, np.inf, t.threshold))
+            left.append(np.where(is_leaf, ids, t.children_left + offset))
+            right.append(np.where(is_leaf, ids, t.children_right + offset))
+            missing = getattr(t, 'missing_go_to_left', None)
+            missing_left.append(np.zeros(t.node_count, dtype=bool) if missing is None else missing.astype(bool))
+            v = np.asarray(t.value[:, 0, :], dtype=np.float64)
+            totals = v.sum(axis=1)
+            if not np.allclose(totals[totals > 0], 1.0):
+                # Older sklearn stores class counts; predict_proba normalizes them
+                totals[totals == 0.0] = 1.0
+                v = v / totals[:, None]
+            value.append(v)
+        return cls(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+                   np.concatenate(right), np.concatenate(missing_left), np.concatenate(value),
+                   offsets, np.asarray(model.classes_), max(t.max_depth for t in trees))
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in ARRAYS}
+        if self.classes.dtype == object:
+            # String labels: stored as a fixed-width array so loading needs no pickle
+            arrays['classes'] = self.classes.astype(str)
+        np.savez(path, depth=self.depth, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in ARRAYS}
+            return cls(depth=int(data['depth']), **arrays)
+
+    def save_arrays(self, directory):
+        """One .npy file per array, so they can be memory-mapped (see load_arrays)"""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            array = getattr(self, name)
+            np.save(os.path.join(directory, f'{name}.npy'), array.astype(str) if array.dtype == object else array)
+        np.save(os.path.join(directory, 'depth.npy'), np.array(self.depth))
+
+    @classmethod
+    def load_arrays(cls, directory, mmap_mode='r'):
+        """Forest saved by save_arrays; read-only memory maps share their pages between processes"""
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in ARRAYS}
+        return cls(depth=int(np.load(os.path.join(directory, 'depth.npy'))), **arrays)
+
+    def apply(self, X):
+        """Leaf node (flat index) reached by each row in each tree: (n_rows, n_trees)"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n = X.shape[0]
+        rows = np.repeat(np.arange(n, dtype=np.intp), self.n_trees)
+        node = np.tile(self.roots, n)
+        for _ in range(self.depth):
+            x = X[rows, self.feature[node]]
+            # Same test as sklearn: NaN follows missing_go_to_left, else x <= threshold
+            go_left = np.where(np.isnan(x), self.missing_left[node], x <= self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node.reshape(n, self.n_trees)
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for t in range(self.n_trees):
+            proba += self.value[leaves[:, t]]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def compile_model(model):
+    """CompiledForest for a fitted RandomForestClassifier, or None if the model is something else"""
+    try:
+        from sklearn.ensemble import RandomForestClassifier
+        if not isinstance(model, RandomForestClassifier) or model.n_outputs_ != 1:
+            return None
+        return CompiledForest.from_sklearn(model)
+    except Exception as e:
+        print(f"Could not compile model: {e}")
+        return None
+
+
+def benchmark(model, n_features, repeats=200, batch=256, seed=0):
+    """Per-call latency of MODEL.predict vs the compiled forest, single row and batch"""
+    import pandas as pd
+    forest = CompiledForest.from_sklearn(model)
+    names = getattr(model, 'feature_names_in_', None)
+    rng = np.random.default_rng(seed)
+    # KDD-like rows: small counts, rates in [0, 1], a few large byte counts
+    X = rng.integers(0, 3, size=(max(batch, repeats), n_features)).astype(np.float32)
+    X[:, :3] = rng.integers(0, 5000, size=(len(X), 3))
+    X[:, 10:30] = rng.random((len(X), 20))
+
+    def frame(a):
+        return pd.DataFrame(a, columns=names, copy=False) if names is not None else a
+
+    assert (model.predict(frame(X)) == forest.predict(X)).all(), 'compiled forest disagrees with sklearn'
+    results = {}
+    for label, rows in (('single row', 1), (f'batch of {batch}', batch)):
+        timings = {}
+        for name, fn in (('sklearn', lambda a: model.predict(frame(a))), ('compiled', forest.predict)):
+            fn(X[:rows])
+            start = time.perf_counter()
+            for i in range(repeats):
+                fn(X[i:i + rows] if rows == 1 else X[:rows])
+            timings[name] = (time.perf_counter() - start) / repeats
+        results[label] = timings
+        print(f"{label:>14}: sklearn {timings['sklearn'] * 1e3:8.3f} ms   compiled {timings['compiled'] * 1e3:8.3f} ms"
+              f"   speed-up x{timings['sklearn'] / timings['compiled']:.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    import joblib
+    command = sys.argv[1] if len(sys.argv) > 1 else 'bench'
+    model_path = sys.argv[2] if len(sys.argv) > 2 else 'rf_model.joblib'
+    model = joblib.load(model_path)
+    if command == 'export':
+        out = sys.argv[3] if len(sys.argv) > 3 else 'rf_forest.npz'
+        forest = CompiledForest.from_sklearn(model)
+        forest.save(out)
+        print(f"Exported {forest.n_trees} trees ({len(forest.feature)} nodes, depth {forest.depth}) to {out}")
+    elif command == 'bench':
+        features_path = sys.argv[3] if len(sys.argv) > 3 else 'features.txt'
+        with open(features_path) as f:
+            n_features = len([line for line in f if line.strip()])
+        benchmark(model, n_features)
+    else:
+        print('usage: python compiled_forest.py export|bench [model.joblib] [forest.npz|features.txt]')
@@ -0,0 +1,143 @@
+"""
+On-demand SHAP explanation service for PDMS
+/predict hands the rows that need an explanation to a small worker pool and
+returns straight away. Each row is explained only for the class the model
+actually predicted for it; finished explanations go to an LRU cache (and to a
+callback, e.g. the prediction history) keyed by prediction id, where
+GET /explanations/<id> picks them up.
+
+At most MAX_PENDING rows wait for a worker. A /predict batch that would go
+past that is not queued (each queued batch holds a copy of its rows); its
+ids report 'skipped' instead.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_WORKERS = 2
+EXPLANATION_CACHE_SIZE = 10000
+MAX_PENDING = 10000
+# Which /predict rows get explained: 'malicious', 'all' or 'none'
+DEFAULT_EXPLAIN = 'malicious'
+EXPLAIN_MODES = ('malicious', 'all', 'none')
+
+
+def class_contributions(shap_values, class_index):
+    """Per-row SHAP vectors for each row's own class, from any shap output layout"""
+    rows = np.arange(len(class_index))
+    if isinstance(shap_values, list):
+        # Older shap: one (n_rows, n_features) array per class
+        stacked = np.stack([np.asarray(v) for v in shap_values], axis=-1)
+        return stacked[rows, :, class_index]
+    values = np.asarray(shap_values)
+    if values.ndim == 3:
+        # Newer shap: (n_rows, n_features, n_classes)
+        return values[rows, :, class_index]
+    # Single-output models explain the positive class only
+    return values
+
+
+# Cache entry of a row that was not queued because MAX_PENDING rows were waiting
+SKIPPED = 'skipped'
+
+
+class ExplanationService:
+    def __init__(self, workers=EXPLAIN_WORKERS, cache_size=EXPLANATION_CACHE_SIZE, on_result=None,
+                 max_pending=MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shap')
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self.on_result = on_result
+        # pid -> (SHAP vector, None if explaining it failed or SKIPPED, feature names)
+        self._cache = OrderedDict()
+        self._pending = set()
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def submit(self, ids, X, predictions, bundle, mode=DEFAULT_EXPLAIN):
+        """Queue explanations for the rows selected by ``mode``; returns (queued ids, skipped ids)
+
+        ``bundle`` is the ModelBundle that produced ``predictions``; its
+        explainer is built on a worker thread the first time it is needed.
+        """
+        if bundle is None or mode == 'none':
+            return [], []
+        predictions = [str(p) for p in predictions]
+        rows = [i for i, p in enumerate(predictions) if mode == 'all' or p == 'Malicious']
+        if not rows:
+            return [], []
+        queued = [ids[i] for i in rows]
+        with self._lock:
+            if len(self._pending) + len(queued) > self.max_pending:
+                # SHAP is behind: do not pile up more rows in memory
+                self._store([(pid, SKIPPED, None) for pid in queued])
+                self.skipped += len(queued)
+                return [], queued
+            self._pending.update(queued)
+        class_codes = {str(c): i for i, c in enumerate(bundle.classes)}
+        class_index = np.array([class_codes.get(predictions[i], 0) for i in rows], dtype=np.intp)
+        X_rows = X.iloc[rows] if hasattr(X, 'iloc') else X[rows]
+        self.executor.submit(self._explain, bundle, queued, X_rows, class_index)
+        return queued, []
+
+    def _store(self, entries):
+        """Cache (pid, vector, feature names) entries; call with the lock held"""
+        for pid, vector, feature_names in entries:
+            self._cache[pid] = (vector, feature_names)
+            self._cache.move_to_end(pid)
+            self._pending.discard(pid)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _explain(self, bundle, ids, X, class_index):
+        feature_names = bundle.feature_list
+        try:
+            values = class_contributions(bundle.explainer.shap_values(X), class_index).astype(np.float32)
+        except Exception as e:
+            logger.error(f'SHAP explanation failed for {len(ids)} rows: {e}')
+            values = [None] * len(ids)
+        with self._lock:
+            self._store([(pid, vector, feature_names) for pid, vector in zip(ids, values)])
+        if self.on_result is not None:
+            for pid, vector in zip(ids, values):
+                if vector is not None:
+                    self.on_result(pid, vector)
+
+    def status(self, pid):
+        with self._lock:
+            if pid in self._cache:
+                vector = self._cache[pid][0]
+                if vector is None:
+                    return 'failed'
+                return SKIPPED if vector is SKIPPED else 'ready'
+            if pid in self._pending:
+                return 'pending'
+        return None
+
+    def get(self, pid):
+        """Cached (SHAP vector, feature names) for a prediction id, or None"""
+        with self._lock:
+            if pid not in self._cache or self._cache[pid][0] is SKIPPED:
+                return None
+            self._cache.move_to_end(pid)
+            return self._cache[pid]
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self._cache), 'pending': len(self._pending), 'skipped': self.skipped}
+
+
+def top_k(vector, feature_names, k):
+    """The ``k`` features with the largest absolute contribution"""
+    vector = np.asarray(vector)
+    k = min(k, len(vector))
+    order = np.argpartition(-np.abs(vector), k - 1)[:k] if k > 0 else []
+    order = sorted(order, key=lambda i: -abs(vector[i]))
+    return [{'feature': feature_names[i] if i < len(feature_names) else str(i), 'value': float(vector[i])}
+            for i in order]
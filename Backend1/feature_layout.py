@@ -0,0 +1,99 @@
+"""
+Feature layout for PDMS
+Compiles the model's feature list (features.txt) once into a name -> column
+index map so packets can be written straight into rows of a reusable NumPy
+buffer instead of going through a per-packet dict and DataFrame.
+"""
+
+import numpy as np
+import pandas as pd
+
+FEATURES_PATH = 'features.txt'
+
+
+class FeatureLayout:
+    def __init__(self, feature_names, dtype=np.float32):
+        self.names = list(feature_names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.width = len(self.names)
+        self.dtype = dtype
+        # Default row copied into every fresh packet row
+        self.template = np.zeros(self.width, dtype=dtype)
+
+    @classmethod
+    def from_file(cls, path=FEATURES_PATH, dtype=np.float32):
+        """Compile a layout from a features.txt file (one feature per line)"""
+        with open(path) as f:
+            names = [line.strip() for line in f if line.strip()]
+        return cls(names, dtype=dtype)
+
+    def col(self, name):
+        """Column index of a feature, or None if the model does not use it"""
+        return self.index.get(name)
+
+    def one_hot(self, prefix, values):
+        """Map each categorical value to the column of its one-hot feature"""
+        return {value: self.index.get(f'{prefix}_{value}') for value in values}
+
+    def set_default(self, name, value):
+        """Set the value every fresh row starts with for a feature"""
+        i = self.index.get(name)
+        if i is not None:
+            self.template[i] = value
+
+    def new_buffer(self, rows):
+        """Allocate a (rows, width) buffer to be filled in place"""
+        return np.zeros((rows, self.width), dtype=self.dtype)
+
+    def reset_row(self, row):
+        """Reset a buffer row to the template values without allocating"""
+        row[:] = self.template
+
+
+class FeatureEncoder:
+    """Encodes raw records straight into a layout matrix.
+
+    Equivalent to ``pd.get_dummies(X).reindex(columns=names, fill_value=0)``
+    against the fixed vocabulary in features.txt, but built once at model
+    load: numeric columns are copied into their column and string columns
+    (protocol_type, service, flag, ...) are mapped value -> column offset and
+    set in one vectorized assignment per column.
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        # raw column -> (values, column offsets) for every "<column>_<value>"
+        # one-hot feature, split at each '_' exactly like get_dummies names them
+        vocab = {}
+        for name, i in layout.index.items():
+            for pos, ch in enumerate(name):
+                if ch == '_':
+                    vocab.setdefault(name[:pos], {})[name[pos + 1:]] = i
+        self.vocab = {column: (pd.Index(list(values)), np.array(list(values.values()), dtype=np.intp))
+                      for column, values in vocab.items()}
+
+    @classmethod
+    def from_names(cls, feature_names):
+        return cls(FeatureLayout(feature_names))
+
+    def transform(self, data):
+        """Encode a list of dicts (e.g. a JSON batch) or a DataFrame into a (n, width) matrix"""
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        X = self.layout.new_buffer(len(df))
+        for column, values in df.items():
+            is_text = values.dtype == object or pd.api.types.is_string_dtype(values.dtype)
+            col = self.layout.index.get(column)
+            if col is not None:
+                if is_text:
+                    values = pd.to_numeric(values, errors='coerce')
+                X[:, col] = values.fillna(0).to_numpy(dtype=np.float64)
+            elif is_text and column in self.vocab:
+                categories, offsets = self.vocab[column]
+                codes = categories.get_indexer(values)
+                hit = codes >= 0
+                X[np.flatnonzero(hit), offsets[codes[hit]]] = 1
+        return X
+
+    def frame(self, X):
+        """Wrap an encoded matrix (no copy) with the model's feature names"""
+        return pd.DataFrame(X, columns=self.layout.names, copy=False)
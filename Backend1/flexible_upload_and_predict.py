@@ -50,9 +50,15 @@ time.sleep(5)
 
 # 6. Trigger prediction on the uploaded dataset
 print("Requesting predictions on uploaded dataset...")
-predict_resp = requests.post(f"{BACKEND_URL}/predict_uploaded")
+predict_resp = requests.post(f"{BACKEND_URL}/predict_uploaded", stream=True)
 try:
-    pred_json = predict_resp.json()
+    # NDJSON: a header line, one line per row, then a summary line
+    lines = [json.loads(line) for line in predict_resp.iter_lines() if line]
+    pred_json = {
+        'columns': lines[0].get('columns'),
+        'results': [line for line in lines[1:] if 'row' in line],
+        'summary': lines[-1],
+    }
     print("Prediction response:", pred_json)
     with open("prediction_results.json", "w", encoding="utf-8") as f:
         json.dump(pred_json, f, indent=2)
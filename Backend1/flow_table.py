@@ -0,0 +1,331 @@
+"""
+Stateful flow table for PDMS
+Tracks connections by 5-tuple and maintains the KDD connection statistics
+incrementally, so each packet costs amortized O(1):
+
+- time window: connections started in the past TIME_WINDOW seconds
+  (count, srv_count, serror_rate, same_srv_rate, ...)
+- host window: the last HOST_WINDOW connections
+  (dst_host_count, dst_host_srv_count, dst_host_same_srv_rate, ...)
+
+Both windows keep running counters that are updated when a connection enters,
+leaves or changes state, so features are read in constant time.
+"""
+
+from collections import OrderedDict, deque
+
+TIME_WINDOW = 2.0          # seconds, KDD "same host/service" window
+HOST_WINDOW = 100          # connections, KDD "dst_host_*" window
+FLOW_IDLE_TIMEOUT = 60.0   # seconds without packets before a flow is evicted
+MAX_FLOWS = 100000
+
+# Rough per-flow footprint (connection object, table entry, window slots),
+# used to turn a memory cap into a flow cap
+BYTES_PER_FLOW = 1024
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# Destination port -> KDD service name
+PORT_SERVICES = {
+    7: 'echo', 9: 'discard', 11: 'systat', 13: 'daytime', 15: 'netstat',
+    20: 'ftp_data', 21: 'ftp', 22: 'ssh', 23: 'telnet', 25: 'smtp',
+    37: 'time', 43: 'whois', 53: 'domain', 70: 'gopher', 79: 'finger',
+    80: 'http', 102: 'iso_tsap', 105: 'csnet_ns', 109: 'pop_2', 110: 'pop_3',
+    111: 'sunrpc', 113: 'auth', 117: 'uucp_path', 119: 'nntp', 123: 'ntp_u',
+    137: 'netbios_ns', 138: 'netbios_dgm', 139: 'netbios_ssn', 143: 'imap4',
+    150: 'sql_net', 175: 'vmnet', 179: 'bgp', 210: 'Z39_50', 245: 'link',
+    389: 'ldap', 433: 'nnsp', 443: 'http_443', 512: 'exec', 513: 'login',
+    514: 'shell', 515: 'printer', 520: 'efs', 530: 'courier', 540: 'uucp',
+    543: 'klogin', 544: 'kshell', 1911: 'mtp', 6000: 'X11', 6667: 'IRC',
+}
+# ICMP type -> KDD service name
+ICMP_SERVICES = {0: 'ecr_i', 8: 'eco_i', 13: 'tim_i', 14: 'tim_i', 3: 'urp_i'}
+
+SERVICES = sorted(set(PORT_SERVICES.values()) | set(ICMP_SERVICES.values()) | {'domain_u', 'other', 'private'})
+FLAGS = ['OTH', 'REJ', 'RSTO', 'RSTOS0', 'RSTR', 'S0', 'S1', 'S2', 'S3', 'SF', 'SH']
+
+# Numeric features written by the flow table, in the order values() returns them
+FLOW_FEATURES = (
+    'duration', 'src_bytes', 'dst_bytes', 'land',
+    'count', 'srv_count', 'serror_rate', 'srv_serror_rate', 'rerror_rate',
+    'srv_rerror_rate', 'same_srv_rate', 'diff_srv_rate', 'srv_diff_host_rate',
+    'dst_host_count', 'dst_host_srv_count', 'dst_host_same_srv_rate',
+    'dst_host_diff_srv_rate', 'dst_host_same_src_port_rate',
+    'dst_host_srv_diff_host_rate', 'dst_host_serror_rate',
+    'dst_host_srv_serror_rate', 'dst_host_rerror_rate', 'dst_host_srv_rerror_rate',
+)
+
+
+def service_for(proto, port, icmp_type=None):
+    """KDD service name for a connection"""
+    if proto == 'ICMP':
+        return ICMP_SERVICES.get(icmp_type, 'urp_i')
+    if port == 53 and proto == 'UDP':
+        return 'domain_u'
+    service = PORT_SERVICES.get(port)
+    if service:
+        return service
+    return 'private' if port >= 49152 else 'other'
+
+
+def _inc(counter, key, delta):
+    value = counter.get(key, 0) + delta
+    if value:
+        counter[key] = value
+    else:
+        # Drop zero entries so counters stay bounded by the window size
+        counter.pop(key, None)
+
+
+class Connection:
+    __slots__ = ('key', 'src', 'dst', 'sport', 'dport', 'proto', 'service',
+                 'start', 'last', 'src_bytes', 'dst_bytes', 'flag',
+                 'serror', 'rerror', 'in_time', 'in_host')
+
+    def __init__(self, key, src, dst, sport, dport, proto, service, ts):
+        self.key = key
+        self.src = src
+        self.dst = dst
+        self.sport = sport
+        self.dport = dport
+        self.proto = proto
+        self.service = service
+        self.start = ts
+        self.last = ts
+        self.src_bytes = 0
+        self.dst_bytes = 0
+        self.flag = 'SF' if proto != 'TCP' else 'OTH'
+        self.serror = 0
+        self.rerror = 0
+        self.in_time = False
+        self.in_host = False
+
+
+class _Window:
+    """Connections plus running counters per dst host, service and pairs of them"""
+
+    def __init__(self, flag_attr):
+        self.flag_attr = flag_attr  # Connection attribute marking membership
+        self.conns = deque()
+        self.host = {}
+        self.srv = {}
+        self.host_srv = {}
+        self.host_sport = {}
+        self.host_serror = {}
+        self.host_rerror = {}
+        self.srv_serror = {}
+        self.srv_rerror = {}
+
+    def __len__(self):
+        return len(self.conns)
+
+    def _apply(self, c, delta):
+        _inc(self.host, c.dst, delta)
+        _inc(self.srv, c.service, delta)
+        _inc(self.host_srv, (c.dst, c.service), delta)
+        _inc(self.host_sport, (c.dst, c.sport), delta)
+        self._apply_errors(c, c.serror * delta, c.rerror * delta)
+
+    def _apply_errors(self, c, serror, rerror):
+        if serror:
+            _inc(self.host_serror, c.dst, serror)
+            _inc(self.srv_serror, c.service, serror)
+        if rerror:
+            _inc(self.host_rerror, c.dst, rerror)
+            _inc(self.srv_rerror, c.service, rerror)
+
+    def add(self, c):
+        self.conns.append(c)
+        setattr(c, self.flag_attr, True)
+        self._apply(c, 1)
+
+    def pop_oldest(self):
+        c = self.conns.popleft()
+        setattr(c, self.flag_attr, False)
+        self._apply(c, -1)
+
+    def update_errors(self, c, serror_delta, rerror_delta):
+        if getattr(c, self.flag_attr):
+            self._apply_errors(c, serror_delta, rerror_delta)
+
+
+def _rate(num, den):
+    return num / den if den else 0.0
+
+
+class FlowTable:
+    """Hash-indexed flow table with sliding KDD windows and a bounded footprint"""
+
+    def __init__(self, time_window=TIME_WINDOW, host_window=HOST_WINDOW,
+                 idle_timeout=FLOW_IDLE_TIMEOUT, max_flows=MAX_FLOWS):
+        self.time_window_secs = time_window
+        self.host_window_size = host_window
+        self.idle_timeout = idle_timeout
+        self.max_flows = max_flows
+        # Insertion order doubles as LRU order: active flows move to the end
+        self.flows = OrderedDict()
+        self.time_window = _Window('in_time')
+        self.host_window = _Window('in_host')
+        self.cols = []
+        self.service_cols = {}
+        self.flag_cols = {}
+        self.evicted_idle = 0
+        self.evicted_cap = 0
+
+    @classmethod
+    def with_memory_cap(cls, max_memory_mb, **kwargs):
+        """Size the flow table to stay within roughly ``max_memory_mb``"""
+        return cls(max_flows=max(1, int(max_memory_mb * 1024 * 1024 // BYTES_PER_FLOW)), **kwargs)
+
+    def bind(self, layout):
+        """Precompile the column indices of the features this table writes"""
+        # (position in values(), row column) for the features the model uses
+        self.cols = [(i, layout.col(name)) for i, name in enumerate(FLOW_FEATURES)
+                     if layout.col(name) is not None]
+        self.service_cols = layout.one_hot('service', SERVICES)
+        self.flag_cols = layout.one_hot('flag', FLAGS)
+        return self
+
+    # --- state maintenance -------------------------------------------------
+
+    def _expire(self, now):
+        tw = self.time_window
+        while tw.conns and now - tw.conns[0].start > self.time_window_secs:
+            tw.pop_oldest()
+        # The time window is bounded by the flow cap as well
+        while len(tw) > self.max_flows:
+            tw.pop_oldest()
+        flows = self.flows
+        while flows:
+            key, c = next(iter(flows.items()))
+            if now - c.last <= self.idle_timeout:
+                break
+            del flows[key]
+            self.evicted_idle += 1
+
+    def _set_flag(self, c, flag):
+        if flag == c.flag:
+            return
+        serror = 1 if flag == 'S0' else 0
+        rerror = 1 if flag == 'REJ' else 0
+        ds, dr = serror - c.serror, rerror - c.rerror
+        c.flag, c.serror, c.rerror = flag, serror, rerror
+        if ds or dr:
+            self.time_window.update_errors(c, ds, dr)
+            self.host_window.update_errors(c, ds, dr)
+
+    def _tcp_state(self, c, forward, flags):
+        if flags & TCP_RST:
+            if c.flag == 'S0' and not forward:
+                self._set_flag(c, 'REJ')
+            elif c.flag == 'S0':
+                self._set_flag(c, 'RSTOS0')
+            elif c.flag in ('S1', 'SF'):
+                self._set_flag(c, 'RSTO' if forward else 'RSTR')
+        elif flags & TCP_SYN and not flags & TCP_ACK and forward and c.flag == 'OTH':
+            self._set_flag(c, 'S0')
+        elif flags & TCP_SYN and flags & TCP_ACK and not forward and c.flag == 'S0':
+            self._set_flag(c, 'S1')
+        elif flags & TCP_FIN and c.flag == 'S1':
+            self._set_flag(c, 'SF')
+
+    def update(self, ts, src, dst, sport, dport, proto, length, tcp_flags=0, icmp_type=None):
+        """Account one packet and return its Connection"""
+        self._expire(ts)
+        a, b = (src, sport), (dst, dport)
+        key = (proto, a, b) if a <= b else (proto, b, a)
+        c = self.flows.get(key)
+        if c is None:
+            c = Connection(key, src, dst, sport, dport, proto, service_for(proto, dport, icmp_type), ts)
+            self.flows[key] = c
+            if len(self.flows) > self.max_flows:
+                self.flows.popitem(last=False)
+                self.evicted_cap += 1
+            self.time_window.add(c)
+            hw = self.host_window
+            hw.add(c)
+            if len(hw) > self.host_window_size:
+                hw.pop_oldest()
+        else:
+            self.flows.move_to_end(key)
+        forward = src == c.src and sport == c.sport
+        if forward:
+            c.src_bytes += length
+        else:
+            c.dst_bytes += length
+        c.last = ts
+        if proto == 'TCP':
+            self._tcp_state(c, forward, tcp_flags)
+        return c
+
+    # --- feature output ----------------------------------------------------
+
+    def features(self, c):
+        """KDD connection features for ``c`` as a dict (for inspection/tests)"""
+        return dict(zip(FLOW_FEATURES, self.values(c)))
+
+    def fill(self, row, c):
+        """Write ``c``'s features into a layout row bound with ``bind``"""
+        values = self.values(c)
+        for i, col in self.cols:
+            row[col] = values[i]
+        col = self.service_cols.get(c.service)
+        if col is not None:
+            row[col] = 1
+        col = self.flag_cols.get(c.flag)
+        if col is not None:
+            row[col] = 1
+
+    def values(self, c):
+        """Feature values for ``c`` in FLOW_FEATURES order"""
+        tw, hw = self.time_window, self.host_window
+        dst, srv = c.dst, c.service
+
+        count = tw.host.get(dst, 0)
+        srv_count = tw.srv.get(srv, 0)
+        same_srv = tw.host_srv.get((dst, srv), 0)
+        same_srv_rate = _rate(same_srv, count)
+
+        host_count = hw.host.get(dst, 0)
+        host_srv_count = hw.srv.get(srv, 0)
+        host_same_srv = hw.host_srv.get((dst, srv), 0)
+        host_same_srv_rate = _rate(host_same_srv, host_count)
+
+        return (
+            int(c.last - c.start),
+            c.src_bytes,
+            c.dst_bytes,
+            1 if c.src == c.dst and c.sport == c.dport else 0,
+            count,
+            srv_count,
+            _rate(tw.host_serror.get(dst, 0), count),
+            _rate(tw.srv_serror.get(srv, 0), srv_count),
+            _rate(tw.host_rerror.get(dst, 0), count),
+            _rate(tw.srv_rerror.get(srv, 0), srv_count),
+            same_srv_rate,
+            1.0 - same_srv_rate if count else 0.0,
+            1.0 - _rate(same_srv, srv_count) if srv_count else 0.0,
+            host_count,
+            host_srv_count,
+            host_same_srv_rate,
+            1.0 - host_same_srv_rate if host_count else 0.0,
+            _rate(hw.host_sport.get((dst, c.sport), 0), host_count),
+            1.0 - _rate(host_same_srv, host_srv_count) if host_srv_count else 0.0,
+            _rate(hw.host_serror.get(dst, 0), host_count),
+            _rate(hw.srv_serror.get(srv, 0), host_srv_count),
+            _rate(hw.host_rerror.get(dst, 0), host_count),
+            _rate(hw.srv_rerror.get(srv, 0), host_srv_count),
+        )
+
+    def stats(self):
+        return {
+            'flows': len(self.flows),
+            'max_flows': self.max_flows,
+            'time_window_connections': len(self.time_window),
+            'host_window_connections': len(self.host_window),
+            'evicted_idle': self.evicted_idle,
+            'evicted_cap': self.evicted_cap,
+        }
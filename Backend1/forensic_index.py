@@ -0,0 +1,345 @@
+"""
+Sidecar index and query engine for the forensic log
+Every batch the ForensicLogWriter flushes becomes one indexed block: its byte
+range in the CSV segment, row count, first/last timestamp and the set of
+src/dst IPs, protocols and predictions it contains. The index is kept in
+memory (with IP postings lists) and appended to a JSON-lines sidecar file so
+it survives restarts.
+
+Queries walk candidate blocks newest-first and only seek/read the blocks that
+can match, so a page costs the same whether the log holds ten thousand rows or
+a hundred million.
+
+ForensicLogReader serves queries in a process that does not write the log:
+it indexes the segment read-only and catches up with the rows the writing
+process appends.
+"""
+
+import bisect
+import csv
+import io
+import itertools
+import json
+import os
+import threading
+import time
+
+INDEX_SUFFIX = '.idx'
+REBUILD_BLOCK_ROWS = 1000
+# Larger per-block value sets are not stored; such blocks always get scanned
+MAX_BLOCK_SET = 256
+FIELDS = ['timestamp', 'src', 'dst', 'protocol', 'length', 'prediction']
+
+# Tie-breaker for segment ids created within the same clock tick
+_segment_ids = itertools.count()
+
+
+class CursorError(ValueError):
+    pass
+
+
+class SegmentChangedError(RuntimeError):
+    """The file at the segment path is no longer the one a read-only index was built from"""
+
+
+def _value_set(values):
+    values = set(values)
+    return sorted(values) if len(values) <= MAX_BLOCK_SET else None
+
+
+class ForensicIndex:
+    def __init__(self, csv_path, readonly=False):
+        self.csv_path = csv_path
+        self.path = csv_path + INDEX_SUFFIX
+        # Read-only indexes never write the sidecar (another process owns it)
+        self.readonly = readonly
+        # File id of the indexed segment (read-only indexes only)
+        self.inode = None
+        # Identifies the segment; cursors from a rotated segment are rejected
+        self.segment = f'{time.time_ns()}-{next(_segment_ids)}'
+        self.offsets = []
+        self.ends = []
+        self.rows = []
+        self.t0 = []
+        self.t1 = []
+        self.protocols = []
+        self.predictions = []
+        self.src_postings = {}
+        self.dst_postings = {}
+        # Blocks whose IP sets were too large to store; they match any IP
+        self.unindexed_ip_blocks = []
+        self.end = 0
+        self._sidecar = None
+
+    @classmethod
+    def open(cls, csv_path):
+        """Load the sidecar for a segment, rebuilding it if missing or stale"""
+        index = cls(csv_path)
+        size = os.path.getsize(csv_path) if os.path.exists(csv_path) else 0
+        if os.path.exists(index.path):
+            index._load()
+        if index.end != size:
+            index.rebuild()
+        return index
+
+    @classmethod
+    def open_readonly(cls, csv_path):
+        """Index a segment without writing its sidecar; FileNotFoundError if it does not exist"""
+        index = cls(csv_path, readonly=True)
+        st = os.stat(csv_path)
+        if os.path.exists(index.path):
+            index._load()
+            if index.end > st.st_size:
+                # Sidecar of a previous segment
+                index = cls(csv_path, readonly=True)
+        index.inode = st.st_ino
+        index.refresh()
+        return index
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # --- building ----------------------------------------------------------
+
+    def _append(self, offset, end, rows, t0, t1, src, dst, protocols, predictions):
+        block = len(self.offsets)
+        if src is None or dst is None:
+            self.unindexed_ip_blocks.append(block)
+        for postings, ips in ((self.src_postings, src), (self.dst_postings, dst)):
+            for ip in ips or ():
+                postings.setdefault(ip, []).append(block)
+        self.protocols.append(set(protocols) if protocols is not None else None)
+        self.predictions.append(set(predictions) if predictions is not None else None)
+        self.t0.append(t0)
+        self.t1.append(t1)
+        self.rows.append(rows)
+        self.ends.append(end)
+        # Published last: readers only look at blocks below len(offsets)
+        self.offsets.append(offset)
+        self.end = end
+
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    b = json.loads(line)
+                except ValueError:
+                    break  # torn last line; rebuild covers the rest
+                self._append(b['o'], b['e'], b['n'], b['t0'], b['t1'], b['src'], b['dst'], b['p'], b['y'])
+
+    def add_block(self, offset, end, records):
+        """Index one flushed batch of records occupying bytes [offset, end)"""
+        src = _value_set(r['src'] for r in records)
+        dst = _value_set(r['dst'] for r in records)
+        protocols = _value_set(str(r['protocol']) for r in records)
+        predictions = _value_set(str(r['prediction']) for r in records)
+        t0 = min(str(r['timestamp']) for r in records)
+        t1 = max(str(r['timestamp']) for r in records)
+        self._append(offset, end, len(records), t0, t1, src, dst, protocols, predictions)
+        if self.readonly:
+            return
+        if self._sidecar is None:
+            self._sidecar = open(self.path, 'a')
+        self._sidecar.write(json.dumps({'o': offset, 'e': end, 'n': len(records), 't0': t0, 't1': t1,
+                                        'src': src, 'dst': dst, 'p': protocols, 'y': predictions}) + '\n')
+        self._sidecar.flush()
+
+    def rebuild(self):
+        """Index an existing segment from scratch (one sequential pass)"""
+        self.__init__(self.csv_path)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        if not os.path.exists(self.csv_path):
+            return
+        self._index_rows(0)
+
+    def refresh(self):
+        """Index the complete rows appended since the last indexed block"""
+        self._index_rows(self.end)
+
+    def _index_rows(self, start):
+        with open(self.csv_path, 'rb') as f:
+            if start == 0:
+                if not f.readline().endswith(b'\n'):
+                    return  # no complete header yet
+            else:
+                f.seek(start)
+            offset = f.tell()
+            batch = []
+            while True:
+                line = f.readline()
+                if line and not line.endswith(b'\n'):
+                    # Partially written row: index up to the row before it
+                    f.seek(-len(line), os.SEEK_CUR)
+                    line = b''
+                if line:
+                    values = next(csv.reader([line.decode('utf-8')]), None)
+                    if values and len(values) == len(FIELDS):
+                        batch.append(dict(zip(FIELDS, values)))
+                if batch and (not line or len(batch) >= REBUILD_BLOCK_ROWS):
+                    end = f.tell()
+                    self.add_block(offset, end, batch)
+                    offset, batch = end, []
+                elif not batch:
+                    offset = f.tell()
+                if not line:
+                    break
+
+    def close(self):
+        if self._sidecar is not None:
+            self._sidecar.close()
+            self._sidecar = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # --- querying ----------------------------------------------------------
+
+    def _candidate_blocks(self, n_blocks, ip, src, dst):
+        """Sorted block ids that can match the IP filters, or None for no IP filter"""
+        wanted = []
+        if ip:
+            wanted.append(set(self.src_postings.get(ip, ())) | set(self.dst_postings.get(ip, ())))
+        if src:
+            wanted.append(set(self.src_postings.get(src, ())))
+        if dst:
+            wanted.append(set(self.dst_postings.get(dst, ())))
+        if not wanted:
+            return None
+        unindexed = set(self.unindexed_ip_blocks)
+        ids = set.intersection(*[ids | unindexed for ids in wanted])
+        return sorted(i for i in ids if i < n_blocks)
+
+    def _matching_blocks(self, blocks, since, until, protocol, prediction):
+        """Blocks (newest first) whose time range and value sets allow a match"""
+        for block in blocks:
+            if since and self.t1[block] < since:
+                return
+            if until and self.t0[block] > until:
+                continue
+            if protocol and self.protocols[block] is not None and protocol not in self.protocols[block]:
+                continue
+            if prediction and self.predictions[block] is not None and prediction not in self.predictions[block]:
+                continue
+            yield block
+
+    def _read_block(self, f, block):
+        f.seek(self.offsets[block])
+        data = f.read(self.ends[block] - self.offsets[block]).decode('utf-8')
+        return [dict(zip(FIELDS, values)) for values in csv.reader(io.StringIO(data)) if len(values) == len(FIELDS)]
+
+    def query(self, limit=100, cursor=None, since=None, until=None, ip=None, src=None,
+              dst=None, protocol=None, prediction=None):
+        """Newest-first page of matching rows.
+
+        Returns (rows oldest-first, next_cursor or None). ``cursor`` is the
+        ``next_cursor`` of the previous page and continues with older rows.
+        next_cursor is only returned if an older matching row exists: block
+        summaries can only rule blocks out, so the blocks after a full page
+        are read until one holds a match.
+        """
+        n_blocks = len(self.offsets)
+        if n_blocks == 0:
+            return [], None
+        start_block, start_row = n_blocks - 1, None
+        if cursor:
+            try:
+                segment, block, row = cursor.split(':')
+                start_block, start_row = int(block), int(row)
+            except ValueError:
+                raise CursorError('Malformed cursor')
+            if segment != self.segment or start_block >= n_blocks:
+                raise CursorError('Cursor expired (forensic log was rotated)')
+
+        if until:
+            # Blocks are appended in time order: skip everything newer than `until`
+            newest = bisect.bisect_right(self.t0, until, 0, n_blocks) - 1
+            if newest < start_block:
+                start_block, start_row = newest, None
+
+        candidates = self._candidate_blocks(n_blocks, ip, src, dst)
+        if candidates is None:
+            blocks = range(start_block, -1, -1)
+        else:
+            hi = bisect.bisect_right(candidates, start_block)
+            blocks = reversed(candidates[:hi])
+
+        def matches(r):
+            return not (
+                (since and r['timestamp'] < since)
+                or (until and r['timestamp'] > until)
+                or (ip and ip not in (r['src'], r['dst']))
+                or (src and r['src'] != src)
+                or (dst and r['dst'] != dst)
+                or (protocol and r['protocol'] != protocol)
+                or (prediction and r['prediction'] != prediction)
+            )
+
+        blocks = self._matching_blocks(blocks, since, until, protocol, prediction)
+        results = []
+        next_cursor = None
+        with open(self.csv_path, 'rb') as f:
+            if self.inode is not None and os.fstat(f.fileno()).st_ino != self.inode:
+                raise SegmentChangedError(self.csv_path)
+            for block in blocks:
+                rows = self._read_block(f, block)
+                last = start_row if (block == start_block and start_row is not None) else len(rows)
+                for i in range(last - 1, -1, -1):
+                    if matches(rows[i]):
+                        results.append(rows[i])
+                        if len(results) == limit:
+                            break
+                if len(results) == limit:
+                    more = any(matches(r) for r in rows[:i])
+                    if not more:
+                        more = any(matches(r) for older in blocks for r in self._read_block(f, older))
+                    if more:
+                        next_cursor = f'{self.segment}:{block}:{i}'
+                    break
+        results.reverse()
+        return results, next_cursor
+
+
+class ForensicLogReader:
+    """Read-only queries on a forensic log written by another process (or by none)
+
+    The index is kept between queries: appended rows are indexed on the next
+    query, and the segment is indexed afresh when the file is replaced
+    (rotated) or truncated.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.index = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Up-to-date read-only index, or None if the log does not exist"""
+        with self._lock:
+            try:
+                st = os.stat(self.csv_path)
+            except FileNotFoundError:
+                self.index = None
+                return None
+            index = self.index
+            if index is None or st.st_ino != index.inode or st.st_size < index.end:
+                # Replaced, not modified in place: queries still running keep the old index
+                self.index = ForensicIndex.open_readonly(self.csv_path)
+            elif st.st_size > index.end:
+                index.refresh()
+            return self.index
+
+    def query(self, **filters):
+        """Page through the log; see ForensicIndex.query"""
+        for attempt in range(2):
+            index = self.current()
+            if index is None:
+                return [], None
+            try:
+                return index.query(**filters)
+            except SegmentChangedError:
+                # Rotated between indexing and reading; the next current() reindexes
+                if attempt:
+                    raise
@@ -0,0 +1,252 @@
+"""
+Asynchronous forensic log writer for PDMS
+The capture loop hands records to a queue; a writer thread appends them to
+the active CSV segment in batches (on a row-count or time trigger) through a
+file handle that stays open. Segments are rotated by size or hour, and rotated
+segments are compacted into compressed Parquet files in the archive folder.
+Every flushed batch is also recorded in the segment's sidecar index
+(forensic_index.py), which serves the /forensic-log queries.
+
+A writer holds an exclusive lock on <log>.lock while it runs, so a second
+process cannot append to, rotate or re-index the same log.
+"""
+
+import atexit
+import csv
+import logging
+import os
+import queue
+import threading
+import time
+
+from forensic_index import ForensicIndex
+
+logger = logging.getLogger(__name__)
+
+FORENSIC_LOG = 'forensic_log.csv'
+FORENSIC_FIELDS = ['timestamp', 'src', 'dst', 'protocol', 'length', 'prediction']
+ARCHIVE_DIR = 'forensic_archive'
+
+FLUSH_ROWS = 1000           # flush when this many records are pending...
+FLUSH_INTERVAL = 1.0        # ...or this many seconds after the first one
+ROTATE_BYTES = 64 * 1024 * 1024
+ROTATE_HOURLY = True
+QUEUE_SIZE = 100000
+DROP_WARNING_INTERVAL = 10.0  # at most one 'records dropped' warning per this many seconds
+LOCK_SUFFIX = '.lock'
+
+ARCHIVE_DTYPES = {
+    'timestamp': 'string',
+    'src': 'string',
+    'dst': 'string',
+    'protocol': 'category',
+    'length': 'int32',
+    'prediction': 'category',
+}
+
+
+def compact_segment(csv_path):
+    """Convert a rotated CSV segment to zstd-compressed Parquet and delete the CSV
+
+    Returns the Parquet path, or None if the CSV was kept as it is.
+    """
+    import pandas as pd
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+    try:
+        df = pd.read_csv(csv_path, dtype={k: 'string' for k in ARCHIVE_DTYPES if k != 'length'})
+        df = df.astype(ARCHIVE_DTYPES)
+        df.to_parquet(parquet_path, compression='zstd', index=False)
+    except ImportError as e:
+        # No Parquet engine installed: keep the rotated CSV as it is
+        logger.warning(f'Forensic log: cannot compact {csv_path}: {e}')
+        return None
+    except Exception:
+        # Malformed row, failed cast, disk error...: the rotated CSV stays in the archive
+        logger.exception(f'Forensic log: compacting {csv_path} failed')
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
+        return None
+    os.remove(csv_path)
+    return parquet_path
+
+
+class LogLockedError(RuntimeError):
+    pass
+
+
+def _lock(f):
+    """Exclusive, non-blocking lock on an open file; OSError if another process holds it"""
+    if os.name == 'nt':
+        import msvcrt
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+class ForensicLogWriter:
+    def __init__(self, path=FORENSIC_LOG, archive_dir=ARCHIVE_DIR, flush_rows=FLUSH_ROWS,
+                 flush_interval=FLUSH_INTERVAL, rotate_bytes=ROTATE_BYTES,
+                 rotate_hourly=ROTATE_HOURLY, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.archive_dir = archive_dir
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_hourly = rotate_hourly
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self._file = None
+        self._writer = None
+        self._segment_hour = None
+        self.index = None
+        # Held by query() and _rotate(): a query never reads the new segment with the old index
+        self._segment_lock = threading.Lock()
+        self._lock_file = None
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.compaction_failures = 0
+        self._dropped_reported = 0
+        self._drop_warned_at = 0.0
+
+    def start(self):
+        """Lock the log and start the writer thread; LogLockedError if another process writes it"""
+        lock_file = open(self.path + LOCK_SUFFIX, 'a')
+        try:
+            _lock(lock_file)
+        except OSError:
+            lock_file.close()
+            raise LogLockedError(f'{self.path} is being written by another process')
+        # Held until the process exits; closing the file releases it
+        self._lock_file = lock_file
+        self.index = ForensicIndex.open(self.path)
+        self.thread = threading.Thread(target=self._run, name='forensic-log-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+        return self
+
+    def write(self, result):
+        """Queue one record; never blocks the caller"""
+        try:
+            self.queue.put_nowait(result)
+        except queue.Full:
+            self.dropped += 1
+            now = time.monotonic()
+            if now - self._drop_warned_at >= DROP_WARNING_INTERVAL:
+                logger.warning(f'Forensic log queue full: dropped {self.dropped - self._dropped_reported} '
+                               f'record(s) ({self.dropped} in total)')
+                self._dropped_reported = self.dropped
+                self._drop_warned_at = now
+
+    def close(self):
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    # --- writer thread -----------------------------------------------------
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._flush(batch)
+            except Exception as e:
+                logger.error(f'Forensic log write error: {e}')
+        self._close_segment()
+        self.index.close()
+        self._lock_file.close()
+
+    def _open_segment(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(FORENSIC_FIELDS)
+            self._file.flush()
+        self._segment_hour = time.strftime('%Y%m%d%H')
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def _should_rotate(self):
+        if self._file.tell() >= self.rotate_bytes:
+            return True
+        return self.rotate_hourly and time.strftime('%Y%m%d%H') != self._segment_hour
+
+    def _segment_name(self):
+        base = os.path.splitext(os.path.basename(self.path))[0]
+        stem = os.path.join(self.archive_dir, f"{base}-{time.strftime('%Y%m%d-%H%M%S')}")
+        name, n = stem, 0
+        # Several rotations can happen within one second under heavy load
+        while os.path.exists(name + '.csv') or os.path.exists(name + '.parquet'):
+            n += 1
+            name = f'{stem}-{n}'
+        return name + '.csv'
+
+    def _rotate(self):
+        self._close_segment()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        rotated = self._segment_name()
+        with self._segment_lock:
+            os.replace(self.path, rotated)
+            self.index.remove()
+            self.index = ForensicIndex(self.path)
+        self.rotations += 1
+        # Compaction can take a while on a big segment; do not hold up logging
+        threading.Thread(target=self._compact, args=(rotated,), daemon=True).start()
+        self._open_segment()
+
+    def _compact(self, csv_path):
+        if compact_segment(csv_path) is None:
+            self.compaction_failures += 1
+
+    def _flush(self, batch):
+        if self._file is None:
+            self._open_segment()
+        elif self._should_rotate():
+            self._rotate()
+        offset = os.fstat(self._file.fileno()).st_size
+        self._writer.writerows(
+            [r['timestamp'], r['src'], r['dst'], r['protocol'], r['length'], r['prediction']]
+            for r in batch
+        )
+        self._file.flush()
+        # Each flushed batch becomes one block of the sidecar index
+        self.index.add_block(offset, os.fstat(self._file.fileno()).st_size, batch)
+        self.written += len(batch)
+
+    def query(self, **filters):
+        """Page through the active segment; see ForensicIndex.query"""
+        with self._segment_lock:
+            return self.index.query(**filters)
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'rotations': self.rotations,
+            'compaction_failures': self.compaction_failures,
+        }
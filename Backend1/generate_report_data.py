@@ -1,3 +1,4 @@
+import json
 import requests
 import time
 import os
@@ -18,8 +19,13 @@ time.sleep(5)
 
 # 2. Trigger prediction on the uploaded dataset
 print("Requesting predictions on uploaded dataset...")
-predict_resp = requests.post(f"{BACKEND_URL}/predict_uploaded")
-print("Prediction response:", predict_resp.json())
+predict_resp = requests.post(f"{BACKEND_URL}/predict_uploaded", stream=True)
+# NDJSON: a header line, one line per row, then a summary line
+lines = [json.loads(line) for line in predict_resp.iter_lines() if line]
+if predict_resp.status_code != 200:
+    print("Prediction error:", lines[0] if lines else predict_resp.status_code)
+else:
+    print("Prediction summary:", lines[-1])
 
 # 3. Download the forensic log
 print("Downloading forensic log...")
@@ -29,6 +35,5 @@ print(f"Forensic log entries: {len(log_data.get('log', []))}")
 
 # Optionally, save the forensic log to a file for your report
 with open("forensic_log_report.json", "w", encoding="utf-8") as f:
-    import json
     json.dump(log_data, f, indent=2)
 print("Forensic log saved to forensic_log_report.json") 
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Upload ingestion for PDMS
+ingest() copies an uploaded CSV to disk block by block and, in the same
+pass, detects its encoding (BOM, else UTF-8 with a Latin-1 fallback) and
+delimiter, counts its rows and checks the header against the served model's
+columns. Nothing is parsed by pandas, so an upload costs about one read and
+one write of the file. What it found is saved next to the CSV as
+<name>.csv.ingest.json.
+
+columnar_copy() converts a CSV to a typed Parquet file with pyarrow's
+streaming CSV reader. Training jobs call it in the training process and
+train from the Parquet copy, which is quicker to scan than the CSV.
+"""
+
+import codecs
+import csv
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1 << 20
+# Decoded text handed to csv.Sniffer
+SNIFF_CHARS = 64 * 1024
+DELIMITERS = ',;\t|'
+META_SUFFIX = '.ingest.json'
+PARQUET_BLOCK_SIZE = 16 << 20
+
+
+class IngestError(ValueError):
+    pass
+
+
+def bom_encoding(head):
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    return None
+
+
+def ingest(stream, path, max_bytes=None, known_columns=None):
+    """Copy ``stream`` to ``path`` and describe the CSV; IngestError if it is unusable
+
+    ``known_columns`` are the raw columns the served model reads.
+    """
+    started = time.perf_counter()
+    tmp = f'{path}.part'
+    size = newlines = 0
+    encoding = decoder = None
+    sample = ''
+    ends_with_newline = False
+    try:
+        with open(tmp, 'wb') as out:
+            for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+                size += len(block)
+                if max_bytes is not None and size > max_bytes:
+                    raise IngestError(f'File too large. Max {max_bytes // (1024 * 1024)}MB allowed.')
+                out.write(block)
+                if encoding is None:
+                    encoding = bom_encoding(block) or 'utf-8'
+                    decoder = codecs.getincrementaldecoder(encoding)()
+                text = None
+                if decoder is not None:
+                    try:
+                        text = decoder.decode(block)
+                    except UnicodeDecodeError:
+                        if encoding == 'utf-16':
+                            raise IngestError('File is not valid UTF-16 text.')
+                        # Not UTF-8: Latin-1 decodes any byte sequence
+                        encoding, decoder = 'latin-1', None
+                        text = block.decode('latin-1')
+                if encoding == 'utf-16':
+                    newlines += text.count('\n')
+                    ends_with_newline = text.endswith('\n') if text else ends_with_newline
+                else:
+                    # UTF-8 and Latin-1: a 0x0A byte is always a line break
+                    newlines += block.count(b'\n')
+                    ends_with_newline = block.endswith(b'\n')
+                if text and len(sample) < SNIFF_CHARS:
+                    sample += text[:SNIFF_CHARS - len(sample)]
+        meta = describe(sample, encoding, size, newlines, ends_with_newline, known_columns)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    meta['ingest_seconds'] = round(time.perf_counter() - started, 3)
+    with open(path + META_SUFFIX, 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def describe(sample, encoding, size, newlines, ends_with_newline, known_columns=None):
+    """Delimiter, header, row count and warnings from the first part of a CSV"""
+    if not sample.strip():
+        raise IngestError('Uploaded file is empty.')
+    # Whole lines only: a cut-off last line confuses the sniffer
+    lines = sample[:sample.rfind('\n')] if '\n' in sample else sample
+    try:
+        delimiter = csv.Sniffer().sniff(lines, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ','
+    header = next(csv.reader([lines.split('\n', 1)[0].rstrip('\r')], delimiter=delimiter))
+    if len(header) < 2:
+        raise IngestError('CSV needs at least two columns (features and a label).')
+    rows = newlines + (0 if ends_with_newline else 1) - 1
+    if rows < 1:
+        raise IngestError('CSV has a header but no rows.')
+    warnings = []
+    stripped = [column.strip() for column in header]
+    duplicates = sorted({c for c in stripped if stripped.count(c) > 1})
+    if duplicates:
+        warnings.append(f'Duplicate columns: {duplicates}')
+    label = next((c for c in header if c.strip().lower() == 'label'), None)
+    if label is None:
+        warnings.append('No "Label" column found; the last column will be used as the label.')
+    matched = [c for c in header if known_columns and c.strip() in known_columns]
+    if known_columns and not matched:
+        warnings.append("No column matches the served model's features; retraining builds a new feature set.")
+    return {
+        'encoding': encoding,
+        'delimiter': delimiter,
+        'bytes': size,
+        'rows': rows,
+        'columns': header,
+        'label_column': label,
+        'matched_columns': len(matched),
+        'warnings': warnings,
+    }
+
+
+def read_meta(csv_path):
+    try:
+        with open(csv_path + META_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def columnar_copy(csv_path):
+    """Path of a typed Parquet copy of a CSV (built if missing or stale), or None if it cannot be built
+
+    Integer columns are stored as float64 and anything that is not a number
+    as a string, so the copy reads back the way pandas reads the CSV. The
+    label column is always a string: 0/1 labels stay '0'/'1'.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        return parquet_path
+    meta = read_meta(csv_path)
+    if meta is None:
+        with open(csv_path, 'rb') as f:
+            encoding = bom_encoding(f.read(4)) or 'utf-8'
+        meta = {'encoding': encoding, 'delimiter': ','}
+    read_options = pacsv.ReadOptions(block_size=PARQUET_BLOCK_SIZE,
+                                     encoding='utf8' if meta['encoding'].startswith('utf-8') else meta['encoding'])
+    parse_options = pacsv.ParseOptions(delimiter=meta['delimiter'])
+    tmp = f'{parquet_path}.part'
+    started = time.perf_counter()
+    try:
+        # Types are inferred from the first block; a second open pins them
+        with pacsv.open_csv(csv_path, read_options=read_options, parse_options=parse_options) as reader:
+            inferred = reader.schema
+        label = meta.get('label_column') or next(
+            (name for name in inferred.names if name.strip().lower() == 'label'), inferred.names[-1])
+        schema = pa.schema([(field.name, pa.float64() if field.name != label and (
+            pa.types.is_integer(field.type) or pa.types.is_floating(field.type)) else pa.string())
+            for field in inferred])
+        convert_options = pacsv.ConvertOptions(column_types=schema, strings_can_be_null=True)
+        rows = 0
+        with pacsv.open_csv(csv_path, read_options=read_options, parse_options=parse_options,
+                            convert_options=convert_options) as reader, pq.ParquetWriter(tmp, schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        os.replace(tmp, parquet_path)
+    except (pa.ArrowException, OSError, ValueError) as e:
+        # e.g. text further down a column that looked numeric
+        logger.warning(f'Ingestion: no columnar copy of {csv_path}: {e}')
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+    logger.info(f'Ingestion: {rows} rows of {csv_path} -> {parquet_path} in {time.perf_counter() - started:.2f}s')
+    return parquet_path
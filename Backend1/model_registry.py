@@ -0,0 +1,209 @@
+"""
+Versioned model registry for PDMS
+Each trained model is stored as an immutable version directory:
+
+    model_registry/
+        CURRENT             name of the version being served
+        v0001/
+            model.joblib    the fitted model (unpickled into each loading process)
+            forest/         the compiled forest's flat arrays as .npy files, for
+                            random forests; memory-mapped read-only, so capture
+                            pipeline workers scoring the same version share them
+            manifest.json   metrics, feature schema, classes, training source
+
+Publishing writes a new directory under a temporary name and renames it into
+place, then repoints CURRENT with an atomic file replace; rolling back only
+repoints CURRENT. The SHAP explainer is not stored: ModelBundle builds a
+TreeExplainer from the model the first time one is needed, which is quicker
+than unpickling a saved one.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+import joblib
+
+from compiled_forest import CompiledForest, compile_model
+from feature_layout import FeatureEncoder
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_DIR = 'model_registry'
+CURRENT_FILE = 'CURRENT'
+MODEL_FILE = 'model.joblib'
+MANIFEST_FILE = 'manifest.json'
+FOREST_DIR = 'forest'
+# Loaded into the registry as the first version when it is empty
+LEGACY_MODEL_PATH = 'rf_model.joblib'
+LEGACY_FEATURES_PATH = 'features.txt'
+
+
+class ModelBundle:
+    """Everything a prediction needs from one model version, swapped as a unit"""
+
+    def __init__(self, model, feature_list, metrics=None, version=None, explainer=None):
+        self.model = model
+        self.feature_list = feature_list
+        # One-hot vocabulary is fixed by the feature list: compile the encoder once
+        self.encoder = FeatureEncoder.from_names(feature_list)
+        self.metrics = metrics or {}
+        self.version = version
+        self.loaded_at = datetime.now().isoformat()
+        self._explainer = explainer
+        self._explainer_lock = threading.Lock()
+
+    @property
+    def classes(self):
+        return getattr(self.model, 'classes_', ())
+
+    @property
+    def explainer(self):
+        """SHAP TreeExplainer for this model, built on first use"""
+        if self._explainer is None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    import shap
+                    self._explainer = shap.TreeExplainer(self.model)
+        return self._explainer
+
+
+class ModelRegistry:
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, version):
+        return os.path.join(self.root, version)
+
+    def versions(self):
+        """Published versions, oldest first"""
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith('v') and os.path.exists(os.path.join(self.root, name, MANIFEST_FILE)))
+
+    def manifest(self, version):
+        with open(os.path.join(self.path(version), MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    def current(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def set_current(self, version):
+        if version not in self.versions():
+            raise KeyError(f'Unknown model version: {version}')
+        tmp = os.path.join(self.root, f'{CURRENT_FILE}.{uuid.uuid4().hex}.tmp')
+        with open(tmp, 'w') as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(self.root, CURRENT_FILE))
+        return version
+
+    def rollback(self, version=None):
+        """Serve ``version``, or the one published before the current version"""
+        if version is None:
+            versions = self.versions()
+            current = self.current()
+            older = [v for v in versions if current is None or v < current]
+            if not older:
+                raise KeyError('No earlier model version to roll back to')
+            version = older[-1]
+        return self.set_current(version)
+
+    def publish(self, model, feature_list, metrics=None, source=None, make_current=True):
+        """Store a trained model as a new version and (by default) serve it"""
+        tmp = os.path.join(self.root, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        try:
+            # Uncompressed: quicker to load
+            joblib.dump(model, os.path.join(tmp, MODEL_FILE))
+            forest = compile_model(model)
+            if forest is not None:
+                forest.save_arrays(os.path.join(tmp, FOREST_DIR))
+            manifest = {
+                'created': datetime.now().isoformat(),
+                'source': source,
+                'metrics': metrics or {},
+                'classes': [str(c) for c in getattr(model, 'classes_', [])],
+                'n_features': len(feature_list),
+                'features': list(feature_list),
+            }
+            while True:
+                versions = self.versions()
+                version = f'v{int(versions[-1][1:]) + 1 if versions else 1:04d}'
+                manifest['version'] = version
+                with open(os.path.join(tmp, MANIFEST_FILE), 'w') as f:
+                    json.dump(manifest, f, indent=2)
+                try:
+                    os.rename(tmp, self.path(version))
+                    break
+                except OSError:
+                    if not os.path.exists(self.path(version)):
+                        raise
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        logger.info(f'Model registry: published {version}')
+        if make_current:
+            self.set_current(version)
+        return version
+
+    def load_model(self, version=None):
+        """(model, feature list, manifest) for a version, default the current one"""
+        version = version or self.current()
+        if version is None:
+            raise KeyError('Model registry is empty')
+        manifest = self.manifest(version)
+        # A private copy per process: sklearn trees copy their node arrays when
+        # unpickled, so loading with mmap_mode would not share any pages
+        model = joblib.load(os.path.join(self.path(version), MODEL_FILE))
+        return model, manifest['features'], manifest
+
+    def load_forest(self, version=None):
+        """CompiledForest of a version as read-only memory maps, or None if its model is not a random forest"""
+        version = version or self.current()
+        if version is None:
+            raise KeyError('Model registry is empty')
+        directory = os.path.join(self.path(version), FOREST_DIR)
+        if not os.path.exists(directory):
+            # Published before forests were stored: compile and add it once
+            forest = compile_model(joblib.load(os.path.join(self.path(version), MODEL_FILE)))
+            if forest is None:
+                return None
+            tmp = f'{directory}.{uuid.uuid4().hex}.tmp'
+            forest.save_arrays(tmp)
+            try:
+                os.rename(tmp, directory)
+            except OSError:
+                # Another process added it first
+                shutil.rmtree(tmp, ignore_errors=True)
+        return CompiledForest.load_arrays(directory)
+
+    def load(self, version=None):
+        """ModelBundle for a version, default the current one"""
+        model, features, manifest = self.load_model(version)
+        return ModelBundle(model, features, manifest.get('metrics'), manifest['version'])
+
+    def bootstrap(self, model_path=LEGACY_MODEL_PATH, features_path=LEGACY_FEATURES_PATH):
+        """Import the legacy rf_model.joblib / features.txt when the registry is empty"""
+        if self.current() is not None or self.versions():
+            return self.current()
+        if not (os.path.exists(model_path) and os.path.exists(features_path)):
+            return None
+        with open(features_path) as f:
+            features = [line.strip() for line in f.readlines()]
+        return self.publish(joblib.load(model_path), features, source=model_path)
+
+
+def load_current(root=REGISTRY_DIR):
+    """Bundle for the version being served, importing legacy files on first run; None if there is no model"""
+    registry = ModelRegistry(root)
+    registry.bootstrap()
+    return registry.load() if registry.current() else None
@@ -0,0 +1,110 @@
+"""
+Packet feature extraction for PDMS
+Turns dissected pyshark packets into model feature rows, and opens the live
+capture. Importing this module has no side effects: no model is loaded, no
+capture is started and no log is opened. That lets the capture pipeline's
+dissector process import it without repeating the API process's startup.
+"""
+
+import os
+import time
+
+from feature_layout import FeatureLayout
+from flow_table import FlowTable
+
+# Set to your active wireless interface
+INTERFACE = 'Wi-Fi'
+
+# BPF capture filter (e.g. 'ip and not port 53'): packets it rejects are
+# dropped by the kernel before tshark dissects them
+CAPTURE_FILTER = os.environ.get('PDMS_CAPTURE_FILTER') or None
+
+# Upper bound on memory used by the connection flow table
+FLOW_TABLE_MEMORY_MB = 64
+
+
+def open_live_capture(interface=INTERFACE, bpf_filter=CAPTURE_FILTER):
+    """pyshark.LiveCapture on ``interface`` (auto-detected if None), or None if it cannot be created"""
+    import pyshark
+
+    # --- AUTO-DETECT ACTIVE INTERFACE ---
+    try:
+        interfaces = pyshark.LiveCapture.list_interfaces()
+        print("[INFO] Available interfaces:")
+        for i, iface in enumerate(interfaces):
+            print(f"  {i}: {iface}")
+        if interface is None:
+            preferred = [iface for iface in interfaces if not ("loopback" in iface.lower() or "virtual" in iface.lower() or "npcap" in iface.lower())]
+            if preferred:
+                interface = preferred[0]
+                print(f"[AUTO] Selected interface: {interface}")
+            else:
+                interface = interfaces[0] if interfaces else None
+                print(f"[AUTO] Fallback interface: {interface}")
+    except Exception as e:
+        print(f"[AUTO] Could not auto-detect interface: {e}")
+
+    print(f"Starting live capture on interface: {interface}")
+    try:
+        if interface:
+            capture = pyshark.LiveCapture(interface=interface, bpf_filter=bpf_filter)
+        else:
+            capture = pyshark.LiveCapture(bpf_filter=bpf_filter)  # Use default interface
+        print("Live capture initialized successfully")
+        return capture
+    except Exception as e:
+        print(f"Error initializing live capture: {e}")
+        return None
+
+
+class PacketFeatures:
+    """Feature layout and connection tracking for one model's feature list"""
+
+    def __init__(self, feature_list, flow_table_memory_mb=FLOW_TABLE_MEMORY_MB):
+        # Compile the feature layout once; packets are written straight into rows
+        self.layout = FeatureLayout(feature_list)
+        self.protocol_cols = {proto.upper(): col for proto, col in
+                              self.layout.one_hot('protocol_type', ['icmp', 'tcp', 'udp']).items()}
+        # Connection tracking for the KDD time-window / dst_host_* statistics
+        self.flow_table = FlowTable.with_memory_cap(flow_table_memory_mb).bind(self.layout)
+
+    def extract(self, packet, row):
+        """Write the packet's features into ``row`` and return (src, dst, protocol, length)"""
+        try:
+            ip_layer = packet.ip
+            src = ip_layer.src
+            dst = ip_layer.dst
+            proto = packet.transport_layer if hasattr(packet, 'transport_layer') else 'N/A'
+            length = int(packet.length)
+
+            try:
+                ts = float(packet.sniff_timestamp)
+            except (AttributeError, TypeError, ValueError):
+                ts = time.time()
+            sport = dport = tcp_flags = 0
+            icmp_type = None
+            if proto == 'TCP':
+                sport, dport = int(packet.tcp.srcport), int(packet.tcp.dstport)
+                tcp_flags = int(packet.tcp.flags, 16)
+            elif proto == 'UDP':
+                sport, dport = int(packet.udp.srcport), int(packet.udp.dstport)
+            elif hasattr(packet, 'icmp'):
+                proto = 'ICMP'
+                icmp_type = int(packet.icmp.type)
+            conn = self.flow_table.update(ts, src, dst, sport, dport, proto, length, tcp_flags, icmp_type)
+
+            # Start from the template row: content features we cannot observe
+            # for a live packet (hot, num_failed_logins, ...) stay at their default.
+            # Connection, service and flag features come from the flow table.
+            self.layout.reset_row(row)
+            self.flow_table.fill(row, conn)
+
+            # Protocol type features (one-hot encoded)
+            col = self.protocol_cols.get(proto)
+            if col is not None:
+                row[col] = 1
+
+            return (src, dst, proto, length)
+        except Exception as e:
+            print(f"Error extracting features: {e}")
+            return None
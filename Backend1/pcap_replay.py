@@ -0,0 +1,135 @@
+"""
+Offline pcap replay for PDMS
+Reads a pcap/pcapng file with pyshark.FileCapture and feeds its packets
+through the live capture path (live_packet_capture.process_stream: feature
+extraction, micro-batched scoring, live view, forensic log and alerts) as
+fast as possible, at the original timing, or N times faster. It reproduces
+an incident or load-tests the detector without a live network.
+
+--bpf takes a capture filter in the syntax of PDMS_CAPTURE_FILTER. tshark
+cannot apply one to a file, so tcpdump (WinDump on Windows) copies the
+matching packets to a temporary file first and the rest are never
+dissected. --display-filter passes a Wireshark display filter to tshark
+instead, which is applied during dissection.
+
+    python pcap_replay.py capture.pcapng [--speed max|1|10] [--bpf "tcp port 80"] [--display-filter http]
+
+Replayed packets go to their own forensic log (REPLAY_FORENSIC_LOG, or
+--forensic-log), so a replay can run while the API server is capturing.
+
+At the end it prints packets per second and the latency from submitting
+a packet for scoring to the end of its handling.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pyshark
+
+import live_packet_capture
+from live_packet_capture import MicroBatcher, handle_prediction, process_stream, start_forensic_writer
+
+REPLAY_FORENSIC_LOG = 'forensic_log_replay.csv'
+
+
+def bpf_prefilter(path, bpf):
+    """Temporary pcap with the packets of ``path`` that match ``bpf``"""
+    tool = shutil.which('tcpdump') or shutil.which('windump')
+    if tool is None:
+        raise RuntimeError('--bpf needs tcpdump (or WinDump) on PATH; use --display-filter instead')
+    fd, out = tempfile.mkstemp(suffix='.pcap')
+    os.close(fd)
+    result = subprocess.run([tool, '-r', path, '-w', out, bpf], capture_output=True, text=True)
+    if result.returncode != 0:
+        os.remove(out)
+        raise RuntimeError(f"{os.path.basename(tool)} failed: {result.stderr.strip()}")
+    return out
+
+
+def paced(packets, speed):
+    """Yield packets at their capture timing, ``speed`` times faster (None: no pacing)"""
+    first = start = None
+    for packet in packets:
+        if speed:
+            try:
+                ts = float(packet.sniff_timestamp)
+            except (AttributeError, TypeError, ValueError):
+                ts = None
+            if ts is not None:
+                if first is None:
+                    first, start = ts, time.perf_counter()
+                delay = start + (ts - first) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        yield packet
+
+
+def replay(path, speed=None, bpf=None, display_filter=None, verbose=False, forensic_log=REPLAY_FORENSIC_LOG):
+    """Score every packet of a capture file; returns throughput and latency figures"""
+    live_packet_capture.LOG_EVERY_PACKET = verbose
+    start_forensic_writer(forensic_log)
+    source = bpf_prefilter(path, bpf) if bpf else path
+    capture = pyshark.FileCapture(source, keep_packets=False, display_filter=display_filter)
+    batcher = MicroBatcher(handle_prediction).start()
+    started = time.perf_counter()
+    try:
+        seen, submitted = process_stream(paced(capture, speed), batcher)
+    finally:
+        # Waits until every submitted packet has been handled
+        batcher.stop()
+        elapsed = time.perf_counter() - started
+        capture.close()
+        if source != path:
+            os.remove(source)
+    latencies = np.array(batcher.latencies) * 1000
+    report = {
+        'file': path,
+        'speed': speed or 'max',
+        'packets': seen,
+        'scored': submitted,
+        'skipped': seen - submitted,
+        'seconds': round(elapsed, 3),
+        'packets_per_second': round(submitted / elapsed, 1) if elapsed else 0.0,
+        'batches': batcher.batches,
+    }
+    if len(latencies):
+        for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+            report[f'latency_{name}_ms'] = round(float(np.percentile(latencies, q)), 3)
+    return report
+
+
+def parse_speed(value):
+    if value == 'max':
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError('speed must be "max" or a positive multiplier')
+    return speed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a pcap/pcapng file through the PDMS detector')
+    parser.add_argument('path')
+    parser.add_argument('--speed', type=parse_speed, default=None,
+                        help='"max" (default), 1 for the original timing, or N for N times faster')
+    parser.add_argument('--bpf', help='BPF capture filter, applied with tcpdump before dissection')
+    parser.add_argument('--display-filter', help='Wireshark display filter, applied by tshark')
+    parser.add_argument('--verbose', action='store_true', help='print every packet')
+    parser.add_argument('--forensic-log', default=REPLAY_FORENSIC_LOG,
+                        help=f'forensic log for the replayed packets (default {REPLAY_FORENSIC_LOG})')
+    args = parser.parse_args()
+    try:
+        report = replay(args.path, args.speed, args.bpf, args.display_filter, args.verbose, args.forensic_log)
+    finally:
+        if live_packet_capture.FORENSIC_WRITER is not None:
+            live_packet_capture.FORENSIC_WRITER.close()
+    print(f"[REPLAY] {report['scored']} of {report['packets']} packets scored in {report['seconds']}s "
+          f"({report['packets_per_second']} packets/s, {report['batches']} batches)")
+    if 'latency_p50_ms' in report:
+        print(f"[REPLAY] latency ms: p50 {report['latency_p50_ms']}, p95 {report['latency_p95_ms']}, "
+              f"p99 {report['latency_p99_ms']}, max {report['latency_max_ms']}")
@@ -0,0 +1,200 @@
+"""
+Bounded columnar history of /predict results
+Predictions and labels are stored as small-int codes and SHAP explanations as
+rows of a preallocated float32 matrix, so memory stays fixed no matter how
+long the server runs. The newest ``capacity`` rows are kept in memory; with a
+spill directory, every full ring is written out as a memory-mapped segment
+before it is overwritten, and only the newest ``max_segments`` are retained.
+Running per-prediction counters cover everything appended since start.
+
+Each row records the model version that produced it, and its explanation is
+labelled with that version's feature list. When a retrained model has more
+features than the matrix has columns, the matrix is widened in place.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+HISTORY_CAPACITY = 10000
+MAX_SPILL_SEGMENTS = 10
+NO_LABEL = -1
+NO_MODEL = -1
+
+
+class PredictionHistory:
+    def __init__(self, width, capacity=HISTORY_CAPACITY, spill_dir=None, max_segments=MAX_SPILL_SEGMENTS):
+        self.width = width
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.max_segments = max_segments
+        self.explanations = np.full((capacity, width), np.nan, dtype=np.float32)
+        self.predictions = np.zeros(capacity, dtype=np.int16)
+        self.labels = np.full(capacity, NO_LABEL, dtype=np.int16)
+        # Per-row index into ``models`` ({'version', 'features'} dicts)
+        self.model_codes = np.full(capacity, NO_MODEL, dtype=np.int16)
+        self.models = []
+        self._model_index = {}
+        # One vocabulary for predictions and labels so they compare by code
+        self.names = []
+        self._codes = {}
+        self._counts = []
+        # Sequence id of the next row; row ``seq`` lives in slot seq % capacity
+        self._head = 0
+        self.segments = []
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return min(self._head, self.capacity)
+
+    @property
+    def total(self):
+        return self._head
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.names.append(name)
+            self._codes[name] = code
+            self._counts.append(0)
+        return code
+
+    def _model_code(self, version, feature_names):
+        """Code of a model version, widening the explanation matrix for it if needed"""
+        key = (version, tuple(feature_names))
+        code = self._model_index.get(key)
+        if code is None:
+            code = len(self.models)
+            self.models.append({'version': version, 'features': list(feature_names)})
+            self._model_index[key] = code
+            if len(feature_names) > self.width:
+                wider = np.full((self.capacity, len(feature_names)), np.nan, dtype=np.float32)
+                wider[:, :self.width] = self.explanations
+                self.explanations = wider
+                self.width = len(feature_names)
+        return code
+
+    def extend(self, predictions, explanations=None, labels=None, version=None, feature_names=None):
+        """Append a batch of results; returns the sequence id of the first row
+
+        ``version`` and ``feature_names`` identify the model that made the
+        predictions; rows without them cannot hold an explanation.
+        """
+        n = len(predictions)
+        width = len(feature_names) if feature_names is not None else None
+        if explanations is not None:
+            explanations = np.asarray(explanations, dtype=np.float32)
+            if width is None or explanations.shape != (n, width):
+                explanations = None
+        with self._lock:
+            model = NO_MODEL if feature_names is None else self._model_code(version, feature_names)
+            first = self._head
+            for i in range(n):
+                seq = first + i
+                slot = seq % self.capacity
+                if slot == 0 and seq > 0 and self.spill_dir:
+                    self._spill(seq - self.capacity)
+                code = self._code(str(predictions[i]))
+                self._counts[code] += 1
+                self.predictions[slot] = code
+                label = labels[i] if labels is not None and i < len(labels) else None
+                self.labels[slot] = NO_LABEL if label is None else self._code(str(label))
+                self.model_codes[slot] = model
+                self.explanations[slot] = np.nan
+                if explanations is not None:
+                    self.explanations[slot, :width] = explanations[i]
+            self._head = first + n
+        return first
+
+    def append(self, prediction, explanation=None, label=None, version=None, feature_names=None):
+        """Append one result; returns its sequence id"""
+        return self.extend([prediction], None if explanation is None else [explanation], [label],
+                           version, feature_names)
+
+    def set_explanation(self, seq, explanation):
+        """Fill in a row's explanation once it has been computed; False if expired"""
+        explanation = np.asarray(explanation, dtype=np.float32)
+        with self._lock:
+            if not self._head - self.capacity <= seq < self._head:
+                return False
+            slot = seq % self.capacity
+            model = self.model_codes[slot]
+            # Must match the feature list of the model that made this row's prediction
+            if model == NO_MODEL or explanation.shape != (len(self.models[model]['features']),):
+                return False
+            self.explanations[slot, :len(explanation)] = explanation
+        return True
+
+    # --- spilling ------------------------------------------------------------
+
+    def _spill(self, first_seq):
+        """Write the full ring (rows first_seq..first_seq+capacity) to disk"""
+        base = os.path.join(self.spill_dir, f'history-{first_seq:012d}')
+        out = np.lib.format.open_memmap(base + '.explanations.npy', mode='w+',
+                                        dtype=np.float32, shape=self.explanations.shape)
+        out[:] = self.explanations
+        out.flush()
+        del out
+        np.save(base + '.predictions.npy', self.predictions)
+        np.save(base + '.labels.npy', self.labels)
+        np.save(base + '.models.npy', self.model_codes)
+        with open(base + '.json', 'w') as f:
+            json.dump({'first': first_seq, 'rows': self.capacity, 'names': self.names, 'models': self.models}, f)
+        self.segments.append((first_seq, base))
+        while self.max_segments is not None and len(self.segments) > self.max_segments:
+            _, old = self.segments.pop(0)
+            for suffix in ('.explanations.npy', '.predictions.npy', '.labels.npy', '.models.npy', '.json'):
+                if os.path.exists(old + suffix):
+                    os.remove(old + suffix)
+
+    # --- reading -------------------------------------------------------------
+
+    def _row(self, explanations, predictions, labels, model_codes, names, models, i, seq):
+        label = int(labels[i])
+        code = int(model_codes[i])
+        model = models[code] if code != NO_MODEL else {'version': None, 'features': []}
+        # Only the columns of this row's model; wider matrices pad with NaN
+        explanation = explanations[i, :len(model['features'])]
+        return {
+            'id': seq,
+            'prediction': names[predictions[i]],
+            'label': None if label == NO_LABEL else names[label],
+            'model_version': model['version'],
+            'feature_names': model['features'],
+            'explanation': None if not len(explanation) or np.isnan(explanation).all() else explanation.tolist(),
+        }
+
+    def get(self, seq):
+        """Row ``seq`` as a dict, from memory or a spilled segment; None if expired"""
+        head = self._head
+        if 0 <= seq < head and seq >= head - self.capacity:
+            slot = seq % self.capacity
+            row = self._row(self.explanations, self.predictions, self.labels, self.model_codes,
+                            self.names, self.models, slot, seq)
+            # Re-check: a concurrent append may have overwritten the slot
+            if seq >= self._head - self.capacity:
+                return row
+        for first, base in reversed(self.segments):
+            if first <= seq < first + self.capacity:
+                with open(base + '.json') as f:
+                    meta = json.load(f)
+                explanations = np.load(base + '.explanations.npy', mmap_mode='r')
+                predictions = np.load(base + '.predictions.npy', mmap_mode='r')
+                labels = np.load(base + '.labels.npy', mmap_mode='r')
+                model_codes = np.load(base + '.models.npy', mmap_mode='r')
+                return self._row(explanations, predictions, labels, model_codes,
+                                 meta['names'], meta['models'], seq - first, seq)
+        return None
+
+    def count(self, prediction):
+        """Number of rows with this prediction appended since start"""
+        code = self._codes.get(prediction)
+        return 0 if code is None else self._counts[code]
+
+    def counts(self):
+        return {name: n for name, n in zip(self.names, self._counts) if n}
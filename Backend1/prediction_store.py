@@ -0,0 +1,111 @@
+"""
+Ring-buffer store for live predictions
+Fixed-capacity structured NumPy array written by a single thread (the capture
+or pipeline merge thread) and read by API threads without taking a lock.
+Appends are O(1); readers copy only the rows they return and get per-class
+counts from running counters instead of scanning.
+"""
+
+import numpy as np
+
+LIVE_PREDICTIONS_CAPACITY = 1000
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', 'U19'),
+    ('src', 'U45'),
+    ('dst', 'U45'),
+    ('protocol', 'U8'),
+    ('length', np.int32),
+    ('prediction', np.int8),
+])
+
+# Codes for the labels the model and capture loop produce; anything else gets
+# the next free code the first time it is seen
+DEFAULT_LABELS = ['Benign', 'Malicious', 'Unknown', 'Error']
+MAX_LABELS = 127
+
+
+class PredictionRing:
+    def __init__(self, capacity=LIVE_PREDICTIONS_CAPACITY):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.labels = list(DEFAULT_LABELS)
+        self._codes = {label: i for i, label in enumerate(self.labels)}
+        # Number of records ever appended; published after the slot is written
+        self._head = 0
+        # Per-code counts over the records currently held, and since start
+        self._window_counts = np.zeros(MAX_LABELS + 1, dtype=np.int64)
+        self._total_counts = np.zeros(MAX_LABELS + 1, dtype=np.int64)
+
+    def __len__(self):
+        return min(self._head, self.capacity)
+
+    def code(self, label):
+        code = self._codes.get(label)
+        if code is None:
+            if len(self.labels) >= MAX_LABELS:
+                return self._codes['Unknown']
+            code = len(self.labels)
+            self.labels.append(label)
+            self._codes[label] = code
+        return code
+
+    def append(self, result):
+        """Single-writer O(1) append of a live prediction dict"""
+        head = self._head
+        slot = head % self.capacity
+        if head >= self.capacity:
+            self._window_counts[self._data['prediction'][slot]] -= 1
+        code = self.code(result['prediction'])
+        self._data[slot] = (result['timestamp'], result['src'], result['dst'],
+                            str(result['protocol']), result['length'], code)
+        self._window_counts[code] += 1
+        self._total_counts[code] += 1
+        self._head = head + 1
+
+    def tail(self, n):
+        """Last ``n`` records (oldest first) as dicts, without locking the writer.
+
+        Once the ring is full the oldest slot is the one being overwritten
+        next, so at most ``capacity - 1`` records are returned.
+        """
+        head = self._head
+        n = min(n, head, self.capacity)
+        if n <= 0:
+            return []
+        start = head - n
+        first, last = start % self.capacity, head % self.capacity
+        if first < last or last == 0:
+            rows = self._data[first:last or self.capacity].copy()
+        else:
+            rows = np.concatenate((self._data[first:], self._data[:last]))
+        # The writer may have lapped the oldest rows while we copied; the slot
+        # being written right now is unsafe too
+        lapped = self._head - self.capacity + 1 - start
+        if lapped > 0:
+            rows = rows[lapped:]
+        return self._to_dicts(rows)
+
+    def _to_dicts(self, rows):
+        labels = self.labels
+        return [
+            {
+                'timestamp': str(r['timestamp']),
+                'src': str(r['src']),
+                'dst': str(r['dst']),
+                'protocol': str(r['protocol']),
+                'length': int(r['length']),
+                'prediction': labels[r['prediction']],
+            }
+            for r in rows
+        ]
+
+    def window_counts(self):
+        """Per-label counts over the records currently held"""
+        counts = self._window_counts
+        return {label: int(counts[i]) for i, label in enumerate(self.labels) if counts[i]}
+
+    def total_counts(self):
+        """Per-label counts over every record appended since start"""
+        counts = self._total_counts
+        return {label: int(counts[i]) for i, label in enumerate(self.labels) if counts[i]}
@@ -0,0 +1,109 @@
+"""
+Content-addressed cache of preprocessed training data
+Entries are keyed by the SHA-256 of the input file together with the
+preprocessing settings, so retraining on an unchanged upload skips parsing
+and encoding; any change to the file or the settings gives a new key.
+
+    preprocess_cache/
+        <key>/
+            X.npy        encoded float32 feature matrix, loaded memory-mapped
+            y.npy        labels (fixed-width unicode, no pickle)
+            meta.json    column schema, feature list, class counts
+
+Entries are written under a temporary name and renamed into place. The cache
+is kept under a byte budget by evicting the least recently used entries (a
+hit refreshes the entry's modification time).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('PDMS_PREPROCESS_CACHE_DIR', 'preprocess_cache')
+CACHE_MAX_BYTES = int(os.environ.get('PDMS_PREPROCESS_CACHE_BYTES', 2 * 1024 ** 3))
+# Bump when the stored layout or the preprocessing itself changes
+CACHE_FORMAT = 1
+META_FILE = 'meta.json'
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PreprocessCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, path, config):
+        """Cache key for a file preprocessed with ``config`` (a JSON-serializable dict)"""
+        settings = json.dumps({'format': CACHE_FORMAT, **config}, sort_keys=True)
+        return hashlib.sha256(f'{file_digest(path)}:{settings}'.encode()).hexdigest()
+
+    def get(self, key):
+        """(X memory-mapped, y, meta) for a key, or None"""
+        entry = os.path.join(self.root, key)
+        try:
+            with open(os.path.join(entry, META_FILE)) as f:
+                meta = json.load(f)
+            X = np.load(os.path.join(entry, 'X.npy'), mmap_mode='r')
+            y = np.load(os.path.join(entry, 'y.npy')).astype(object)
+        except (OSError, ValueError) as e:
+            if os.path.exists(entry):
+                logger.warning(f'Preprocess cache: dropping unreadable entry {key[:12]}: {e}')
+                shutil.rmtree(entry, ignore_errors=True)
+            return None
+        os.utime(entry)
+        return X, y, meta
+
+    def put(self, key, X, y, meta):
+        entry = os.path.join(self.root, key)
+        tmp = os.path.join(self.root, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        try:
+            np.save(os.path.join(tmp, 'X.npy'), np.ascontiguousarray(X, dtype=np.float32))
+            np.save(os.path.join(tmp, 'y.npy'), np.asarray(y, dtype=str))
+            # Written last: an entry without it is incomplete
+            with open(os.path.join(tmp, META_FILE), 'w') as f:
+                json.dump(meta, f)
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process stored the same key first, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        """(mtime, bytes, path) of every complete entry"""
+        result = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            result.append((os.path.getmtime(entry), size, entry))
+        return result
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its byte budget"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logger.info(f'Preprocess cache: evicted {os.path.basename(entry)[:12]} ({size} bytes)')
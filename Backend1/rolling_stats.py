@@ -0,0 +1,117 @@
+"""
+Rolling counters for PDMS
+RollingCount keeps event counts in a ring of fixed-width time buckets:
+adding an event touches one bucket (plus clearing the buckets skipped since
+the last event), and the total or the per-bucket series of the window is
+read without looking at the events themselves.
+
+AlertStats counts alerts by threat level and keeps, for every level and
+for all alerts together, bucketed series at RESOLUTIONS: the last minute per
+second, the last hour per minute and the last day per hour.
+"""
+
+import threading
+import time
+
+# name -> (bucket width in seconds, number of buckets)
+RESOLUTIONS = {
+    '1s': (1, 60),
+    '1m': (60, 60),
+    '1h': (3600, 24),
+}
+# Window of the headline alert_rate
+RATE_WINDOW_SECONDS = 60
+
+
+class RollingCount:
+    """Events in the last ``window`` seconds, kept in ``resolution``-second buckets"""
+
+    def __init__(self, window=60, resolution=1):
+        self.resolution = resolution
+        self.slots = [0] * max(1, window // resolution)
+        # Index (time // resolution) of the newest bucket
+        self.bucket = None
+
+    def add(self, now, n=1):
+        bucket = int(now // self.resolution)
+        if self.bucket is None:
+            self.bucket = bucket
+        self._advance(bucket)
+        if bucket > self.bucket - len(self.slots):
+            self.slots[bucket % len(self.slots)] += n
+
+    def _advance(self, bucket):
+        gap = bucket - self.bucket
+        if gap <= 0:
+            return
+        if gap >= len(self.slots):
+            self.slots = [0] * len(self.slots)
+        else:
+            for b in range(self.bucket + 1, bucket + 1):
+                self.slots[b % len(self.slots)] = 0
+        self.bucket = bucket
+
+    def total(self, now):
+        if self.bucket is None:
+            return 0
+        self._advance(int(now // self.resolution))
+        return sum(self.slots)
+
+    def series(self, now):
+        """{'start', 'resolution_seconds', 'counts'}: counts oldest first, the last is the current bucket"""
+        current = int(now // self.resolution)
+        if self.bucket is None:
+            counts = [0] * len(self.slots)
+        else:
+            self._advance(current)
+            counts = [self.slots[b % len(self.slots)] for b in range(current - len(self.slots) + 1, current + 1)]
+        return {
+            'start': (current - len(self.slots) + 1) * self.resolution,
+            'resolution_seconds': self.resolution,
+            'counts': counts,
+        }
+
+
+class AlertStats:
+    def __init__(self, levels, resolutions=RESOLUTIONS):
+        self.resolutions = resolutions
+        self.total = 0
+        self.by_level = {level: 0 for level in levels}
+        self.last_alert = None
+        self.rate = RollingCount(RATE_WINDOW_SECONDS)
+        self.series = {key: self._histograms() for key in ('all', *levels)}
+        self._lock = threading.Lock()
+
+    def _histograms(self):
+        return {name: RollingCount(width * slots, width) for name, (width, slots) in self.resolutions.items()}
+
+    def add(self, level, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.total += 1
+            self.by_level[level] = self.by_level.get(level, 0) + 1
+            self.last_alert = now
+            self.rate.add(now)
+            if level not in self.series:
+                self.series[level] = self._histograms()
+            for key in ('all', level):
+                for histogram in self.series[key].values():
+                    histogram.add(now)
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                'total_alerts': self.total,
+                'alerts_by_level': {level: n for level, n in self.by_level.items() if n},
+                # Alerts per second over the last minute
+                'alert_rate': self.rate.total(now) / RATE_WINDOW_SECONDS,
+                'last_alert': self.last_alert,
+                'alerts_over_time': {name: self._series(name, now) for name in self.resolutions},
+            }
+
+    def _series(self, name, now):
+        series = self.series['all'][name].series(now)
+        series['by_level'] = {level: histograms[name].series(now)['counts']
+                              for level, histograms in self.series.items() if level != 'all'}
+        return series
@@ -0,0 +1,60 @@
+"""
+Entry point for the PDMS backend
+Starts live packet capture (a background thread, or the multi-process
+capture pipeline with PDMS_PIPELINE_WORKERS=N) and serves the Flask API:
+
+    python server.py
+
+Importing this module has no side effects. The capture pipeline starts its
+processes with spawn, and spawned processes re-import the main module; with
+this module as the entry point they skip app.py's startup (model registry,
+model load, alert, blocklist and training threads).
+"""
+
+import atexit
+import logging
+import signal
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+HOST = '0.0.0.0'
+PORT = 5000
+
+
+def _terminate(signum, frame):
+    # Exit once (runs the atexit cleanup); ignore repeats while cleaning up
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(0)
+
+
+def main(app_module=None):
+    if app_module is None:
+        import app as app_module
+    from capture_pipeline import CapturePipeline
+    from live_packet_capture import capture_loop, handle_prediction, start_forensic_writer, LAYOUT, MODEL_VERSION
+
+    workers = app_module.PIPELINE_WORKERS
+    if workers > 0 and app_module.__name__ == '__main__':
+        # Every spawned pipeline process would re-run app.py's startup
+        logger.warning('PDMS_PIPELINE_WORKERS needs `python server.py`; using the capture thread instead')
+        workers = 0
+    if workers > 0:
+        # Dissection and scoring in separate processes, merged back here
+        start_forensic_writer()
+        pipeline = CapturePipeline(handle_prediction, LAYOUT.width, workers=workers,
+                                   model_version=MODEL_VERSION).start()
+        app_module.PIPELINE = pipeline
+        # Stops the processes and frees the shared ring on exit, Ctrl+C or SIGTERM
+        atexit.register(pipeline.stop)
+        signal.signal(signal.SIGTERM, _terminate)
+    else:
+        # Start live packet capture in a background thread
+        threading.Thread(target=capture_loop, daemon=True).start()
+    # No reloader: it would import the app (capture, forensic writer) in a second process
+    app_module.app.run(host=HOST, port=PORT, debug=True, use_reloader=False)
+
+
+if __name__ == '__main__':
+    main()
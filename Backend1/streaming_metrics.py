@@ -0,0 +1,116 @@
+"""
+Streaming classification metrics for PDMS
+Confusion-matrix accumulators that are updated in O(batch) as labelled
+predictions arrive and derive accuracy and macro precision/recall/F1 on demand
+in O(classes^2), matching sklearn's accuracy_score and
+precision/recall/f1_score(average='macro', zero_division=0).
+
+- ConfusionMatrix: everything seen since start
+- SlidingWindowConfusion: the last ``window`` labelled predictions
+- DecayedConfusion: exponentially decayed counts with a half-life in samples
+
+Each accumulator has its own lock, so concurrent request threads can update
+and read it.
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class ConfusionMatrix:
+    def __init__(self):
+        self.labels = []
+        self._codes = {}
+        self.matrix = np.zeros((0, 0), dtype=np.float64)
+        self._lock = threading.Lock()
+
+    def _code(self, label):
+        code = self._codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.labels.append(label)
+            self._codes[label] = code
+            self.matrix = np.pad(self.matrix, ((0, 1), (0, 1)))
+        return code
+
+    def _encode(self, y_true, y_pred):
+        t = np.fromiter((self._code(label) for label in y_true), dtype=np.intp)
+        p = np.fromiter((self._code(label) for label in y_pred), dtype=np.intp)
+        return t, p
+
+    def update(self, y_true, y_pred):
+        with self._lock:
+            self._update(y_true, y_pred)
+
+    def _update(self, y_true, y_pred):
+        t, p = self._encode(y_true, y_pred)
+        np.add.at(self.matrix, (t, p), 1)
+
+    @property
+    def count(self):
+        with self._lock:
+            return float(self.matrix.sum())
+
+    def metrics(self):
+        """accuracy / macro precision / recall / f1_score, None before any labels"""
+        with self._lock:
+            m = self.matrix.copy()
+        total = m.sum()
+        if total <= 0:
+            return {'accuracy': None, 'precision': None, 'recall': None, 'f1_score': None}
+        tp = np.diag(m)
+        predicted = m.sum(axis=0)
+        actual = m.sum(axis=1)
+        # Like sklearn: macro average over labels present in y_true or y_pred
+        present = (predicted > 0) | (actual > 0)
+        tp, predicted, actual = tp[present], predicted[present], actual[present]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, tp / predicted, 0.0)
+            recall = np.where(actual > 0, tp / actual, 0.0)
+            denom = predicted + actual
+            f1 = np.where(denom > 0, 2 * tp / denom, 0.0)
+        return {
+            'accuracy': float(tp.sum() / total),
+            'precision': float(precision.mean()),
+            'recall': float(recall.mean()),
+            'f1_score': float(f1.mean()),
+        }
+
+
+class SlidingWindowConfusion(ConfusionMatrix):
+    """Confusion matrix over the last ``window`` labelled predictions"""
+
+    def __init__(self, window=1000):
+        super().__init__()
+        self.window = window
+        self._recent = deque()
+
+    def _update(self, y_true, y_pred):
+        t, p = self._encode(y_true, y_pred)
+        np.add.at(self.matrix, (t, p), 1)
+        self._recent.extend(zip(t.tolist(), p.tolist()))
+        excess = len(self._recent) - self.window
+        if excess > 0:
+            old = [self._recent.popleft() for _ in range(excess)]
+            ot, op = zip(*old)
+            np.subtract.at(self.matrix, (np.array(ot), np.array(op)), 1)
+
+
+class DecayedConfusion(ConfusionMatrix):
+    """Confusion matrix whose counts halve every ``half_life`` labelled predictions"""
+
+    def __init__(self, half_life=1000):
+        super().__init__()
+        self.decay = 0.5 ** (1.0 / half_life)
+
+    def _update(self, y_true, y_pred):
+        t, p = self._encode(y_true, y_pred)
+        n = len(t)
+        if n == 0:
+            return
+        self.matrix *= self.decay ** n
+        # The newest sample in the batch gets weight 1, older ones decay
+        weights = self.decay ** np.arange(n - 1, -1, -1, dtype=np.float64)
+        np.add.at(self.matrix, (t, p), weights)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from chunked_training import MIN_CLASS_ROWS, StratifiedReservoir, class_allocation
+
+
+def feed(reservoir, y, chunk_rows):
+    """Rows whose single feature is their stream position, in chunks"""
+    X = np.arange(len(y), dtype=np.float32).reshape(-1, 1)
+    for start in range(0, len(y), chunk_rows):
+        reservoir.add(X[start:start + chunk_rows], y[start:start + chunk_rows])
+
+
+def test_keeps_everything_that_fits():
+    y = np.array(['a', 'b', 'a', 'a', 'b', 'c'], dtype=object)
+    reservoir = StratifiedReservoir({'a': 3, 'b': 5, 'c': 1}, width=1)
+    feed(reservoir, y, chunk_rows=4)
+    X, labels = reservoir.sample()
+    assert X[:, 0].tolist() == [0, 2, 3, 1, 4, 5]
+    assert labels.tolist() == ['a', 'a', 'a', 'b', 'b', 'c']
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 7, 100])
+def test_sample_is_uniform(chunk_rows):
+    # 20 rows of 'a' into 5 slots, 10 rows of 'b' into 10: every 'a' row kept with probability 1/4
+    y = np.array(['a', 'b'] * 10 + ['a'] * 10, dtype=object)
+    trials = 1000
+    kept = np.zeros(len(y))
+    for seed in range(trials):
+        reservoir = StratifiedReservoir({'a': 5, 'b': 10}, width=1, seed=seed)
+        feed(reservoir, y, chunk_rows)
+        X, labels = reservoir.sample()
+        assert (labels == 'a').sum() == 5 and (labels == 'b').sum() == 10
+        # Sampled rows belong to their class, without duplicates
+        assert (y[X[:, 0].astype(int)] == labels).all()
+        assert len(set(X[:, 0].tolist())) == 15
+        kept[X[:, 0].astype(int)] += 1
+    frequency = kept[y == 'a'] / trials
+    # Binomial(1000, 0.25): standard deviation about 0.014
+    assert np.abs(frequency - 0.25).max() < 0.06
+    assert (kept[y == 'b'] == trials).all()
+
+
+def test_class_allocation():
+    assert class_allocation({'a': 10, 'b': 5}, 100) == {'a': 10, 'b': 5}
+    counts = {'Benign': 900000, 'DoS': 99000, 'R2L': 500, 'U2R': 5000}
+    allocation = class_allocation(counts, 100000)
+    total = sum(counts.values())
+    # Common classes get their share of the rows
+    assert allocation['Benign'] == 100000 * 900000 // total
+    assert allocation['DoS'] == 100000 * 99000 // total
+    # Rare classes are kept whole up to MIN_CLASS_ROWS
+    assert allocation['R2L'] == 500 and allocation['U2R'] == MIN_CLASS_ROWS
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from compiled_forest import CompiledForest, compile_model
+
+
+def fitted_forest(labels, seed=0, n_rows=400, n_features=8, **kwargs):
+    """(model, training rows, fresh rows) for a forest over random data"""
+    rng = np.random.default_rng(seed)
+    X = rng.random((n_rows, n_features)).astype(np.float32)
+    # Some structure plus noise, so trees are deep and leaves impure
+    score = X[:, 0] + 0.5 * X[:, 1] + rng.normal(0, 0.2, n_rows)
+    classes = np.asarray(labels)
+    if classes.dtype.kind == 'U':
+        # String labels reach the model as object columns from pandas
+        classes = classes.astype(object)
+    y = classes[np.digitize(score, np.quantile(score, np.linspace(0, 1, len(labels) + 1)[1:-1]))]
+    model = RandomForestClassifier(n_estimators=15, random_state=seed, **kwargs).fit(X, y)
+    return model, X, rng.random((300, n_features)).astype(np.float32)
+
+
+def assert_parity(forest, model, X):
+    np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-12)
+    assert (forest.predict(X) == model.predict(X)).all()
+
+
+LABELS = [
+    [0, 1],
+    [3, 7, 11],
+    ['Benign', 'Malicious'],
+    ['DoS', 'Probe', 'Benign', 'R2L'],
+]
+
+
+@pytest.mark.parametrize('labels', LABELS)
+def test_parity_with_sklearn(labels):
+    model, X_train, X = fitted_forest(labels)
+    forest = CompiledForest.from_sklearn(model)
+    assert_parity(forest, model, X)
+    # Training rows sit exactly on split thresholds
+    assert_parity(forest, model, X_train)
+    assert forest.predict(X).dtype == model.classes_.dtype
+
+
+def test_rows_on_split_thresholds():
+    # float64 values at and around the thresholds: both sides must round them to float32 the same way
+    model, _, X = fitted_forest(['Benign', 'Malicious', 'Probe'])
+    rng = np.random.default_rng(3)
+    rows = []
+    for est in model.estimators_[:5]:
+        tree = est.tree_
+        for node in np.flatnonzero(tree.children_left != -1)[:20]:
+            for nudge in (-1e-9, 0.0, 1e-9):
+                row = X[rng.integers(len(X))].astype(np.float64)
+                row[tree.feature[node]] = tree.threshold[node] + nudge
+                rows.append(row)
+    assert_parity(CompiledForest.from_sklearn(model), model, np.array(rows))
+
+
+def test_single_row_and_limited_depth():
+    model, _, X = fitted_forest(['Benign', 'Malicious'], max_depth=3, min_samples_leaf=5)
+    forest = CompiledForest.from_sklearn(model)
+    assert forest.predict(X[0]).tolist() == model.predict(X[:1]).tolist()
+    assert_parity(forest, model, X)
+
+
+def test_missing_values_follow_sklearn():
+    rng = np.random.default_rng(2)
+    X = rng.random((300, 5))
+    X[rng.random(X.shape) < 0.1] = np.nan
+    y = np.where(np.nan_to_num(X[:, 0], nan=0.9) > 0.5, 'Malicious', 'Benign')
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    X_test = rng.random((200, 5))
+    X_test[rng.random(X_test.shape) < 0.2] = np.nan
+    assert_parity(CompiledForest.from_sklearn(model), model, X_test)
+
+
+@pytest.mark.parametrize('labels', [LABELS[0], LABELS[3]])
+def test_save_and_load(tmp_path, labels):
+    model, _, X = fitted_forest(labels)
+    forest = CompiledForest.from_sklearn(model)
+    forest.save(tmp_path / 'forest.npz')
+    loaded = CompiledForest.load(tmp_path / 'forest.npz')
+    assert loaded.depth == forest.depth
+    assert_parity(loaded, model, X)
+
+
+@pytest.mark.parametrize('labels', [LABELS[0], LABELS[3]])
+def test_save_and_memory_map_arrays(tmp_path, labels):
+    model, _, X = fitted_forest(labels)
+    CompiledForest.from_sklearn(model).save_arrays(tmp_path / 'forest')
+    loaded = CompiledForest.load_arrays(tmp_path / 'forest')
+    assert isinstance(loaded.value, np.memmap)
+    assert_parity(loaded, model, X)
+
+
+def test_compile_model_only_takes_forests():
+    model = fitted_forest(LABELS[0])[0]
+    assert isinstance(compile_model(model), CompiledForest)
+    assert compile_model(DecisionTreeClassifier().fit([[0], [1]], [0, 1])) is None
+    assert compile_model(object()) is None
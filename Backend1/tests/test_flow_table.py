@@ -0,0 +1,136 @@
+import random
+
+import pytest
+
+from flow_table import TCP_ACK, TCP_FIN, TCP_RST, TCP_SYN, FlowTable, service_for
+
+HOSTS = [f'10.0.0.{i}' for i in range(6)]
+PORTS = [22, 53, 80, 443, 6667]
+
+
+def random_packets(n, seed=0):
+    """(ts, src, dst, sport, dport, proto, length): new connections mixed with replies on old ones"""
+    rng = random.Random(seed)
+    ts, packets, opened = 0.0, [], []
+    for _ in range(n):
+        ts += rng.expovariate(20)
+        if opened and rng.random() < 0.3:
+            src, dst, sport, dport, proto = rng.choice(opened)
+            packets.append((ts, dst, src, dport, sport, proto, rng.randrange(40, 1500)))
+            continue
+        conn = (rng.choice(HOSTS), rng.choice(HOSTS), rng.randrange(1024, 1100), rng.choice(PORTS),
+                rng.choice(['TCP', 'UDP']))
+        opened.append(conn)
+        packets.append((ts, *conn, rng.randrange(40, 1500)))
+    return packets
+
+
+def reference(conns, c, time_window, host_window):
+    """KDD window counts for connection c, recomputed from every connection seen so far"""
+    recent = [x for x in conns if c.last - x.start <= time_window]
+    last = conns[-host_window:]
+    count = sum(x.dst == c.dst for x in recent)
+    same_srv = sum(x.dst == c.dst and x.service == c.service for x in recent)
+    host_count = sum(x.dst == c.dst for x in last)
+    host_same_srv = sum(x.dst == c.dst and x.service == c.service for x in last)
+    return {
+        'count': count,
+        'srv_count': sum(x.service == c.service for x in recent),
+        'same_srv_rate': same_srv / count if count else 0.0,
+        'dst_host_count': host_count,
+        'dst_host_srv_count': sum(x.service == c.service for x in last),
+        'dst_host_same_srv_rate': host_same_srv / host_count if host_count else 0.0,
+        'dst_host_same_src_port_rate':
+            sum(x.dst == c.dst and x.sport == c.sport for x in last) / host_count if host_count else 0.0,
+    }
+
+
+def test_window_counters_match_recount():
+    table = FlowTable(time_window=2.0, host_window=30, idle_timeout=1e9)
+    conns = []
+    for ts, src, dst, sport, dport, proto, length in random_packets(2000):
+        c = table.update(ts, src, dst, sport, dport, proto, length)
+        if c.start == ts:
+            # Opened by this packet
+            conns.append(c)
+        features = table.features(c)
+        for name, value in reference(conns, c, 2.0, 30).items():
+            assert features[name] == pytest.approx(value), name
+
+
+def test_bytes_by_direction():
+    table = FlowTable()
+    c = table.update(0.0, '10.0.0.1', '10.0.0.2', 1234, 80, 'TCP', 100)
+    assert table.update(0.5, '10.0.0.2', '10.0.0.1', 80, 1234, 'TCP', 700) is c
+    table.update(3.0, '10.0.0.1', '10.0.0.2', 1234, 80, 'TCP', 50)
+    features = table.features(c)
+    assert (features['src_bytes'], features['dst_bytes'], features['duration']) == (150, 700, 3)
+
+
+@pytest.mark.parametrize('packets, flag', [
+    # (forward?, tcp flags) in order
+    ([(True, TCP_SYN)], 'S0'),
+    ([(True, TCP_SYN), (False, TCP_SYN | TCP_ACK)], 'S1'),
+    ([(True, TCP_SYN), (False, TCP_SYN | TCP_ACK), (True, TCP_FIN | TCP_ACK)], 'SF'),
+    ([(True, TCP_SYN), (False, TCP_RST)], 'REJ'),
+    ([(True, TCP_SYN), (True, TCP_RST)], 'RSTOS0'),
+    ([(True, TCP_SYN), (False, TCP_SYN | TCP_ACK), (True, TCP_RST)], 'RSTO'),
+    ([(True, TCP_SYN), (False, TCP_SYN | TCP_ACK), (False, TCP_RST)], 'RSTR'),
+])
+def test_tcp_flags(packets, flag):
+    table = FlowTable()
+    for i, (forward, flags) in enumerate(packets):
+        src, dst, sport, dport = ('10.0.0.1', '10.0.0.2', 1234, 80) if forward else ('10.0.0.2', '10.0.0.1', 80, 1234)
+        c = table.update(i * 0.1, src, dst, sport, dport, 'TCP', 60, tcp_flags=flags)
+    assert c.flag == flag
+
+
+def test_error_rates_follow_flag_changes():
+    table = FlowTable()
+    # Three half-open connections to one host, one of them then rejected
+    for sport in (1001, 1002, 1003):
+        c = table.update(0.0, '10.0.0.1', '10.0.0.2', sport, 80, 'TCP', 60, tcp_flags=TCP_SYN)
+    assert table.features(c)['serror_rate'] == pytest.approx(1.0)
+    table.update(0.1, '10.0.0.2', '10.0.0.1', 80, 1003, 'TCP', 60, tcp_flags=TCP_RST)
+    features = table.features(c)
+    assert features['serror_rate'] == pytest.approx(2 / 3)
+    assert features['rerror_rate'] == pytest.approx(1 / 3)
+    assert features['dst_host_serror_rate'] == pytest.approx(2 / 3)
+    assert features['dst_host_rerror_rate'] == pytest.approx(1 / 3)
+
+
+def test_idle_flows_are_evicted():
+    table = FlowTable(idle_timeout=10.0)
+    first = table.update(0.0, '10.0.0.1', '10.0.0.2', 1234, 80, 'TCP', 60)
+    table.update(5.0, '10.0.0.3', '10.0.0.2', 1234, 80, 'TCP', 60)
+    table.update(12.0, '10.0.0.3', '10.0.0.2', 1234, 80, 'TCP', 60)
+    assert table.stats()['flows'] == 1 and table.evicted_idle == 1
+    # The same 5-tuple later is a new connection
+    assert table.update(13.0, '10.0.0.1', '10.0.0.2', 1234, 80, 'TCP', 60) is not first
+
+
+def test_flow_cap_evicts_least_recently_used():
+    table = FlowTable(max_flows=2)
+    a = table.update(0.0, '10.0.0.1', '10.0.0.9', 1001, 80, 'TCP', 60)
+    table.update(0.1, '10.0.0.2', '10.0.0.9', 1002, 80, 'TCP', 60)
+    table.update(0.2, '10.0.0.1', '10.0.0.9', 1001, 80, 'TCP', 60)
+    table.update(0.3, '10.0.0.3', '10.0.0.9', 1003, 80, 'TCP', 60)
+    assert table.evicted_cap == 1
+    assert a.key in table.flows and len(table.flows) == 2
+
+
+def test_memory_cap():
+    assert FlowTable.with_memory_cap(1).max_flows == 1024
+    assert FlowTable.with_memory_cap(0).max_flows == 1
+
+
+@pytest.mark.parametrize('proto, port, icmp_type, service', [
+    ('TCP', 80, None, 'http'),
+    ('UDP', 53, None, 'domain_u'),
+    ('TCP', 53, None, 'domain'),
+    ('TCP', 50000, None, 'private'),
+    ('TCP', 8081, None, 'other'),
+    ('ICMP', 0, 8, 'eco_i'),
+])
+def test_service_for(proto, port, icmp_type, service):
+    assert service_for(proto, port, icmp_type) == service
@@ -0,0 +1,163 @@
+import csv
+import os
+import random
+
+import pytest
+
+import forensic_index
+from forensic_index import FIELDS, CursorError, ForensicIndex, ForensicLogReader
+
+PROTOCOLS = ['TCP', 'UDP', 'ICMP']
+
+
+def make_records(n, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'timestamp': f'2026-01-01 {i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}',
+        'src': f'10.0.0.{rng.randrange(12)}',
+        'dst': f'192.168.1.{rng.randrange(4)}',
+        'protocol': rng.choice(PROTOCOLS),
+        'length': str(i),  # unique: identifies the row
+        'prediction': 'Malicious' if rng.random() < 0.1 else 'Benign',
+    } for i in range(n)]
+
+
+def write_log(path, records, block_rows=37):
+    """Write records the way ForensicLogWriter does: one index block per flushed batch"""
+    index = ForensicIndex(str(path))
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        f.flush()
+        for start in range(0, len(records), block_rows):
+            batch = records[start:start + block_rows]
+            offset = os.fstat(f.fileno()).st_size
+            writer.writerows([r[k] for k in FIELDS] for r in batch)
+            f.flush()
+            index.add_block(offset, os.fstat(f.fileno()).st_size, batch)
+    return index
+
+
+def expected(records, since=None, until=None, ip=None, src=None, dst=None, protocol=None, prediction=None):
+    return [r for r in reversed(records)
+            if not (since and r['timestamp'] < since)
+            and not (until and r['timestamp'] > until)
+            and not (ip and ip not in (r['src'], r['dst']))
+            and not (src and r['src'] != src)
+            and not (dst and r['dst'] != dst)
+            and not (protocol and r['protocol'] != protocol)
+            and not (prediction and r['prediction'] != prediction)]
+
+
+def all_pages(index, limit, **filters):
+    """Every row, newest first, following next_cursor; also the number of pages"""
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = index.query(limit=limit, cursor=cursor, **filters)
+        pages += 1
+        assert len(page) <= limit
+        assert page or pages == 1, 'a next_cursor led to an empty page'
+        rows.extend(reversed(page))
+        if cursor is None:
+            return rows, pages
+
+
+FILTERS = [
+    {},
+    {'ip': '10.0.0.3'},
+    {'src': '10.0.0.5', 'protocol': 'UDP'},
+    {'dst': '192.168.1.2', 'prediction': 'Malicious'},
+    {'since': '2026-01-01 00:05:00', 'until': '2026-01-01 00:09:59'},
+    {'ip': '192.168.1.0', 'since': '2026-01-01 00:12:00', 'prediction': 'Benign'},
+    {'protocol': 'ICMP', 'prediction': 'Malicious'},
+    {'ip': '10.9.9.9'},
+]
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('limit', [1, 7, 100, 5000])
+def test_paging_returns_every_match_once(tmp_path, filters, limit):
+    records = make_records(1000)
+    index = write_log(tmp_path / 'log.csv', records)
+    rows, _ = all_pages(index, limit, **filters)
+    assert rows == expected(records, **filters)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_blocks_without_ip_sets_are_scanned(tmp_path, monkeypatch, filters):
+    # Blocks with more distinct values than MAX_BLOCK_SET store no sets and must still be searched
+    monkeypatch.setattr(forensic_index, 'MAX_BLOCK_SET', 3)
+    records = make_records(600, seed=1)
+    index = write_log(tmp_path / 'log.csv', records)
+    assert index.unindexed_ip_blocks
+    rows, _ = all_pages(index, 9, **filters)
+    assert rows == expected(records, **filters)
+
+
+def test_rebuild_gives_the_same_answers(tmp_path):
+    records = make_records(700, seed=2)
+    path = tmp_path / 'log.csv'
+    write_log(path, records).close()
+    os.remove(str(path) + forensic_index.INDEX_SUFFIX)
+    rebuilt = ForensicIndex.open(str(path))
+    assert rebuilt.end == os.path.getsize(path)
+    for filters in FILTERS:
+        assert all_pages(rebuilt, 50, **filters)[0] == expected(records, **filters)
+
+
+def test_rebuild_skips_a_partial_last_row(tmp_path):
+    records = make_records(50)
+    path = tmp_path / 'log.csv'
+    write_log(path, records).close()
+    with open(path, 'a') as f:
+        f.write('2026-01-01 01:00:00,10.0.0.1,1.1.1.1,TC')
+    os.remove(str(path) + forensic_index.INDEX_SUFFIX)
+    rows, _ = all_pages(ForensicIndex.open(str(path)), 1000)
+    assert rows == expected(records)
+
+
+def test_no_cursor_when_the_last_match_fills_the_page(tmp_path):
+    records = make_records(1000)
+    index = write_log(tmp_path / 'log.csv', records)
+    matches = expected(records, src='10.0.0.4', protocol='TCP')
+    page, cursor = index.query(limit=len(matches), src='10.0.0.4', protocol='TCP')
+    assert len(page) == len(matches)
+    assert cursor is None
+    # One short of the end: the cursor leads to exactly the remaining row
+    page, cursor = index.query(limit=len(matches) - 1, src='10.0.0.4', protocol='TCP')
+    assert cursor is not None
+    page, cursor = index.query(limit=10, cursor=cursor, src='10.0.0.4', protocol='TCP')
+    assert page == [matches[-1]] and cursor is None
+
+
+def test_cursor_of_another_segment_is_rejected(tmp_path):
+    index = write_log(tmp_path / 'log.csv', make_records(100))
+    _, cursor = index.query(limit=10)
+    other = write_log(tmp_path / 'other.csv', make_records(100))
+    with pytest.raises(CursorError):
+        other.query(limit=10, cursor=cursor)
+    with pytest.raises(CursorError):
+        index.query(limit=10, cursor='not-a-cursor')
+
+
+def test_reader_follows_appends_and_replacement(tmp_path):
+    path = tmp_path / 'log.csv'
+    reader = ForensicLogReader(str(path))
+    assert reader.query(limit=10) == ([], None)
+    records = make_records(200)
+    write_log(path, records[:100]).close()
+    sidecar = str(path) + forensic_index.INDEX_SUFFIX
+    assert all_pages(reader, 30)[0] == expected(records[:100])
+    # Rows appended by the writer process, without a sidecar entry yet
+    with open(path, 'a', newline='') as f:
+        csv.writer(f).writerows([r[k] for k in FIELDS] for r in records[100:])
+    sidecar_size = os.path.getsize(sidecar)
+    assert all_pages(reader, 30)[0] == expected(records)
+    # Read-only: the sidecar belongs to the writer
+    assert os.path.getsize(sidecar) == sidecar_size
+    # Rotated: a new segment at the same path
+    os.replace(path, tmp_path / 'archived.csv')
+    os.remove(str(path) + forensic_index.INDEX_SUFFIX)
+    fresh = make_records(20, seed=5)
+    write_log(path, fresh).close()
+    assert all_pages(reader, 30)[0] == expected(fresh)
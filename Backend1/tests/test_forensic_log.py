@@ -0,0 +1,21 @@
+import forensic_log
+from forensic_log import FORENSIC_FIELDS, ForensicLogWriter, compact_segment
+
+
+def test_compact_segment_failure_keeps_csv(tmp_path):
+    # Torn last line: 'length' cannot be cast to int32
+    path = tmp_path / 'segment.csv'
+    path.write_text(','.join(FORENSIC_FIELDS) + '\n'
+                    + '2026-01-01 00:00:00,10.0.0.1,10.0.0.2,TCP,60,Benign\n'
+                    + '2026-01-01 00:00:01,10.0.0.1,10.0.0.2,TCP,6x\n')
+    assert compact_segment(str(path)) is None
+    assert path.exists()
+    assert not (tmp_path / 'segment.parquet').exists()
+
+
+def test_compaction_failures_in_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(forensic_log, 'compact_segment', lambda csv_path: None)
+    writer = ForensicLogWriter(path=str(tmp_path / 'forensic_log.csv'),
+                               archive_dir=str(tmp_path / 'archive'))
+    writer._compact(str(tmp_path / 'rotated.csv'))
+    assert writer.stats()['compaction_failures'] == 1
@@ -0,0 +1,91 @@
+import ipaddress
+import random
+
+import pytest
+
+from ip_reputation import IPReputation, ReputationIndex, flatten, parse_network, read_blocklist
+
+
+def random_networks(n, seed=0):
+    """Nested and overlapping IPv4 and IPv6 networks, as blocklist text"""
+    rng = random.Random(seed)
+    networks = []
+    for _ in range(n):
+        if rng.random() < 0.8:
+            address = ipaddress.IPv4Address(rng.choice([0x0A000000, 0xC0A80000]) + rng.getrandbits(16))
+            networks.append(f'{address}/{rng.choice([8, 12, 16, 20, 24, 28, 30, 32])}')
+        else:
+            address = ipaddress.IPv6Address((0x20010db8 << 96) + (rng.getrandbits(32) << 64) + rng.getrandbits(64))
+            networks.append(f'{address}/{rng.choice([32, 48, 64, 96, 128])}')
+    return networks
+
+
+def brute_force(networks, ip):
+    """(network, source) of the longest prefix containing ip; the last one listed wins ties"""
+    address = ipaddress.ip_address(ip)
+    best = None
+    for network, text, source in networks:
+        if address.version == network.version and address in network:
+            if best is None or network.prefixlen >= best[0]:
+                best = (network.prefixlen, text, source)
+    return best and best[1:]
+
+
+def test_parse_network():
+    assert parse_network('10.1.2.3/8') == (4, 0x0A000000, 0x0AFFFFFF)
+    assert parse_network('10.1.2.3') == (4, 0x0A010203, 0x0A010203)
+    assert parse_network('2001:db8::/32')[0] == 6
+    for bad in ('10.0.0.0/33', 'example.com', '10.0.0', '::1/129'):
+        with pytest.raises(ValueError):
+            parse_network(bad)
+
+
+def test_flatten_picks_innermost_range():
+    starts, ends, payloads = flatten([(0, 99, 'outer'), (10, 19, 'inner'), (15, 16, 'innermost'), (50, 99, 'tail')])
+    assert list(zip(starts, ends, payloads)) == [
+        (0, 9, 'outer'), (10, 14, 'inner'), (15, 16, 'innermost'), (17, 19, 'inner'),
+        (20, 49, 'outer'), (50, 99, 'tail'),
+    ]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_lookup_matches_brute_force(seed):
+    networks = [(text, f'list{i % 3}.txt') for i, text in enumerate(random_networks(300, seed))]
+    index = ReputationIndex([(*parse_network(text), text, source) for text, source in networks])
+    assert len(index) == len(networks)
+    rng = random.Random(seed)
+    probes = [str(ipaddress.IPv4Address(rng.choice([0x0A000000, 0xC0A80000, 0x08080000]) + rng.getrandbits(16)))
+              for _ in range(2000)]
+    probes += [str(ipaddress.IPv6Address((0x20010db8 << 96) + (rng.getrandbits(32) << 64) + rng.getrandbits(64)))
+               for _ in range(300)]
+    # Network and broadcast addresses sit on range edges
+    for text, _ in networks:
+        network = ipaddress.ip_network(text, strict=False)
+        probes += [str(network.network_address), str(network.broadcast_address)]
+    parsed = [(ipaddress.ip_network(text, strict=False), text, source) for text, source in networks]
+    for ip in probes:
+        expected = brute_force(parsed, ip)
+        assert index.lookup(ip) == expected, ip
+        # Second lookup comes from the cache
+        assert index.lookup(ip) == expected, ip
+
+
+@pytest.mark.parametrize('ip', ['', 'not an ip', '10.0.0', None, '::g'])
+def test_lookup_of_non_addresses(ip):
+    index = ReputationIndex([(*parse_network('0.0.0.0/0'), '0.0.0.0/0', 'all.txt')])
+    assert index.lookup(ip) is None
+
+
+def test_blocklist_files_and_reload(tmp_path):
+    (tmp_path / 'a.txt').write_text('# comment\n10.0.0.0/8 ; spamhaus\n\n10.1.0.0/16 extra columns\nbogus\n')
+    assert read_blocklist(tmp_path / 'a.txt') == ([(4, 0x0A000000, 0x0AFFFFFF, '10.0.0.0/8'),
+                                                   (4, 0x0A010000, 0x0A01FFFF, '10.1.0.0/16')], 1)
+    reputation = IPReputation(directory=str(tmp_path), interval=0)
+    assert reputation.lookup('10.1.2.3') == ('10.1.0.0/16', 'a.txt')
+    assert reputation.is_listed('10.2.0.1') and not reputation.is_listed('11.0.0.1')
+    assert not reputation.reload()
+    (tmp_path / 'b.txt').write_text('11.0.0.0/24\n10.1.2.0/24\n')
+    assert reputation.reload()
+    assert reputation.lookup('10.1.2.3') == ('10.1.2.0/24', 'b.txt')
+    assert reputation.is_listed('11.0.0.1')
+    assert reputation.stats()['files'] == {'a.txt': 2, 'b.txt': 2}
@@ -0,0 +1,66 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from prediction_store import MAX_LABELS, PredictionRing
+
+
+def record(i, prediction='Benign'):
+    return {'timestamp': f'2026-01-01 00:00:{i % 60:02d}', 'src': f'10.0.0.{i % 256}',
+            'dst': '192.168.1.1', 'protocol': 'TCP', 'length': i, 'prediction': prediction}
+
+
+def test_empty_ring():
+    ring = PredictionRing(capacity=8)
+    assert len(ring) == 0 and ring.tail(5) == []
+    assert ring.window_counts() == {} and ring.total_counts() == {}
+
+
+@pytest.mark.parametrize('appended', [0, 3, 7, 8, 9, 15, 16, 17, 100])
+def test_tail_matches_list(appended):
+    ring = PredictionRing(capacity=8)
+    records = [record(i, ['Benign', 'Malicious', 'Error'][i % 3]) for i in range(appended)]
+    for r in records:
+        ring.append(r)
+    assert len(ring) == min(appended, 8)
+    # A full ring keeps back the slot written next
+    readable = min(appended, 7)
+    for n in range(10):
+        assert ring.tail(n) == records[len(records) - min(n, readable):], n
+    held = records[-8:]
+    assert ring.window_counts() == dict(Counter(r['prediction'] for r in held))
+    assert ring.total_counts() == dict(Counter(r['prediction'] for r in records))
+
+
+def test_new_labels_get_codes():
+    ring = PredictionRing(capacity=4)
+    ring.append(record(0, 'Probe'))
+    assert ring.tail(1)[0]['prediction'] == 'Probe'
+    for i in range(MAX_LABELS + 5):
+        ring.code(f'label-{i}')
+    # Past MAX_LABELS new labels fall back to 'Unknown'
+    assert len(ring.labels) == MAX_LABELS
+    assert ring.code('one too many') == ring.code('Unknown')
+
+
+def test_readers_see_whole_records_while_writing():
+    ring = PredictionRing(capacity=64)
+    done = threading.Event()
+    errors = []
+
+    def read():
+        while not done.is_set():
+            rows = ring.tail(64)
+            lengths = [r['length'] for r in rows]
+            # Oldest first and contiguous
+            if lengths and lengths != list(range(lengths[0], lengths[0] + len(lengths))):
+                errors.append(lengths)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for i in range(20000):
+        ring.append(record(i))
+    done.set()
+    reader.join()
+    assert not errors
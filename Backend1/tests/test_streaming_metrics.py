@@ -0,0 +1,96 @@
+import threading
+
+import numpy as np
+import pytest
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+from streaming_metrics import ConfusionMatrix, DecayedConfusion, SlidingWindowConfusion
+
+LABELS = ['Benign', 'Malicious', 'Probe', 'DoS']
+
+
+def batches(n_batches=40, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_batches):
+        n = int(rng.integers(1, 60))
+        # Labels appear over time, so the matrix grows between batches
+        k = min(len(LABELS), 2 + int(rng.integers(0, 3)))
+        y_true = [LABELS[i] for i in rng.integers(0, k, n)]
+        y_pred = [y if rng.random() < 0.7 else LABELS[int(rng.integers(0, k))] for y in y_true]
+        yield y_true, y_pred
+
+
+def sklearn_metrics(y_true, y_pred, sample_weight=None):
+    kwargs = {'average': 'macro', 'zero_division': 0, 'sample_weight': sample_weight}
+    return {
+        'accuracy': accuracy_score(y_true, y_pred, sample_weight=sample_weight),
+        'precision': precision_score(y_true, y_pred, **kwargs),
+        'recall': recall_score(y_true, y_pred, **kwargs),
+        'f1_score': f1_score(y_true, y_pred, **kwargs),
+    }
+
+
+def assert_close(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        assert actual[key] == pytest.approx(expected[key], abs=1e-9), key
+
+
+def test_empty_tracker_has_no_metrics():
+    assert ConfusionMatrix().metrics() == {'accuracy': None, 'precision': None, 'recall': None, 'f1_score': None}
+
+
+def test_cumulative_matches_sklearn():
+    tracker = ConfusionMatrix()
+    all_true, all_pred = [], []
+    for y_true, y_pred in batches():
+        tracker.update(y_true, y_pred)
+        all_true += y_true
+        all_pred += y_pred
+        assert_close(tracker.metrics(), sklearn_metrics(all_true, all_pred))
+    assert tracker.count == len(all_true)
+
+
+@pytest.mark.parametrize('window', [1, 25, 300])
+def test_sliding_window_matches_sklearn_on_the_last_rows(window):
+    tracker = SlidingWindowConfusion(window)
+    all_true, all_pred = [], []
+    for y_true, y_pred in batches(seed=1):
+        tracker.update(y_true, y_pred)
+        all_true += y_true
+        all_pred += y_pred
+        assert_close(tracker.metrics(), sklearn_metrics(all_true[-window:], all_pred[-window:]))
+    assert tracker.count == min(window, len(all_true))
+
+
+@pytest.mark.parametrize('half_life', [10, 200])
+def test_decayed_matches_sklearn_with_decay_weights(half_life):
+    tracker = DecayedConfusion(half_life)
+    all_true, all_pred = [], []
+    for y_true, y_pred in batches(seed=2):
+        tracker.update(y_true, y_pred)
+        all_true += y_true
+        all_pred += y_pred
+        # The newest row has weight 1 and each older row 0.5 ** (1 / half_life) less
+        ages = np.arange(len(all_true) - 1, -1, -1)
+        weights = 0.5 ** (ages / half_life)
+        assert_close(tracker.metrics(), sklearn_metrics(all_true, all_pred, sample_weight=weights))
+
+
+@pytest.mark.parametrize('cls', [ConfusionMatrix, SlidingWindowConfusion])
+def test_concurrent_updates_are_not_lost(cls):
+    tracker = cls(10 ** 9) if cls is SlidingWindowConfusion else cls()
+    threads_n, updates, rows = 8, 200, 5
+
+    def work(seed):
+        rng = np.random.default_rng(seed)
+        for _ in range(updates):
+            # New labels keep arriving, which grows the matrix under the other threads
+            tracker.update([f'label{int(rng.integers(0, 50))}' for _ in range(rows)], ['Benign'] * rows)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(threads_n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tracker.count == threads_n * updates * rows
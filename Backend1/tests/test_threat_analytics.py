@@ -0,0 +1,92 @@
+import random
+from collections import Counter
+
+import pytest
+
+from rolling_stats import RollingCount
+from threat_analytics import SpaceSaving, ThreatAnalytics, WindowedTopN
+
+
+def zipf_stream(n, keys, seed=0):
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(keys)]
+    return rng.choices([f'10.0.{i // 256}.{i % 256}' for i in range(keys)], weights, k=n)
+
+
+def test_space_saving_exact_below_capacity():
+    summary = SpaceSaving(capacity=50)
+    stream = zipf_stream(5000, 40)
+    for key in stream:
+        summary.add(key)
+    assert {key: count for key, (count, error) in summary.items()} == Counter(stream)
+    assert all(error == 0 for count, error in summary.counters.values())
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_space_saving_guarantees(seed):
+    capacity, stream = 32, zipf_stream(20000, 1000, seed)
+    summary = SpaceSaving(capacity)
+    for key in stream:
+        summary.add(key)
+    true = Counter(stream)
+    counters = dict(summary.items())
+    assert len(counters) == capacity
+    # Counts add up to the stream length and bound the true count from both sides
+    assert sum(count for count, error in counters.values()) == len(stream)
+    for key, (count, error) in counters.items():
+        assert count - error <= true[key] <= count
+    # Every key more frequent than n / capacity is kept
+    for key, n in true.items():
+        if n > len(stream) / capacity:
+            assert key in counters
+    # The minimum bucket is the smallest count
+    assert summary.min == min(count for count, error in counters.values())
+
+
+def test_windowed_top_n():
+    top = WindowedTopN(epoch_seconds=60, epochs=5, capacity=8)
+    for minute, key, n in [(0, 'old', 50), (3, 'a', 10), (3, 'b', 4), (4, 'a', 5), (4, 'c', 7)]:
+        for _ in range(n):
+            top.add(key, minute * 60 + 1)
+    now = 4 * 60 + 30
+    assert top.top(2, 120, now) == [('a', 15, 0), ('c', 7, 0)]
+    # Only the current epoch
+    assert top.top(5, 10, now) == [('c', 7, 0), ('a', 5, 0)]
+    assert top.top(1, 3600, now) == [('old', 50, 0)]
+    # Slots are reused once the ring wraps: minute 0 is gone
+    top.add('new', 5 * 60 + 1)
+    assert 'old' not in [key for key, count, error in top.top(10, 3600, 5 * 60 + 30)]
+
+
+def test_rolling_count_matches_events():
+    rng = random.Random(0)
+    counter = RollingCount(window=60, resolution=5)
+    events, now = [], 1000.0
+    for _ in range(2000):
+        now += rng.expovariate(2) if rng.random() < 0.99 else 90
+        counter.add(now)
+        events.append(now)
+        if rng.random() < 0.1:
+            current = int(now // 5)
+            expected = [sum(int(t // 5) == b for t in events) for b in range(current - 11, current + 1)]
+            series = counter.series(now)
+            assert series['counts'] == expected
+            assert series['start'] == (current - 11) * 5
+            assert counter.total(now) == sum(expected)
+
+
+def test_threat_report_counts_and_talkers():
+    analytics = ThreatAnalytics()
+    now = 100000.0
+    for i in range(30):
+        analytics.add('10.0.0.1' if i % 3 else '10.0.0.2', '192.168.1.1', 'TCP',
+                      'Malicious' if i < 12 else 'Benign', now=now - 30 + i)
+    analytics.add('10.0.0.9', '192.168.1.1', 'UDP', 'Error', now=now)
+    report = analytics.report(window=60, now=now)
+    assert (report['malicious_count'], report['benign_count'], report['total_analyzed']) == (12, 18, 31)
+    assert report['top_threat_sources'][0] == {'src': '10.0.0.1', 'count': 8, 'max_error': 0}
+    assert report['top_threat_protocols'] == [{'protocol': 'TCP', 'count': 12, 'max_error': 0}]
+    assert len(report['threat_timeline']) == 60
+    assert sum(b['malicious'] for b in report['threat_timeline']) == 12
+    # Outside a short window
+    assert analytics.report(window=5, now=now + 60)['total_analyzed'] == 0
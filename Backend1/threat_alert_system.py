@@ -13,12 +13,21 @@ import platform
 import os
 from datetime import datetime
 from collections import deque
+from itertools import islice
 import logging
 
+from alert_aggregator import AlertAggregator
+from alert_dispatcher import AlertDispatcher, LocalBackend
+from ip_reputation import IPReputation
+from rolling_stats import AlertStats
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# High-risk protocols
+HIGH_RISK_PROTOCOLS = frozenset(['SSH', 'TELNET', 'FTP'])
+
 class ThreatAlertSystem:
     def __init__(self):
         self.threat_history = deque(maxlen=1000)
@@ -31,10 +40,17 @@ class ThreatAlertSystem:
         self.active_threats = {}
         self.alert_count = 0
         self.last_alert_time = 0
-        self.alert_cooldown = 3  # seconds between alerts
+        # Counts and alerts-over-time series, kept up to date as alerts are raised
+        self.stats = AlertStats(self.alert_levels)
+        # One alert per (src, dst, protocol, level) incident instead of a global cooldown
+        self.aggregator = AlertAggregator()
+        # Known malicious IPs and networks, from blocklists/*.txt
+        self.reputation = IPReputation()
         
         # Initialize sound system
         self.sound_enabled = platform.system() == 'Windows'
+        # Response actions run asynchronously; detection only pays for an enqueue
+        self.dispatcher = AlertDispatcher(LocalBackend(play_sound=self.play_alert_sound))
     
     def play_alert_sound(self, level):
         """Play alert sound based on threat level"""
@@ -70,37 +86,19 @@ class ThreatAlertSystem:
         protocol = threat_data.get('protocol', '')
         prediction = threat_data.get('prediction', '')
         
-        # Known malicious IPs (example)
-        known_malicious_ips = [
-            '192.168.1.100',  # Example malicious IP
-            '10.0.0.50',      # Example malicious IP
-        ]
-        
-        # High-risk protocols
-        high_risk_protocols = ['SSH', 'TELNET', 'FTP']
-        
         # Determine threat level
-        if src_ip in known_malicious_ips:
+        if self.reputation.is_listed(src_ip):
             return 'critical'
-        elif protocol in high_risk_protocols:
+        elif protocol in HIGH_RISK_PROTOCOLS:
             return 'high'
         elif prediction == 'Malicious':
             return 'medium'
         else:
             return 'low'
     
-    def trigger_alert(self, threat_data):
-        """Trigger comprehensive alert for detected threat"""
-        current_time = time.time()
-        
-        # Check cooldown to prevent spam
-        if current_time - self.last_alert_time < self.alert_cooldown:
-            return None
-        
-        threat_level = self.determine_threat_level(threat_data)
+    def make_alert(self, threat_data, threat_level):
+        """Alert object for a new incident"""
         alert_config = self.alert_levels[threat_level]
-        
-        # Create alert object
         alert = {
             'id': f"alert_{self.alert_count}",
             'timestamp': datetime.now().isoformat(),
@@ -110,106 +108,47 @@ class ThreatAlertSystem:
             'threat_data': threat_data,
             'actions_taken': []
         }
+        self.alert_count += 1
+        return alert
+    
+    def trigger_alert(self, threat_data):
+        """Count a detected threat into its incident; returns the alert if it opened a new one"""
+        threat_level = self.determine_threat_level(threat_data)
+        # Later packets of an open incident only update its counts
+        alert = self.aggregator.observe(threat_data, threat_level, self.make_alert)
+        if alert is None:
+            return None
         
         # Add to history
         self.threat_history.append(alert)
-        self.alert_count += 1
-        self.last_alert_time = current_time
-        
-        # Play alert sound
-        self.play_alert_sound(threat_level)
+        self.last_alert_time = time.time()
+        self.stats.add(threat_level, self.last_alert_time)
         
         # Log alert
         logger.warning(f"🚨 THREAT ALERT [{threat_level.upper()}]: {threat_data.get('src', 'Unknown')} -> {threat_data.get('dst', 'Unknown')} ({threat_data.get('protocol', 'Unknown')})")
         
-        # Execute automated actions
-        actions = self.execute_threat_response(alert)
-        alert['actions_taken'] = actions
+        # Sound and automated actions run on the dispatcher's event loop;
+        # actions_taken fills in as they finish
+        alert['response'] = 'queued' if self.dispatcher.dispatch(alert) else 'dropped'
         
         return alert
     
-    def execute_threat_response(self, alert):
-        """Execute automated response actions based on threat level"""
-        actions = []
-        threat_level = alert['level']
-        threat_data = alert['threat_data']
-        src_ip = threat_data.get('src', '')
-        
-        try:
-            if threat_level in ['high', 'critical']:
-                # Block source IP (simulated)
-                actions.append({
-                    'action': 'block_ip',
-                    'target': src_ip,
-                    'status': 'executed',
-                    'timestamp': datetime.now().isoformat()
-                })
-                logger.info(f"🛡️ Blocked IP: {src_ip}")
-                
-                # Generate firewall rule (simulated)
-                actions.append({
-                    'action': 'firewall_rule',
-                    'rule': f"block {src_ip}",
-                    'status': 'created',
-                    'timestamp': datetime.now().isoformat()
-                })
-                
-            if threat_level == 'critical':
-                # Send emergency notification
-                actions.append({
-                    'action': 'emergency_notification',
-                    'message': f"CRITICAL THREAT DETECTED from {src_ip}",
-                    'status': 'sent',
-                    'timestamp': datetime.now().isoformat()
-                })
-                
-                # Initiate incident response
-                actions.append({
-                    'action': 'incident_response',
-                    'status': 'initiated',
-                    'timestamp': datetime.now().isoformat()
-                })
-                
-            # Always log the threat
-            actions.append({
-                'action': 'threat_log',
-                'status': 'logged',
-                'timestamp': datetime.now().isoformat()
-            })
-            
-        except Exception as e:
-            logger.error(f"Error executing threat response: {e}")
-            actions.append({
-                'action': 'error',
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
-            })
-        
-        return actions
+    def recent_alerts(self, n):
+        """Newest ``n`` alerts, oldest first, without copying the history"""
+        return list(islice(reversed(self.threat_history), n))[::-1]
     
     def get_active_alerts(self):
         """Get currently active alerts"""
-        return list(self.threat_history)[-10:]  # Last 10 alerts
+        return self.recent_alerts(10)  # Last 10 alerts
     
     def get_alert_statistics(self):
         """Get alert statistics"""
-        if not self.threat_history:
-            return {
-                'total_alerts': 0,
-                'alerts_by_level': {},
-                'recent_alerts': []
-            }
-        
-        alerts_by_level = {}
-        for alert in self.threat_history:
-            level = alert['level']
-            alerts_by_level[level] = alerts_by_level.get(level, 0) + 1
-        
         return {
-            'total_alerts': len(self.threat_history),
-            'alerts_by_level': alerts_by_level,
-            'recent_alerts': list(self.threat_history)[-5:],  # Last 5 alerts
-            'alert_rate': self.alert_count / max(1, (time.time() - self.last_alert_time + 1))
+            **self.stats.snapshot(),
+            'recent_alerts': self.recent_alerts(5),  # Last 5 alerts
+            'aggregation': self.aggregator.stats(),
+            'reputation': self.reputation.stats(),
+            'response_dispatcher': self.dispatcher.stats()
         }
 
 # Global alert system instance
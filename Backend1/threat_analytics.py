@@ -0,0 +1,177 @@
+"""
+Streaming threat analytics for PDMS
+The capture path adds every scored packet with ThreatAnalytics.add(); the
+/threat-analysis endpoint reads report(window) without touching the
+packets again.
+
+- Timelines: benign / malicious / other packet counts in per-second buckets
+  for the last hour and per-minute buckets for the last day
+  (rolling_stats.RollingCount).
+- Top talkers: the most frequent sources, destinations and protocols of
+  malicious packets, counted with Space-Saving summaries of TOP_CAPACITY
+  entries. One summary is kept per minute for the last TOP_EPOCHS minutes,
+  and a window's top-N merges the summaries it covers.
+
+Memory is fixed by the bucket and summary sizes; adding a packet costs a
+few dictionary and list updates however much traffic has been seen.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from rolling_stats import RollingCount
+
+# name -> (bucket width in seconds, number of buckets)
+TIMELINE_RESOLUTIONS = {
+    '1s': (1, 3600),
+    '1m': (60, 1440),
+}
+# Windows up to this long are reported per second, longer ones per minute
+SECOND_TIMELINE_MAX_WINDOW = 600
+TOP_CAPACITY = 64
+TOP_EPOCH_SECONDS = 60
+TOP_EPOCHS = 60
+TOP_N = 10
+DEFAULT_WINDOW_SECONDS = 300
+MAX_WINDOW_SECONDS = 24 * 3600
+
+
+class SpaceSaving:
+    """Approximate counts of the most frequent keys in at most ``capacity`` counters
+
+    When the counters are full a new key takes over the smallest one, so a
+    key's count may overestimate by at most its ``error``. Counters are
+    grouped by value, which makes every update O(1).
+    """
+
+    def __init__(self, capacity=TOP_CAPACITY):
+        self.capacity = capacity
+        # key -> [count, error]
+        self.counters = {}
+        # count -> keys with that count
+        self.buckets = {}
+        self.min = 0
+
+    def add(self, key):
+        entry = self.counters.get(key)
+        if entry is None:
+            if len(self.counters) < self.capacity:
+                entry = self.counters[key] = [0, 0]
+            else:
+                smallest = self.buckets[self.min]
+                del self.counters[smallest.pop()]
+                if not smallest:
+                    del self.buckets[self.min]
+                entry = self.counters[key] = [self.min, self.min]
+        count = entry[0]
+        keys = self.buckets.get(count)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.buckets[count]
+        entry[0] = count + 1
+        self.buckets.setdefault(count + 1, set()).add(key)
+        if count == 0:
+            self.min = 1
+        elif count == self.min and count not in self.buckets:
+            self.min = count + 1
+
+    def items(self):
+        return self.counters.items()
+
+
+class WindowedTopN:
+    """Space-Saving summaries per TOP_EPOCH_SECONDS epoch, for top-N over recent windows"""
+
+    def __init__(self, epoch_seconds=TOP_EPOCH_SECONDS, epochs=TOP_EPOCHS, capacity=TOP_CAPACITY):
+        self.epoch_seconds = epoch_seconds
+        self.capacity = capacity
+        # slot -> (epoch, summary)
+        self.ring = [(None, None)] * epochs
+
+    def add(self, key, now):
+        epoch = int(now // self.epoch_seconds)
+        slot = epoch % len(self.ring)
+        current, summary = self.ring[slot]
+        if current != epoch:
+            summary = SpaceSaving(self.capacity)
+            self.ring[slot] = (epoch, summary)
+        summary.add(key)
+
+    def top(self, n, window, now):
+        """[(key, count, max overestimate)] of the ``n`` largest counts in the epochs overlapping ``window``"""
+        last = int(now // self.epoch_seconds)
+        first = max(last - len(self.ring) + 1, int((now - window) // self.epoch_seconds))
+        merged = {}
+        for epoch, summary in self.ring:
+            if epoch is None or not first <= epoch <= last:
+                continue
+            for key, (count, error) in summary.items():
+                total = merged.setdefault(key, [0, 0])
+                total[0] += count
+                total[1] += error
+        ranked = sorted(merged.items(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [(key, count, error) for key, (count, error) in ranked]
+
+
+class ThreatAnalytics:
+    def __init__(self, resolutions=TIMELINE_RESOLUTIONS):
+        self.resolutions = resolutions
+        self.timelines = {
+            name: {kind: RollingCount(width * slots, width) for kind in ('benign', 'malicious', 'other')}
+            for name, (width, slots) in resolutions.items()
+        }
+        self.top = {field: WindowedTopN() for field in ('src', 'dst', 'protocol')}
+        self.totals = {'benign': 0, 'malicious': 0, 'other': 0}
+        self._lock = threading.Lock()
+
+    def add(self, src, dst, protocol, prediction, now=None):
+        now = time.time() if now is None else now
+        kind = 'malicious' if prediction == 'Malicious' else 'benign' if prediction == 'Benign' else 'other'
+        with self._lock:
+            self.totals[kind] += 1
+            for timeline in self.timelines.values():
+                timeline[kind].add(now)
+            if kind == 'malicious':
+                self.top['src'].add(src, now)
+                self.top['dst'].add(dst, now)
+                self.top['protocol'].add(protocol, now)
+
+    def report(self, window=DEFAULT_WINDOW_SECONDS, top_n=TOP_N, now=None):
+        """Counts, per-bucket timeline and top malicious talkers over the last ``window`` seconds"""
+        now = time.time() if now is None else now
+        window = max(1, min(int(window), MAX_WINDOW_SECONDS))
+        name = '1s' if window <= SECOND_TIMELINE_MAX_WINDOW else '1m'
+        width = self.resolutions[name][0]
+        buckets = -(-window // width)
+        with self._lock:
+            series = {kind: counter.series(now) for kind, counter in self.timelines[name].items()}
+            top = {field: summary.top(top_n, window, now) for field, summary in self.top.items()}
+            totals = dict(self.totals)
+        start = series['benign']['start']
+        counts = {kind: s['counts'][-buckets:] for kind, s in series.items()}
+        first = start + (len(series['benign']['counts']) - len(counts['benign'])) * width
+        timeline = [
+            {'timestamp': datetime.fromtimestamp(first + i * width).isoformat(),
+             'benign': benign, 'malicious': malicious, 'other': other}
+            for i, (benign, malicious, other) in enumerate(zip(counts['benign'], counts['malicious'], counts['other']))
+        ]
+        benign, malicious, other = (sum(counts[kind]) for kind in ('benign', 'malicious', 'other'))
+        total = benign + malicious + other
+        return {
+            'window_seconds': window,
+            'resolution_seconds': width,
+            'total_analyzed': total,
+            'malicious_count': malicious,
+            'benign_count': benign,
+            'threat_rate': round(malicious / total * 100, 2) if total else 0,
+            'top_threat_sources': [{'src': key, 'count': count, 'max_error': error}
+                                   for key, count, error in top['src']],
+            'top_threat_destinations': [{'dst': key, 'count': count, 'max_error': error}
+                                        for key, count, error in top['dst']],
+            'top_threat_protocols': [{'protocol': key, 'count': count, 'max_error': error}
+                                     for key, count, error in top['protocol']],
+            'threat_timeline': timeline,
+            'totals_since_start': totals,
+        }
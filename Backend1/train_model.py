@@ -1,52 +1,42 @@
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+import logging
 import joblib
 import shap
 import os
 
+from chunked_training import train
+from model_registry import ModelRegistry
+
 DATA_PATH = '../auto_datasets/merged.csv'  # Changed from Test_data_labeled.csv to merged dataset
 MODEL_PATH = 'rf_model.joblib'
 EXPLAINER_PATH = 'shap_explainer.joblib'
 FEATURES_PATH = 'features.txt'
 
-# Load data (quick sample: first 10,000 rows)
-df = pd.read_csv(DATA_PATH, nrows=10000)
-
-# Assume the last column is the label
-y = df.iloc[:, -1]
-X = df.iloc[:, :-1]
-
-# Encode non-numeric columns
-def encode_features(X):
-    return pd.get_dummies(X)
+logging.basicConfig(level=logging.INFO)
 
-X_encoded = encode_features(X)
+# Train on the whole file, read in chunks and sampled down to
+# PDMS_TRAIN_MAX_ROWS rows per fit (see chunked_training.py)
+clf, feature_list, metrics = train(DATA_PATH)
 
 # Save feature names
 with open(FEATURES_PATH, 'w') as f:
-    f.write('\n'.join(X_encoded.columns))
-
-# Train/test split
-X_train, X_test, y_train, y_test = train_test_split(X_encoded, y, test_size=0.2, random_state=42)
-
-# Train model
-clf = RandomForestClassifier(n_estimators=20, random_state=42)
-clf.fit(X_train, y_train)
+    f.write('\n'.join(feature_list))
 
 # Evaluate
-y_pred = clf.predict(X_test)
-print('Accuracy:', accuracy_score(y_test, y_pred))
-print('Precision:', precision_score(y_test, y_pred, average='macro', zero_division=0))
-print('Recall:', recall_score(y_test, y_pred, average='macro', zero_division=0))
-print('F1:', f1_score(y_test, y_pred, average='macro', zero_division=0))
+print('Rows:', metrics['rows_total'], 'sampled:', metrics['rows_sampled'])
+print('Accuracy:', metrics['accuracy'])
+print('Precision:', metrics['precision'])
+print('Recall:', metrics['recall'])
+print('F1:', metrics['f1_score'])
 
 # Save model
 joblib.dump(clf, MODEL_PATH)
 
+# Serve it: the API loads models from the registry
+version = ModelRegistry().publish(clf, feature_list, metrics, source=os.path.abspath(DATA_PATH))
+print('Published model version', version)
+
 # SHAP explainer
 explainer = shap.TreeExplainer(clf)
 joblib.dump(explainer, EXPLAINER_PATH)
 
-print('Model and explainer saved.')
\ No newline at end of file
+print('Model and explainer saved.')
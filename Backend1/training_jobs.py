@@ -0,0 +1,204 @@
+"""
+Retraining jobs for PDMS
+Training runs in a separate process, one job at a time. Requests that arrive
+while a job is running are coalesced into a single queued job (the newest
+data file wins), so a burst of uploads trains once more, not once per upload.
+The trained model, feature list and metrics are handed to a publish callback
+(the API stores them in the model registry and swaps in the new ModelBundle).
+"""
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+# Files a training process leaves in its staging directory
+MODEL_FILE = 'model.joblib'
+FEATURES_FILE = 'features.txt'
+METRICS_FILE = 'metrics.json'
+STAGING_DIR = 'training_staging'
+MAX_TRAINING_JOBS = 50
+# Last lines of a failed training process's stderr kept in job.error
+STDERR_TAIL_LINES = 20
+
+
+def train_model_files(data_path, out_dir):
+    """Train on a CSV and write model, features and metrics to out_dir.
+
+    Runs in the training process; nothing here touches the serving globals.
+    The whole file is read in chunks (see chunked_training), not just its
+    first rows, from its typed Parquet copy when one can be made.
+    """
+    import chunked_training
+    import ingestion
+
+    logging.basicConfig(level=logging.INFO)
+    source = data_path
+    if data_path.lower().endswith('.csv'):
+        source = ingestion.columnar_copy(data_path) or data_path
+    clf, feature_list, metrics = chunked_training.train(source)
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(clf, os.path.join(out_dir, MODEL_FILE))
+    with open(os.path.join(out_dir, FEATURES_FILE), 'w') as f:
+        f.write('\n'.join(feature_list))
+    # Written last: its presence marks a complete staging directory
+    with open(os.path.join(out_dir, METRICS_FILE), 'w') as f:
+        json.dump({k: v if isinstance(v, int) else float(v) for k, v in metrics.items()}, f)
+
+
+def _drain(stream, tail):
+    """Pass a child's stderr through to ours, keeping its last lines in ``tail``"""
+    for line in stream:
+        sys.stderr.write(line)
+        tail.append(line)
+    stream.close()
+
+
+class TrainingJob:
+    def __init__(self, data_path):
+        self.id = uuid.uuid4().hex[:12]
+        self.data_path = data_path
+        self.status = 'queued'
+        self.coalesced = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.metrics = None
+        self.version = None
+        self.process = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'data_path': self.data_path,
+            'coalesced_requests': self.coalesced,
+            'submitted': datetime.fromtimestamp(self.submitted).isoformat(),
+            'started': datetime.fromtimestamp(self.started).isoformat() if self.started else None,
+            'finished': datetime.fromtimestamp(self.finished).isoformat() if self.finished else None,
+            'error': self.error,
+            'metrics': self.metrics,
+            'model_version': self.version,
+        }
+
+
+class TrainingScheduler:
+    def __init__(self, publish, staging_dir=STAGING_DIR):
+        # publish(model, feature_list, metrics, data_path) installs a finished
+        # model; called on the scheduler thread
+        self.publish = publish
+        self.staging_dir = staging_dir
+        self.jobs = OrderedDict()
+        self.running = None
+        self.queued = None
+        self._cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='training-scheduler', daemon=True)
+        self.thread.start()
+
+    def submit(self, data_path):
+        """Queue a retrain; joins the already-queued job if there is one"""
+        with self._cond:
+            if self.queued is not None:
+                self.queued.data_path = data_path
+                self.queued.coalesced += 1
+                return self.queued
+            job = TrainingJob(data_path)
+            self.queued = job
+            self.jobs[job.id] = job
+            while len(self.jobs) > MAX_TRAINING_JOBS:
+                oldest = next(iter(self.jobs.values()))
+                if oldest.status in ('queued', 'running'):
+                    break
+                self.jobs.popitem(last=False)
+            self._cond.notify()
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; False if it already finished"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ('queued', 'running'):
+                return False
+            if job is self.queued:
+                self.queued = None
+                job.status = 'cancelled'
+                job.finished = time.time()
+            else:
+                job.status = 'cancelling'
+                if job.process is not None:
+                    job.process.terminate()
+            return True
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.queued is None:
+                    self._cond.wait()
+                job, self.queued = self.queued, None
+                self.running = job
+                job.status = 'running'
+                job.started = time.time()
+            try:
+                self._train(job)
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                logger.error(f'Training job {job.id} failed: {e}')
+            finally:
+                job.finished = time.time()
+                job.process = None
+                self.running = None
+
+    def _train(self, job):
+        out_dir = os.path.join(self.staging_dir, job.id)
+        # A fresh interpreter running this module: it does not re-import the
+        # API server the way a multiprocessing child would on Windows
+        with self._cond:
+            if job.status == 'cancelling':
+                job.status = 'cancelled'
+                return
+            job.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), job.data_path, out_dir],
+                                           stderr=subprocess.PIPE, text=True, errors='replace')
+        tail = deque(maxlen=STDERR_TAIL_LINES)
+        reader = threading.Thread(target=_drain, args=(job.process.stderr, tail), daemon=True)
+        reader.start()
+        try:
+            returncode = job.process.wait()
+            reader.join()
+            if job.status == 'cancelling':
+                job.status = 'cancelled'
+                return
+            metrics_path = os.path.join(out_dir, METRICS_FILE)
+            if returncode != 0 or not os.path.exists(metrics_path):
+                raise RuntimeError(f'training process exited with code {returncode}: {"".join(tail).strip()}')
+            with open(metrics_path) as f:
+                job.metrics = json.load(f)
+            with open(os.path.join(out_dir, FEATURES_FILE)) as f:
+                feature_list = [line.strip() for line in f.readlines()]
+            model = joblib.load(os.path.join(out_dir, MODEL_FILE))
+            job.version = self.publish(model, feature_list, job.metrics, job.data_path)
+            job.status = 'done'
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    train_model_files(sys.argv[1], sys.argv[2])